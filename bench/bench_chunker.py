@@ -0,0 +1,134 @@
+# bench/bench_chunker.py
+"""
+Débit du découpage en chunks : ancien RecursiveCharacterTextSplitter
+(1200 caractères, recouvrement 200) contre chunker.py (tokens), sur les mêmes
+pages. Pour chacun : pages/s, Mo de texte/s, nombre de chunks et taille des
+chunks en tokens (moyenne, p5, p95, max, part hors de la fourchette 400–800).
+
+Corpus : pages synthétiques (bench_pipeline.synthetic_text) ou, avec
+--pdf-dir, les pages de vrais PDF (parsing non compté dans la mesure).
+
+Le chunker compte les tokens avec tiktoken ; hors ligne, avec l'encodage
+approximatif de tokenizer.py (regex Python : débits différents), indiqué dans
+le rapport ("encoding"). Les pages qui tiennent dans un chunk ne sont pas
+découpées en phrases : --page-words règle la longueur des pages synthétiques.
+
+Usage : python bench/bench_chunker.py --pages 2000 [--page-words 250 400] [--pdf-dir data/pdf] [--out chunker.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+from bench_pipeline import synthetic_text
+
+from langchain_core.documents import Document
+
+import chunker
+import ingest
+from tokenizer import get_encoding
+
+
+def load_pages(args):
+    if args.pdf_dir:
+        pages = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for path in sorted(args.pdf_dir.glob("*.pdf")):
+                pages.extend(ingest.load_pdf(path))
+        return pages
+    rng = random.Random(args.seed)
+    # 3 paragraphes par page (150 à 700 mots par défaut), séparés par une ligne vide
+    low, high = args.page_words
+    return [
+        Document(
+            page_content="\n\n".join(synthetic_text(rng, rng.randint(low, high)) for _ in range(3)),
+            metadata={"file_name": f"doc{i // 10:04d}.pdf", "page": i % 10},
+        )
+        for i in range(args.pages)
+    ]
+
+
+def character_splitter(pages):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1200,
+        chunk_overlap=200,
+        separators=["\n\n", "\n", ". ", " ", ""],
+    )
+    return splitter.split_documents(pages)
+
+
+def token_chunker(pages):
+    return chunker.split_documents(pages)
+
+
+def measure(split, pages, repeat: int) -> dict:
+    """Meilleur temps sur `repeat` passages ; les pages ne sont pas modifiées par le découpage."""
+    best, chunks = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = split(pages)
+        best = min(best, time.perf_counter() - start)
+
+    mb = sum(len(p.page_content.encode("utf-8")) for p in pages) / 1e6
+    sizes = np.array([len(t) for t in get_encoding().encode_ordinary_batch([c.page_content for c in chunks])])
+    return {
+        "seconds": best,
+        "pages_per_s": len(pages) / best,
+        "mb_per_s": mb / best,
+        "chunks": len(chunks),
+        "tokens_mean": float(sizes.mean()),
+        "tokens_p5": float(np.percentile(sizes, 5)),
+        "tokens_p95": float(np.percentile(sizes, 95)),
+        "tokens_max": int(sizes.max()),
+        "share_over_800": float((sizes > 800).mean()),
+        "share_under_400": float((sizes < 400).mean()),
+    }
+
+
+def print_summary(results: dict):
+    for name, r in results.items():
+        print(f"[CHUNK] {name:<10} {r['pages_per_s']:9.0f} pages/s  {r['mb_per_s']:6.2f} Mo/s  "
+              f"{r['chunks']:6d} chunks  tokens moy {r['tokens_mean']:5.0f} "
+              f"(p5 {r['tokens_p5']:.0f}, p95 {r['tokens_p95']:.0f}, max {r['tokens_max']})")
+
+
+def run(args) -> dict:
+    pages = load_pages(args)
+    get_encoding()  # chargement de l'encodage hors mesure
+    results = {
+        "character": measure(character_splitter, pages, args.repeat),
+        "tokens": measure(token_chunker, pages, args.repeat),
+    }
+    return {
+        "config": vars(args) | {"pdf_dir": str(args.pdf_dir) if args.pdf_dir else None,
+                                "out": str(args.out) if args.out else None},
+        "encoding": get_encoding().name,
+        "pages": len(pages),
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Débit du découpage en chunks (caractères vs tokens)")
+    parser.add_argument("--pages", type=int, default=2000, help="pages synthétiques")
+    parser.add_argument("--page-words", type=int, nargs=2, default=[50, 230], metavar=("MIN", "MAX"),
+                        help="mots par paragraphe des pages synthétiques (3 paragraphes par page)")
+    parser.add_argument("--pdf-dir", type=Path, help="découper les pages de ces PDF à la place")
+    parser.add_argument("--repeat", type=int, default=3, help="passages par découpeur (meilleur temps retenu)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="fichier JSON de résultats")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print_summary(report["results"])
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
@@ -0,0 +1,293 @@
+# bench/bench_pipeline.py
+"""
+Benchmark hors ligne du pipeline complet, sans réseau :
+corpus PDF synthétique → ingestion (ingest.py) → indexation (build_index.py)
+→ chargement de l'index → requêtes (rag_pipeline).
+
+Embeddings et LLM sont remplacés par les backends factices déterministes de
+fake_backends.py (latences simulées réglables). Pour chaque étape : durée,
+débit, latences p50/p95/p99 pour les requêtes, et pic de mémoire résidente
+de l'étape. Le rapport JSON permet de comparer deux versions du code.
+
+Usage : python bench/bench_pipeline.py --pdfs 40 --pages 8 --queries 200 [--out pipeline.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SRC_DIR = BENCH_DIR.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+import fitz
+import numpy as np
+
+from fake_backends import FakeAsyncOpenAI, FakeOpenAI, HashEmbeddings
+
+AUTHORS = ["Boris Otto", "Vijay Khatri", "Carol Brown", "Kristin Weber", "Thomas Redman", "Martin Fowler"]
+TOPICS = [
+    "gouvernance", "données", "qualité", "métadonnées", "architecture", "entreprise", "référentiel",
+    "processus", "responsabilité", "conformité", "stratégie", "maturité", "modèle", "organisation",
+    "valeur", "risque", "lignage", "catalogue", "propriétaire", "intendance", "plateforme", "analyse",
+    "décision", "indicateur", "mesure", "audit", "sécurité", "confidentialité", "intégration", "cycle",
+]
+FILLER = [
+    "le", "la", "les", "des", "une", "dans", "pour", "avec", "sur", "est", "sont", "selon", "cette",
+    "approche", "étude", "résultat", "cadre", "travaux", "montre", "propose", "article", "auteurs",
+]
+
+
+# ====== Corpus synthétique ======
+
+def synthetic_text(rng: random.Random, n_words: int) -> str:
+    words = []
+    for i in range(n_words):
+        words.append(rng.choice(TOPICS) if rng.random() < 0.35 else rng.choice(FILLER))
+        if i % 14 == 13:
+            words[-1] += "."
+    return " ".join(words)
+
+
+def make_corpus(pdf_dir: Path, n_pdfs: int, pages: int, words_per_page: int = 320, seed: int = 0):
+    """Écrit `n_pdfs` PDF de `pages` pages ; auteur dans les métadonnées, année dans le nom."""
+    rng = random.Random(seed)
+    pdf_dir.mkdir(parents=True, exist_ok=True)
+    total_bytes = 0
+    for i in range(n_pdfs):
+        author = AUTHORS[i % len(AUTHORS)]
+        year = 2005 + i % 18
+        path = pdf_dir / f"{author.split()[-1]}_{year}_{i:04d}.pdf"
+        doc = fitz.open()
+        for _ in range(pages):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 545, 790), synthetic_text(rng, words_per_page), fontsize=9)
+        doc.set_metadata({"author": author, "title": f"Article synthétique {i}"})
+        doc.save(str(path))
+        total_bytes += path.stat().st_size
+    return {"pdfs": n_pdfs, "pages": n_pdfs * pages, "mb": total_bytes / 1e6}
+
+
+def make_questions(n: int, seed: int):
+    rng = random.Random(seed)
+    # Un numéro par question : pas de hit des caches de questions / réponses entre étapes
+    return [f"Que disent les auteurs sur {' '.join(rng.sample(TOPICS, 3))} ? (q{seed}-{i})" for i in range(n)]
+
+
+# ====== Mesures ======
+
+def reset_peak_rss():
+    # Linux : remet à zéro VmHWM (pic de mémoire résidente) du processus
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def latency_stats(latencies) -> dict:
+    ms = np.asarray(latencies) * 1000
+    return {
+        "n": len(ms),
+        "qps": len(ms) / (ms.sum() / 1000) if ms.sum() else 0.0,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+class Stage:
+    """Mesure d'une étape : durée totale et pic de mémoire résidente pendant l'étape."""
+
+    def __init__(self, report: dict, name: str, quiet: bool = True):
+        self.report = report
+        self.name = name
+        self.quiet = quiet
+        self.result = {}
+
+    def __enter__(self):
+        reset_peak_rss()
+        self._out = contextlib.redirect_stdout(io.StringIO()) if self.quiet else contextlib.nullcontext()
+        self._out.__enter__()
+        self._start = time.perf_counter()
+        return self.result
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._start
+        self._out.__exit__(*exc)
+        self.result.update(seconds=seconds, peak_rss_mb=peak_rss_mb())
+        self.report[self.name] = self.result
+        return False
+
+
+def print_summary(stages: dict):
+    for name, r in stages.items():
+        line = f"[BENCH] {name:<16} {r['seconds']:8.2f} s  pic RSS {r['peak_rss_mb']:7.1f} Mo"
+        if "p50_ms" in r:
+            line += f"  p50 {r['p50_ms']:7.2f} ms  p95 {r['p95_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms"
+        for key in ("chunks_per_s", "questions_per_s"):
+            if key in r:
+                line += f"  {key} {r[key]:.1f}"
+        if "first_token" in r:
+            line += f"  1er token p50 {r['first_token']['p50_ms']:.2f} ms"
+        print(line)
+
+
+def timed(fn, items):
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+# ====== Étapes ======
+
+def run(args) -> dict:
+    import build_index
+    import ingest
+    import rag_pipeline
+    from answer_cache import AnswerCache
+    from embedding_cache import CachedEmbeddings, QueryEmbeddingCache
+
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        ingest.PDF_DIR = tmp / "pdf"
+        ingest.OUT_PATH = build_index.CHUNKS_PATH = tmp / "processed/chunks.json"
+        ingest.MANIFEST_PATH = tmp / "processed/ingest_manifest.json"
+        build_index.INDEX_DIR = tmp / "processed/index"
+        build_index.CHECKPOINT_DIR = tmp / "processed/embed_checkpoints"
+        ingest.OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+
+        doc_embeddings = HashEmbeddings(args.dim, latency=args.embed_latency_ms / 1000)
+        build_index.make_embeddings = lambda: CachedEmbeddings(doc_embeddings, tmp / "cache/embeddings.sqlite")
+
+        with Stage(stages, "corpus") as r:
+            r.update(make_corpus(ingest.PDF_DIR, args.pdfs, args.pages, seed=args.seed))
+
+        with Stage(stages, "ingest", args.quiet) as r:
+            ingest.main(workers=args.workers)
+        n_chunks = sum(1 for _ in ingest.iter_saved_chunks(ingest.OUT_PATH))
+        r.update(chunks=n_chunks, pdfs_per_s=args.pdfs / r["seconds"], chunks_per_s=n_chunks / r["seconds"])
+
+        with Stage(stages, "index", args.quiet) as r:
+            build_index.build_index(
+                full=True, batch_size=args.batch_size, parallelism=args.parallelism, index_type=args.index_type
+            )
+        r.update(chunks_per_s=n_chunks / r["seconds"], embed_calls=float(doc_embeddings.calls))
+
+        # Requêtes : backends factices branchés dans rag_pipeline (initialisation paresseuse)
+        rag_pipeline.config.index_dir = build_index.INDEX_DIR
+        rag_pipeline.embeddings = QueryEmbeddingCache(HashEmbeddings(args.dim, latency=args.embed_latency_ms / 1000))
+        rag_pipeline.client = FakeOpenAI(args.llm_first_token_ms / 1000, args.llm_token_ms / 1000)
+        rag_pipeline.async_client = FakeAsyncOpenAI(args.llm_first_token_ms / 1000, args.llm_token_ms / 1000)
+        rag_pipeline.answer_cache = AnswerCache(cache_path=tmp / "cache/answers.sqlite")
+
+        with Stage(stages, "load_index", args.quiet):
+            vectorstore = rag_pipeline.get_vectorstore()
+            vectorstore.similarity_search("première requête", k=1)
+
+        search_cases = [
+            ("search_dense", {"mode": "dense"}),
+            ("search_hybrid", {"mode": "hybrid"}),
+            ("search_filtered", {"mode": "dense", "filters": {"author": "otto", "year": (2008, 2016)}}),
+            ("search_mmr", {"mode": "mmr"}),
+        ]
+        for seed, (name, kwargs) in enumerate(search_cases, start=1):
+            questions = make_questions(args.queries, seed=args.seed * 100 + seed)
+            with Stage(stages, name, args.quiet) as r:
+                latencies = timed(lambda q: rag_pipeline.search_docs(vectorstore, q, k=args.k, **kwargs), questions)
+            r.update(latency_stats(latencies))
+
+        questions = make_questions(args.answer_queries, seed=args.seed * 100 + 10)
+        with Stage(stages, "answer", args.quiet) as r:
+            latencies = timed(lambda q: rag_pipeline.answer_question(q, k=args.k), questions)
+        r.update(latency_stats(latencies))
+
+        def first_token(q):
+            docs = rag_pipeline.retrieve_relevant_docs(q, k=args.k)
+            stream = rag_pipeline.stream_answer(q, docs)
+            start = time.perf_counter()
+            next(stream)
+            ttft.append(time.perf_counter() - start)
+            for _ in stream:
+                pass
+
+        ttft = []
+        questions = make_questions(args.answer_queries, seed=args.seed * 100 + 11)
+        with Stage(stages, "stream_answer", args.quiet) as r:
+            latencies = timed(first_token, questions)
+        r.update(latency_stats(latencies))
+        r["first_token"] = latency_stats(ttft)
+
+        questions = make_questions(args.answer_queries, seed=args.seed * 100 + 12)
+        with Stage(stages, "answer_batch", args.quiet) as r:
+            asyncio.run(rag_pipeline.answer_questions(questions, k=args.k, concurrency=args.concurrency))
+        r.update(questions_per_s=len(questions) / r["seconds"])
+
+    return {
+        "config": vars(args) | {"out": str(args.out) if args.out else None},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": stages,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne du pipeline RAG (backends factices)")
+    parser.add_argument("--pdfs", type=int, default=40, help="nombre de PDF synthétiques")
+    parser.add_argument("--pages", type=int, default=8, help="pages par PDF")
+    parser.add_argument("--queries", type=int, default=200, help="requêtes par étape de recherche")
+    parser.add_argument("--answer-queries", type=int, default=30, help="questions pour les étapes de réponse")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=256, help="dimension des embeddings factices")
+    parser.add_argument("--index-type", default="flat")
+    parser.add_argument("--workers", type=int, default=1, help="processus d'ingestion")
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--parallelism", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8, help="appels LLM simultanés (answer_questions)")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="latence simulée par appel d'embeddings")
+    parser.add_argument("--llm-first-token-ms", type=float, default=20.0)
+    parser.add_argument("--llm-token-ms", type=float, default=1.0, help="latence simulée par morceau de réponse")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", dest="quiet", action="store_false", help="affiche les logs du pipeline")
+    parser.add_argument("--out", type=Path, help="fichier JSON de résultats")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print_summary(report["stages"])
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    else:
+        print(json.dumps(report["stages"], indent=2))
@@ -0,0 +1,204 @@
+# bench/bench_server.py
+"""
+Test de charge du service HTTP (src/server.py), sans réseau :
+index synthétique + backends factices (fake_backends.py), serveur uvicorn
+lancé dans le processus, clients httpx concurrents.
+
+Pour chaque scénario (/search, /answer, /answer en streaming) : requêtes par
+seconde, latences p50/p95/p99 et, en streaming, délai jusqu'au premier
+morceau de réponse. Avec --url, le test vise un serveur déjà lancé (dans un
+autre processus : le client ne prend alors pas de CPU au serveur).
+
+Usage : python bench/bench_server.py --requests 300 --concurrency 16 [--out server.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from bench_pipeline import AUTHORS, latency_stats, make_questions, synthetic_text
+from fake_backends import FakeAsyncOpenAI, FakeOpenAI, HashEmbeddings
+
+import httpx
+
+
+# ====== Serveur local ======
+
+def build_synthetic_index(index_dir: Path, n_chunks: int, dim: int, seed: int = 0):
+    """Index publié comme par build_index.py (FAISS + BM25 + métadonnées + docstore mmap)."""
+    import random
+
+    from langchain_community.vectorstores import FAISS
+
+    import build_index
+    from index_manager import publish_index
+
+    rng = random.Random(seed)
+    texts = [synthetic_text(rng, 180) for _ in range(n_chunks)]
+    metadatas = [
+        {"file_name": f"doc{i // 20:04d}.pdf", "page": i % 20, "author": AUTHORS[(i // 20) % len(AUTHORS)],
+         "year": 2005 + (i // 20) % 18, "chunk_id": f"c{i}"}
+        for i in range(n_chunks)
+    ]
+    vectorstore = FAISS.from_texts(texts, HashEmbeddings(dim), metadatas=metadatas, ids=[m["chunk_id"] for m in metadatas])
+    with contextlib.redirect_stdout(io.StringIO()):
+        publish_index(vectorstore, index_dir, sidecars=build_index.index_sidecars(vectorstore), nb_chunks=n_chunks)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(tmp: Path, args) -> str:
+    import uvicorn
+
+    import rag_pipeline
+    from answer_cache import AnswerCache
+    from embedding_cache import QueryEmbeddingCache
+    from server import create_app
+
+    build_synthetic_index(tmp / "index", args.chunks, args.dim, seed=args.seed)
+    rag_pipeline.config.index_dir = tmp / "index"
+    rag_pipeline.config.retrieval_mode = args.mode
+    rag_pipeline.embeddings = QueryEmbeddingCache(HashEmbeddings(args.dim, latency=args.embed_latency_ms / 1000))
+    rag_pipeline.client = FakeOpenAI(args.llm_first_token_ms / 1000, args.llm_token_ms / 1000)
+    rag_pipeline.async_client = FakeAsyncOpenAI(args.llm_first_token_ms / 1000, args.llm_token_ms / 1000)
+    rag_pipeline.answer_cache = AnswerCache(cache_path=tmp / "answers.sqlite")
+
+    port = free_port()
+    config = uvicorn.Config(
+        create_app(args.llm_concurrency), host="127.0.0.1", port=port, log_level="error", lifespan="on"
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("le serveur n'a pas démarré")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+# ====== Charge ======
+
+async def call(client: httpx.AsyncClient, path: str, payload: dict):
+    """Renvoie (latence totale, délai du premier morceau ou None, ok)."""
+    start = time.perf_counter()
+    if not payload.get("stream"):
+        response = await client.post(path, json=payload)
+        return time.perf_counter() - start, None, response.status_code == 200
+
+    first = None
+    ok = False
+    async with client.stream("POST", path, json=payload) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            message = json.loads(line)
+            if "delta" in message and first is None:
+                first = time.perf_counter() - start
+            if message.get("done"):
+                ok = response.status_code == 200
+    return time.perf_counter() - start, first, ok
+
+
+async def run_scenario(url: str, path: str, payloads, concurrency: int) -> dict:
+    latencies, first_chunks, errors = [], [], 0
+    queue = list(reversed(payloads))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            while queue:
+                payload = queue.pop()
+                try:
+                    latency, first, ok = await call(client, path, payload)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if not ok:
+                    errors += 1
+                    continue
+                latencies.append(latency)
+                if first is not None:
+                    first_chunks.append(first)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        seconds = time.perf_counter() - start
+
+    result = {"requests": len(payloads), "errors": errors, "seconds": seconds, "rps": len(latencies) / seconds}
+    if latencies:
+        result.update({k: v for k, v in latency_stats(latencies).items() if k != "qps"})
+    if first_chunks:
+        result["first_chunk"] = latency_stats(first_chunks)
+    return result
+
+
+def print_summary(scenarios: dict):
+    for name, r in scenarios.items():
+        line = f"[LOAD] {name:<14} {r['rps']:8.1f} req/s  erreurs {r['errors']}"
+        if "p50_ms" in r:
+            line += f"  p50 {r['p50_ms']:7.2f} ms  p95 {r['p95_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms"
+        if "first_chunk" in r:
+            line += f"  1er morceau p50 {r['first_chunk']['p50_ms']:.2f} ms"
+        print(line)
+
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url or start_local_server(Path(tmp), args)
+        httpx.get(f"{url}/health", timeout=30).raise_for_status()
+
+        scenarios = {}
+        cases = [
+            ("search", "/search", {}),
+            ("answer", "/answer", {}),
+            ("answer_stream", "/answer", {"stream": True}),
+        ]
+        for seed, (name, path, extra) in enumerate(cases, start=1):
+            # Questions toutes différentes : pas de hit du cache de réponses
+            questions = make_questions(args.requests, seed=args.seed * 100 + seed)
+            payloads = [{"question": q, "k": args.k, **extra} for q in questions]
+            scenarios[name] = asyncio.run(run_scenario(url, path, payloads, args.concurrency))
+
+        health = httpx.get(f"{url}/health", timeout=30).json()
+
+    return {"config": vars(args) | {"out": str(args.out) if args.out else None}, "health": health, "scenarios": scenarios}
+
+
+def parse_args(argv=None):
+    from rag_pipeline import RETRIEVAL_MODES
+
+    parser = argparse.ArgumentParser(description="Test de charge du service HTTP (backends factices)")
+    parser.add_argument("--url", help="serveur déjà lancé (sinon : serveur local avec backends factices)")
+    parser.add_argument("--requests", type=int, default=300, help="requêtes par scénario")
+    parser.add_argument("--concurrency", type=int, default=16, help="clients simultanés")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--chunks", type=int, default=5000, help="taille de l'index synthétique")
+    parser.add_argument("--dim", type=int, default=256, help="dimension des embeddings factices")
+    parser.add_argument("--mode", choices=RETRIEVAL_MODES, default="dense")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="appels LLM simultanés côté serveur")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-first-token-ms", type=float, default=200.0)
+    parser.add_argument("--llm-token-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, help="fichier JSON de résultats")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print_summary(report["scenarios"])
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
@@ -0,0 +1,137 @@
+# bench/bench_startup.py
+"""
+Benchmark du temps de démarrage : FAISS.load_local (lecture complète + pickle)
+contre le chargement mmap (mmap_store), pour des index de tailles croissantes.
+
+Chaque chargement est mesuré dans un processus neuf (comme un worker Streamlit
+ou un appel CLI) : temps de chargement, temps de la première requête et
+mémoire résidente du processus.
+
+Usage : python bench/bench_startup.py --sizes 10000 50000 200000 --dim 768 [--out startup.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class RandomEmbeddings(Embeddings):
+    """Embeddings factices : seule la forme des vecteurs compte ici."""
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def embed_query(self, text):
+        return np.random.default_rng(len(text)).normal(size=self.dim).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+def build_synthetic_index(index_dir: Path, n: int, dim: int):
+    from langchain_community.vectorstores import FAISS
+
+    from build_index import index_sidecars
+    from index_manager import publish_index, resolve_index_dir
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    texts = [f"Passage synthétique {i}. " + "lorem ipsum " * 80 for i in range(n)]
+    metadatas = [{"file_name": f"doc{i // 50}.pdf", "page": i % 50, "chunk_id": f"{i:016x}-00000"} for i in range(n)]
+    ids = [m["chunk_id"] for m in metadatas]
+    vectorstore = FAISS.from_embeddings(
+        zip(texts, vectors.tolist()), RandomEmbeddings(dim), metadatas=metadatas, ids=ids
+    )
+    manifest = publish_index(vectorstore, index_dir, sidecars=index_sidecars(vectorstore), nb_chunks=n)
+    return resolve_index_dir(index_dir, manifest)
+
+
+def current_rss_mb() -> float:
+    # ru_maxrss est hérité du parent à travers fork+exec sous Linux : on lit VmRSS
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode: str, index_dir: str, dim: int):
+    """Exécuté dans un processus neuf : charge l'index et mesure."""
+    import_start = time.perf_counter()
+    from langchain_community.vectorstores import FAISS
+
+    from mmap_store import load_mmap_vectorstore
+    import_s = time.perf_counter() - import_start
+
+    embeddings = RandomEmbeddings(dim)
+    start = time.perf_counter()
+    if mode == "mmap":
+        vectorstore = load_mmap_vectorstore(Path(index_dir), embeddings)
+    else:
+        vectorstore = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorstore.similarity_search("question de test", k=4)
+    first_query_s = time.perf_counter() - start
+
+    print(json.dumps({
+        "import_s": import_s,
+        "load_s": load_s,
+        "first_query_s": first_query_s,
+        "rss_mb": current_rss_mb(),
+    }))
+
+
+def run(sizes, dim: int, repeats: int):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            index_dir = Path(tmp) / f"index-{n}"
+            index_dir = build_synthetic_index(index_dir, n, dim)
+            size_mb = sum(p.stat().st_size for p in index_dir.iterdir()) / 1e6
+            for mode in ("load_local", "mmap"):
+                runs = []
+                for _ in range(repeats):
+                    out = subprocess.run(
+                        [sys.executable, __file__, "--child", mode, str(index_dir), "--dim", str(dim)],
+                        capture_output=True, text=True, check=True,
+                    )
+                    runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+                best = min(runs, key=lambda r: r["load_s"])
+                results.append({"n_vectors": n, "dim": dim, "mode": mode, "index_mb": size_mb, **best})
+                print(f"[BENCH] n={n:>8} {mode:<10} chargement {best['load_s'] * 1000:8.1f} ms  "
+                      f"1re requête {best['first_query_s'] * 1000:7.1f} ms  RSS {best['rss_mb']:7.1f} Mo")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Temps de démarrage : load_local vs mmap")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 200_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--out", type=Path, help="fichier JSON de résultats")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "INDEX_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], args.child[1], args.dim)
+    else:
+        results = run(args.sizes, args.dim, args.repeats)
+        if args.out:
+            args.out.write_text(json.dumps(results, indent=2), encoding="utf-8")
@@ -0,0 +1,127 @@
+# bench/fake_backends.py
+"""
+Backends factices, déterministes et locaux, pour les benchmarks hors ligne.
+
+- HashEmbeddings : embeddings par hachage des mots (sac de mots projeté sur
+  `dim` dimensions, normalisé). Deux textes qui partagent des mots sont
+  proches : la recherche reste réaliste, sans réseau ni modèle.
+- FakeOpenAI / FakeAsyncOpenAI : même interface que les clients OpenAI
+  utilisés par rag_pipeline (chat.completions.create, avec ou sans stream),
+  réponse dérivée de la question, latence simulée réglable.
+"""
+import asyncio
+import hashlib
+import re
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class HashEmbeddings(Embeddings):
+    """Embeddings déterministes par hachage des mots ; `latency` simule l'appel réseau (par lot)."""
+
+    model = "hash-embeddings"
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD_RE.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def fake_answer(messages) -> str:
+    """Réponse déterministe : reprend la question et le nombre de sources du prompt."""
+    user = messages[-1]["content"]
+    question = user.split("\n")[1] if "\n" in user else user
+    n_sources = user.count("[Source ")
+    digest = hashlib.sha1(user.encode("utf-8")).hexdigest()[:8]
+    return (
+        f"Réponse synthétique ({digest}) à « {question} », fondée sur {n_sources} source(s). "
+        + "Les auteurs montrent que la gouvernance des données repose sur des rôles clairs. " * 6
+        + "\n\nRéférences utilisées : (Auteur, 2020)."
+    )
+
+
+def _pieces(text: str, size: int = 4):
+    # Morceaux de quelques mots, comme les deltas d'un stream
+    words = text.split(" ")
+    return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+
+
+def _completion(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def _stream_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class _Completions:
+    def __init__(self, first_token_latency: float, token_latency: float):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.calls = 0
+
+    def create(self, messages, stream: bool = False, **kwargs):
+        self.calls += 1
+        pieces = _pieces(fake_answer(messages))
+        time.sleep(self.first_token_latency)
+        if not stream:
+            time.sleep(self.token_latency * len(pieces))
+            return _completion("".join(pieces))
+        return self._stream(pieces)
+
+    def _stream(self, pieces):
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.token_latency)
+            yield _stream_chunk(piece)
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, messages, stream: bool = False, **kwargs):
+        self.calls += 1
+        pieces = _pieces(fake_answer(messages))
+        await asyncio.sleep(self.first_token_latency)
+        if not stream:
+            await asyncio.sleep(self.token_latency * len(pieces))
+            return _completion("".join(pieces))
+        return self._astream(pieces)
+
+    async def _astream(self, pieces):
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            yield _stream_chunk(piece)
+
+
+class FakeOpenAI:
+    """Client LLM factice : `first_token_latency` puis `token_latency` par morceau."""
+
+    def __init__(self, first_token_latency: float = 0.0, token_latency: float = 0.0):
+        self.chat = SimpleNamespace(completions=_Completions(first_token_latency, token_latency))
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, first_token_latency: float = 0.0, token_latency: float = 0.0):
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(first_token_latency, token_latency))
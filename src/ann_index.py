@@ -0,0 +1,144 @@
+# src/ann_index.py
+"""
+Types d'index FAISS approximatifs (IVF, HNSW, PQ/SQ) et rapport de compromis.
+
+- build_faiss_index : construit un index FAISS du type choisi à partir des vecteurs ;
+- set_search_params : réglages à la requête (nprobe pour IVF, efSearch pour HNSW) ;
+- compare_index_types : recall@k par rapport à l'index exact (flat),
+  latences p50/p99 et empreinte mémoire, pour choisir un compromis.
+"""
+import time
+
+import faiss
+import numpy as np
+
+# Chaînes index_factory de FAISS
+INDEX_TYPES = {
+    "flat": "Flat",
+    "ivf": "IVF{nlist},Flat",
+    "ivfpq": "IVF{nlist},PQ{pq_m}x{pq_nbits}",
+    "ivfsq": "IVF{nlist},SQ8",
+    "hnsw": "HNSW{hnsw_m},Flat",
+    "sq": "SQ8",
+}
+
+DEFAULT_PARAMS = {
+    "nlist": 1024,          # nombre de cellules IVF
+    "pq_m": 64,             # nombre de sous-quantifieurs PQ (doit diviser la dimension)
+    "pq_nbits": 8,          # bits par code PQ
+    "hnsw_m": 32,           # voisins par nœud HNSW
+    "ef_construction": 200,  # largeur de recherche HNSW à la construction
+}
+
+# FAISS recommande au moins ~39 points d'entraînement par cellule IVF
+_MIN_POINTS_PER_LIST = 39
+
+
+def resolve_params(index_type: str, n_vectors: int, dim: int, **params) -> dict:
+    """Paramètres complets, ajustés à la taille du corpus."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu : {index_type} (choix : {', '.join(INDEX_TYPES)})")
+    resolved = {**DEFAULT_PARAMS, **{k: v for k, v in params.items() if v is not None}}
+    resolved["nlist"] = max(1, min(resolved["nlist"], n_vectors // _MIN_POINTS_PER_LIST))
+    if index_type == "ivfpq" and dim % resolved["pq_m"]:
+        raise ValueError(f"pq_m={resolved['pq_m']} doit diviser la dimension {dim}")
+    return resolved
+
+
+def build_faiss_index(vectors: np.ndarray, index_type: str = "flat", **params):
+    """Construit (entraîne + remplit) un index FAISS L2 du type demandé."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    resolved = resolve_params(index_type, n, dim, **params)
+
+    index = faiss.index_factory(dim, INDEX_TYPES[index_type].format(**resolved))
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efConstruction = resolved["ef_construction"]
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def set_search_params(index, nprobe: int = None, ef_search: int = None):
+    """Applique les réglages de requête pertinents pour ce type d'index."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = nprobe
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None and ef_search:
+        hnsw.efSearch = ef_search
+
+
+def index_memory_bytes(index) -> int:
+    """Empreinte de l'index (taille sérialisée, proche de la mémoire occupée)."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def measure(index, queries: np.ndarray, k: int, ground_truth: np.ndarray = None) -> dict:
+    """Recall@k (si vérité terrain fournie), latences par requête et mémoire."""
+    latencies = []
+    found = []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    found = np.asarray(found)
+
+    report = {
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p99_ms": float(np.percentile(latencies, 99)),
+        "memory_bytes": index_memory_bytes(index),
+    }
+    if ground_truth is not None:
+        hits = [len(set(f[f >= 0]) & set(g)) for f, g in zip(found, ground_truth)]
+        report[f"recall@{k}"] = float(np.sum(hits) / ground_truth.size)
+    return report
+
+
+def compare_index_types(
+    vectors: np.ndarray,
+    index_types=("flat", "ivf", "hnsw", "ivfpq", "ivfsq"),
+    k: int = 10,
+    n_queries: int = 200,
+    nprobe: int = 16,
+    ef_search: int = 64,
+    seed: int = 0,
+    **params,
+):
+    """
+    Construit chaque type d'index sur `vectors` et le compare à l'index exact.
+    Les requêtes sont des vecteurs du corpus légèrement bruités.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    noise = rng.normal(scale=vectors.std() * 0.1, size=(len(sample), vectors.shape[1]))
+    queries = (vectors[sample] + noise).astype(np.float32)
+
+    flat = build_faiss_index(vectors, "flat")
+    _, ground_truth = flat.search(queries, k)
+
+    reports = {}
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = flat if index_type == "flat" else build_faiss_index(vectors, index_type, **params)
+        build_s = time.perf_counter() - start
+        set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+        reports[index_type] = {
+            "build_s": build_s,
+            **measure(index, queries, k, ground_truth),
+        }
+    return reports
+
+
+def format_report(reports: dict, k: int) -> str:
+    lines = [f"{'type':<8} {'recall@' + str(k):>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'mémoire (Mo)':>13} {'build (s)':>10}"]
+    for index_type, r in reports.items():
+        lines.append(
+            f"{index_type:<8} {r[f'recall@{k}']:>10.3f} {r['latency_p50_ms']:>10.3f} "
+            f"{r['latency_p99_ms']:>10.3f} {r['memory_bytes'] / 1e6:>13.1f} {r['build_s']:>10.2f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,138 @@
+# src/answer_cache.py
+"""
+Cache sémantique des réponses du LLM.
+
+Une réponse est réutilisée si :
+- le modèle est le même,
+- les chunks récupérés sont les mêmes, dans le même ordre (mêmes sources affichées),
+- la version de l'index publié est la même (clé de la recherche : plusieurs
+  processus peuvent partager le cache en servant des versions différentes),
+- la question est assez proche d'une question déjà posée
+  (similarité cosinus des embeddings ≥ seuil).
+
+Stockage SQLite comme le cache d'embeddings, borné avec éviction LRU ; les
+entrées plus utilisées depuis max_age secondes (celles d'anciennes versions de
+l'index, notamment) sont supprimées. Sans version d'index publiée (None), rien
+n'est lu ni mis en cache.
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = BASE_DIR / "data/cache/answers.sqlite"
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        cache_path: Path = DEFAULT_CACHE_PATH,
+        threshold: float = 0.95,
+        max_entries: int = 5000,
+        max_age: float = 7 * 24 * 3600,
+    ):
+        self.cache_path = Path(cache_path)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " model TEXT NOT NULL,"
+            " chunk_ids TEXT NOT NULL,"
+            " index_version TEXT NOT NULL,"
+            " question TEXT NOT NULL,"
+            " embedding BLOB NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_answers_key ON answers(model, chunk_ids, index_version)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_access ON answers(last_access)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.cache_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def lookup(self, question_embedding, chunk_ids, model: str, index_version: str):
+        """Renvoie la réponse en cache la plus proche au-dessus du seuil, sinon None."""
+        if index_version is None:
+            return None
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT id, embedding, answer FROM answers"
+            " WHERE model = ? AND chunk_ids = ? AND index_version = ?",
+            (model, json.dumps(list(chunk_ids)), index_version),
+        ).fetchall()
+
+        if rows:
+            matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob, _ in rows])
+            similarities = matrix @ self._normalize(question_embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                conn.execute(
+                    "UPDATE answers SET last_access = ? WHERE id = ?", (time.time(), rows[best][0])
+                )
+                conn.commit()
+                with self._lock:
+                    self.hits += 1
+                return rows[best][2]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, question: str, question_embedding, chunk_ids, model: str, index_version: str, answer: str):
+        if index_version is None:
+            return
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO answers (model, chunk_ids, index_version, question, embedding, answer, last_access)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                model,
+                json.dumps(list(chunk_ids)),
+                index_version,
+                question,
+                self._normalize(question_embedding).tobytes(),
+                answer,
+                time.time(),
+            ),
+        )
+        # Réponses d'un index remplacé : plus jamais lues, elles vieillissent et partent
+        conn.execute("DELETE FROM answers WHERE last_access < ?", (time.time() - self.max_age,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM answers WHERE id IN ("
+                " SELECT id FROM answers ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        conn.commit()
+
+    def stats(self) -> dict:
+        (entries,) = self._conn().execute("SELECT COUNT(*) FROM answers").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
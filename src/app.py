@@ -7,45 +7,60 @@ import streamlit as st
 from dotenv import load_dotenv
 # On importe les fonctions dont on a besoin depuis ton pipeline RAG
 from rag_pipeline import (
-    load_vectorstore,
-    build_context_from_docs,
-    call_llm_with_openrouter,
-    embeddings,          # même embeddings que pour l’index de base
+    get_vectorstore,
+    search_docs,
+    get_metadata_index,
+    stream_answer,
+    config,
+    get_embeddings,      # même embeddings que pour l’index de base
 )
 
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
+from tracing import span
+from upload_jobs import UploadJobQueue, merge_into
 
 
 # ==== Chargement .env ====
 BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv(BASE_DIR / ".env") 
 
+# Fichiers uploadés indexés en parallèle (parsing + embeddings)
+UPLOAD_WORKERS = 4
+
 # ==== Gestion de l'index vectoriel en session ====
 
 def get_or_create_vectorstore():
     """
-    Charge l'index FAISS de base (créé via ingest.py + build_index.py)
-    et le garde en cache dans la session Streamlit.
+    Renvoie l'index FAISS de base, partagé en lecture seule par toutes les
+    sessions du processus (créé via ingest.py + build_index.py), ou None.
     """
-    if "vectorstore" not in st.session_state:
-        try:
-            st.session_state["vectorstore"] = load_vectorstore()
-        except Exception as e:
+    try:
+        return get_vectorstore()
+    except Exception as e:
+        if not st.session_state.get("index_warning_shown"):
             st.warning("Impossible de charger l'index existant. "
                        "Vous pouvez quand même indexer des PDF via l'interface.")
-            st.session_state["vectorstore"] = None
-    return st.session_state["vectorstore"]
+            st.session_state["index_warning_shown"] = True
+        return None
+
+
+def get_session_overlay():
+    """Petit index propre à la session : uniquement les PDF uploadés (ou None)."""
+    return st.session_state.get("overlay")
+
 
+@st.cache_resource
+def get_upload_queue():
+    """Pool d'indexation des uploads, partagé par toutes les sessions du processus."""
+    return UploadJobQueue(workers=UPLOAD_WORKERS)
 
-def add_uploaded_pdfs_to_index(uploaded_files):
+
+def start_upload_job(uploaded_files):
     """
-    Sauvegarde les fichiers uploadés, les ingère (chunking) et
-    les ajoute à l'index FAISS déjà présent en session.
+    Soumet les fichiers uploadés (pas encore indexés dans cette session)
+    à l'indexation en tâche de fond. Renvoie le job, ou None si rien à faire.
     """
     if not uploaded_files:
-        return
+        return None
 
     # éviter d'indexer deux fois les mêmes fichiers dans la même session
     if "uploaded_filenames" not in st.session_state:
@@ -53,44 +68,59 @@ def add_uploaded_pdfs_to_index(uploaded_files):
 
     new_files = [f for f in uploaded_files if f.name not in st.session_state["uploaded_filenames"]]
     if not new_files:
-        return
+        return None
 
-    upload_dir = BASE_DIR / "data" / "uploads"
-    upload_dir.mkdir(parents=True, exist_ok=True)
-
-    docs = []
-    for f in new_files:
-        temp_path = upload_dir / f.name
-        # sauvegarde sur disque pour que PyMuPDF puisse lire
-        with open(temp_path, "wb") as out:
-            out.write(f.read())
-
-        loader = PyMuPDFLoader(str(temp_path))
-        pdf_docs = loader.load()
-        for d in pdf_docs:
-            d.metadata["file_name"] = f.name
-        docs.extend(pdf_docs)
-
-    # Chunking identique au pipeline offline
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1200,
-        chunk_overlap=200,
-        separators=["\n\n", "\n", ". ", " ", ""],
+    job = get_upload_queue().submit(
+        [(f.name, f.getvalue()) for f in new_files],
+        get_embeddings(),
+        BASE_DIR / "data" / "uploads",
     )
-    chunks = splitter.split_documents(docs)
+    st.session_state["upload_job_id"] = job.id
+    return job
 
-    # Index spécifique aux fichiers uploadés
-    upload_vs = FAISS.from_documents(chunks, embeddings)
 
-    # Fusion avec l'index de base (ou création d’un nouvel index si None)
-    base_vs = get_or_create_vectorstore()
-    if base_vs is None:
-        st.session_state["vectorstore"] = upload_vs
-    else:
-        base_vs.merge_from(upload_vs)
-        st.session_state["vectorstore"] = base_vs
+def merge_upload_job(job):
+    """Ajoute les vecteurs d'un job terminé à l'index de la session (une seule fois)."""
+    # Uploads → overlay de la session ; l'index de base partagé n'est jamais copié ni modifié
+    error = job.error
+    try:
+        st.session_state["overlay"] = merge_into(get_session_overlay(), job.vectorstore)
+    except Exception as e:
+        error = str(e)
+
+    # Fichiers "terminés" mais index du job non construit : rien n'a été ajouté
+    indexed = [name for name, f in job.files.items() if f.state == "done"] if error is None else []
+    st.session_state.setdefault("uploaded_filenames", []).extend(indexed)
+    st.session_state["upload_job_id"] = None
+    st.session_state["upload_job_report"] = {
+        "indexed": indexed,
+        "failed": {name: f.error for name, f in job.files.items() if f.state == "failed"},
+        "cancelled": job.cancelled,
+        "error": error,
+    }
+
+
+@st.fragment(run_every=1.0)
+def show_upload_job():
+    """Progression du job d'indexation en cours (rafraîchie chaque seconde)."""
+    job_id = st.session_state.get("upload_job_id")
+    job = get_upload_queue().get(job_id) if job_id else None
+    if job is None:
+        return
+
+    if job.done:
+        merge_upload_job(job)
+        st.rerun()  # toute la page : la recherche utilise maintenant le nouvel index
+
+    st.progress(job.progress(), text="⏳ Indexation des documents uploadés en arrière-plan...")
+    labels = {"queued": "en attente", "parsing": "lecture du PDF", "embedding": "embeddings",
+              "done": "terminé", "failed": "échec", "cancelled": "annulé"}
+    for name, f in job.files.items():
+        detail = f" ({f.chunks_done}/{f.chunks_total} chunks)" if f.state == "embedding" else ""
+        st.caption(f"📄 {name} — {labels[f.state]}{detail}")
+    if not job.cancelled and st.button("✖️ Annuler l'indexation", key=f"cancel_{job.id}"):
+        job.cancel()
 
-    st.session_state["uploaded_filenames"].extend([f.name for f in new_files])
 
 # ==== Configuration de la page ====
 st.set_page_config(
@@ -435,10 +465,28 @@ uploaded_files = st.file_uploader(
     help="Les documents uploadés seront indexés pour cette session uniquement.",
 )
 
-if uploaded_files:
+job_running = bool(st.session_state.get("upload_job_id"))
+if uploaded_files and not job_running:
     if st.button("📚 Indexer les documents uploadés", use_container_width=True):
-        add_uploaded_pdfs_to_index(uploaded_files)
-        st.success(f"{len(uploaded_files)} document(s) ajouté(s) à l'index pour cette session.")
+        if start_upload_job(uploaded_files) is None:
+            st.info("Ces documents sont déjà indexés pour cette session.")
+
+# Indexation en tâche de fond : la page reste utilisable pendant ce temps
+show_upload_job()
+
+report = st.session_state.pop("upload_job_report", None)
+if report:
+    if report["indexed"]:
+        st.success(f"{len(report['indexed'])} document(s) ajouté(s) à l'index pour cette session.")
+    for name, error in report["failed"].items():
+        st.error(f"Échec de l'indexation de {name} : {error}")
+    if report["cancelled"]:
+        st.warning("Indexation annulée.")
+    if report.get("error"):
+        st.error(f"Les documents n'ont pas pu être ajoutés à l'index : {report['error']}")
+    cache_stats = get_embeddings().stats()
+    st.caption(f"Cache d'embeddings : {cache_stats['hits']} hits / "
+               f"{cache_stats['misses']} appels API")
 
 # ==== ZONE DE RECHERCHE ====
 st.markdown('<div class="search-section">', unsafe_allow_html=True)
@@ -464,6 +512,50 @@ with col2:
         help="Nombre de passages pertinents à récupérer dans le corpus"
     )
 
+SEARCH_MODES = {
+    "🧭 Sémantique (FAISS)": "dense",
+    "🔤 Hybride (BM25 + FAISS)": "hybrid",
+    "🧩 Diversifiée (MMR)": "mmr",
+}
+search_mode = SEARCH_MODES[st.radio(
+    "Mode de recherche",
+    list(SEARCH_MODES),
+    horizontal=True,
+    help="Hybride : ajoute la recherche par mots-clés (noms d'auteurs, termes techniques exacts). "
+         "Diversifiée : évite les passages quasi identiques (pages consécutives d'un même article).",
+)]
+mmr_lambda = None
+if search_mode == "mmr":
+    mmr_lambda = st.slider(
+        "Pertinence ↔ diversité",
+        min_value=0.0,
+        max_value=1.0,
+        value=config.mmr_lambda,
+        step=0.05,
+        help="1 : ordre de pertinence pur ; plus bas : passages plus variés",
+    )
+
+# Filtres par métadonnées, appliqués pendant la recherche FAISS
+filters = {}
+searchable = [vs for vs in (get_or_create_vectorstore(), get_session_overlay()) if vs is not None]
+if searchable:
+    metadata_indexes = [get_metadata_index(vs) for vs in searchable]
+    with st.expander("🎯 Restreindre la recherche (article, auteur, année)"):
+        file_names = sorted({name for m in metadata_indexes for name in m.values("file_name")})
+        selected_files = st.multiselect("Articles", file_names)
+        author_filter = st.text_input("Auteur (contient)", value="")
+        years = sorted({year for m in metadata_indexes for year in m.values("year")})
+        year_range = None
+        if len(years) > 1:
+            year_range = st.slider("Années", min_value=years[0], max_value=years[-1],
+                                   value=(years[0], years[-1]))
+    if selected_files:
+        filters["file_name"] = selected_files
+    if author_filter.strip():
+        filters["author"] = author_filter.strip()
+    if year_range and year_range != (years[0], years[-1]):
+        filters["year"] = year_range
+
 search_button = st.button("🚀 Lancer la recherche RAG", use_container_width=True)
 
 st.markdown('</div>', unsafe_allow_html=True)
@@ -481,11 +573,23 @@ if search_button and question.strip():
     
     # Recherche des documents
     with st.spinner("🔍 Recherche des passages pertinents dans le corpus indexé (FAISS)..."):
-        vectorstore = get_or_create_vectorstore()
-        if vectorstore is None:
-            docs = []
-        else:
-            docs = vectorstore.similarity_search(question, k=top_k)
+        with span("app.search", k=top_k, mode=search_mode) as search_span:
+            vectorstore = get_or_create_vectorstore()
+            overlay = get_session_overlay()
+            if vectorstore is None and overlay is None:
+                docs = []
+            else:
+                # Index de base partagé + overlay des uploads de la session, top-k fusionné
+                docs = search_docs(
+                    vectorstore if vectorstore is not None else overlay,
+                    question,
+                    k=top_k,
+                    mode=search_mode,
+                    filters=filters,
+                    overlay=overlay if vectorstore is not None else None,
+                    mmr_lambda=mmr_lambda,
+                )
+            search_span.set(docs=len(docs))
     
     if not docs:
         st.warning("⚠️ Aucune source pertinente trouvée dans l'index. Essayez de reformuler votre question ou d'ajouter des documents.")
@@ -500,40 +604,44 @@ if search_button and question.strip():
             page = meta.get("page", meta.get("page_num", "?"))
             
             with st.expander(f"📄 Source {i+1} – {file_name} (page {page})"):
+                # Même passage ailleurs dans le corpus (quasi-doublons retirés de l'index)
+                also = meta.get("duplicates") or []
+                if also:
+                    st.caption("Aussi : " + ", ".join(f"{d.get('file_name')} (page {d.get('page', '?')})" for d in also))
                 st.markdown(f"""
                 <div class="source-content">
                     {doc.page_content}
                 </div>
                 """, unsafe_allow_html=True)
         
-        # Construire le contexte pour le LLM
-        context = build_context_from_docs(docs)
-        
-        # Génération de la réponse
-        with st.spinner("🧠 Génération de la réponse par le LLM (OpenRouter)..."):
-            answer = call_llm_with_openrouter(question, context)
-        
-        # Afficher la réponse
+        # Afficher la réponse au fil de la génération (sources déjà affichées au-dessus)
         st.markdown("""
         <div class="response-container">
             <h3>🤖 Réponse générée</h3>
         </div>
         """, unsafe_allow_html=True)
         
-        st.markdown(f"""
-        <div class="response-text">
-            {answer}
-        </div>
-        """, unsafe_allow_html=True)
+        # Réponse en streaming depuis OpenRouter (ou d'un bloc si déjà en cache)
+        context_report = {}
+        with span("app.answer", docs=len(docs)):
+            st.write_stream(stream_answer(question, docs, context_report))
+
+        # Rapport du contexte réellement envoyé (vide si la réponse vient du cache)
+        if context_report:
+            st.caption(f"Contexte : {context_report['context_tokens']} tokens "
+                       f"({context_report['saved_tokens']} économisés par la fusion des passages voisins)")
+        else:
+            st.caption("Réponse issue du cache (aucun contexte envoyé au LLM)")
 
 # ==== FOOTER ====
 st.markdown("---")
-st.markdown("""
+EMBEDDING_LABELS = {"openai": "OpenAI Embeddings", "sentence-transformers": "Sentence Transformers", "onnx": "ONNX Runtime"}
+st.markdown(f"""
 <div class="littera-footer">
     <div style="margin-bottom: 0.5rem;">
         <span class="footer-badge">FAISS Vector Search</span>
         <span class="footer-badge">OpenRouter LLM</span>
-        <span class="footer-badge">Sentence Transformers</span>
+        <span class="footer-badge">{EMBEDDING_LABELS.get(config.embedding_backend, config.embedding_backend)}</span>
     </div>
     Projet EMLV • Littera RAG System • 2024-2025
 </div>
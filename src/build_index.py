@@ -1,4 +1,12 @@
-import json
+import argparse
+import hashlib
+import itertools
+import os
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -8,37 +16,452 @@ load_dotenv(BASE_DIR / ".env")
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document  # <--- nouveau import
+import numpy as np
+
+from ann_index import INDEX_TYPES, build_faiss_index, compare_index_types, format_report, resolve_params
+from embedding_backends import (
+    EmbeddingMismatchError,
+    check_embedding_spec,
+    create_local_embeddings,
+    embedding_settings,
+    embedding_spec,
+)
+from dedup import is_duplicate
+from embedding_cache import CachedEmbeddings
+from index_manager import publish_index, read_manifest, resolve_index_dir
+from ingest import iter_saved_chunks
+from metadata_index import METADATA_INDEX_NAME, MetadataIndex
+from mmap_store import DOCSTORE_NAME, write_mmap_docstore
+from sparse_index import SPARSE_INDEX_NAME, BM25Index
+from tracing import current_span, span
 
 CHUNKS_PATH = Path("data/processed/chunks.json")
 INDEX_DIR = Path("data/processed/index")
+# Batchs d'embeddings déjà calculés (reprise après interruption)
+CHECKPOINT_DIR = Path("data/processed/embed_checkpoints")
+# Batchs d'embeddings par fenêtre : seuls les chunks d'une fenêtre et leurs
+# vecteurs sont en mémoire à côté de l'index pendant la construction
+WINDOW_BATCHES = 64
 
 
-def load_chunks():
-    with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-        raw_chunks = json.load(f)
-
-    docs = []
-    for item in raw_chunks:
-        docs.append(
-            Document(
-                page_content=item["text"],
-                metadata=item["metadata"],
-            )
+def iter_chunk_docs():
+    for item in iter_saved_chunks(CHUNKS_PATH):
+        # Quasi-doublon : cité via les métadonnées du chunk gardé, pas indexé
+        if is_duplicate(item["metadata"]):
+            continue
+        yield Document(
+            page_content=item["text"],
+            metadata=item["metadata"],
         )
-    return docs
 
 
-def build_index():
-    docs = load_chunks()
-    print(f"[INDEX] Nb documents/chunks: {len(docs)}")
+def load_chunks():
+    return list(iter_chunk_docs())
+
+
+def iter_windows(items, size: int):
+    items = iter(items)
+    while window := list(itertools.islice(items, size)):
+        yield window
+
+
+# ====== Embeddings par batchs (concurrence, backoff, reprise) ======
+
+def _is_rate_limit(error) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveBackoff:
+    """
+    Pause partagée par tous les workers : après un 429, plus personne
+    n'appelle l'API avant la fin du délai. Le délai double à chaque 429
+    et redescend progressivement après les succès.
+    """
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.rate_limited = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self._lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def on_rate_limit(self, retry_after: float = None):
+        with self._lock:
+            self.rate_limited += 1
+            self.delay = min(max(self.delay * 2, self.base_delay), self.max_delay)
+            pause = retry_after if retry_after is not None else self.delay * (0.5 + random.random())
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def on_success(self):
+        with self._lock:
+            self.delay = self.delay / 2 if self.delay > self.base_delay else 0.0
+
+
+def _batch_checkpoint_path(checkpoint_dir: Path, index: int, texts) -> Path:
+    # Le hash du contenu évite de reprendre un batch qui ne correspond plus aux chunks
+    h = hashlib.sha256("\x00".join(texts).encode("utf-8")).hexdigest()[:16]
+    return checkpoint_dir / f"batch-{index:06d}-{h}.npy"
+
+
+def embed_in_batches(
+    texts,
+    embeddings,
+    batch_size: int = 128,
+    parallelism: int = 4,
+    checkpoint_dir: Path = None,
+    max_retries: int = 8,
+    backoff: AdaptiveBackoff = None,
+    first_batch: int = 0,
+):
+    """
+    Calcule les embeddings de `texts` par batchs, `parallelism` batchs à la fois.
+    Chaque batch terminé est sauvé dans `checkpoint_dir` : une construction
+    interrompue reprend là où elle s'était arrêtée. `first_batch` : numéro du
+    premier batch dans les checkpoints (textes envoyés fenêtre par fenêtre).
+    """
+    texts = list(texts)
+    backoff = backoff or AdaptiveBackoff()
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    results = [None] * len(batches)
+
+    if checkpoint_dir is not None:
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+    def run(index):
+        batch = batches[index]
+        path = None
+        if checkpoint_dir is not None:
+            path = _batch_checkpoint_path(checkpoint_dir, first_batch + index, batch)
+            if path.exists():
+                results[index] = np.load(path).tolist()
+                return "resumed"
+
+        for attempt in range(max_retries + 1):
+            backoff.wait()
+            try:
+                vectors = embeddings.embed_documents(batch)
+            except Exception as e:
+                if not _is_rate_limit(e) or attempt == max_retries:
+                    raise
+                backoff.on_rate_limit(_retry_after(e))
+                continue
+            backoff.on_success()
+            break
+
+        if path is not None:
+            tmp_path = path.with_suffix(".tmp.npy")
+            np.save(tmp_path, np.asarray(vectors, dtype=np.float32))
+            os.replace(tmp_path, path)
+        results[index] = vectors
+        return "embedded"
+
+    with span("index.embed", texts=len(texts), batches=len(batches), parallelism=parallelism) as s:
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+            outcomes = list(pool.map(run, range(len(batches))))
+        resumed = outcomes.count("resumed")
+        s.set(resumed_batches=resumed, rate_limited=backoff.rate_limited)
+
+    print(f"[EMBED] {len(batches)} batchs ({resumed} repris d'un checkpoint), "
+          f"{backoff.rate_limited} réponses 429")
+    return [vector for batch in results for vector in batch]
+
+
+def clear_checkpoints(checkpoint_dir: Path = None):
+    shutil.rmtree(checkpoint_dir or CHECKPOINT_DIR, ignore_errors=True)
+
+
+def chunk_ids(docs):
+    return [str(d.metadata["chunk_id"]) for d in docs]
 
-    embeddings = OpenAIEmbeddings()
-    vectorstore = FAISS.from_documents(docs, embeddings)
 
-    INDEX_DIR.mkdir(parents=True, exist_ok=True)
-    vectorstore.save_local(str(INDEX_DIR))
+def load_existing_index(embeddings):
+    """Charge l'index déjà publié, ou None s'il n'existe pas."""
+    manifest = read_manifest(INDEX_DIR)
+    index_dir = resolve_index_dir(INDEX_DIR, manifest)
+    if not (index_dir / "index.faiss").exists():
+        return None
+    check_embedding_spec(manifest, embeddings)
+    return FAISS.load_local(
+        str(index_dir),
+        embeddings,
+        allow_dangerous_deserialization=True,
+    )
+
+
+def add_to_index(vectorstore, docs, embeddings, embed_texts):
+    """Embedde `docs` et les ajoute à l'index (créé s'il vaut None). Renvoie l'index."""
+    texts = [d.page_content for d in docs]
+    text_embeddings = list(zip(texts, embed_texts(texts)))
+    metadatas = [d.metadata for d in docs]
+    ids = chunk_ids(docs)
+    if vectorstore is None:
+        return FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+    vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vectorstore
+
+
+def build_flat_index(docs, embeddings, embed_texts, window: int):
+    """
+    Index FAISS exact construit fenêtre par fenêtre, en lisant `docs` en flux.
+    Renvoie None s'il n'y a aucun chunk.
+    """
+    vectorstore = None
+    for part in iter_windows(docs, window):
+        vectorstore = add_to_index(vectorstore, part, embeddings, embed_texts)
+    return vectorstore
+
+
+def sync_index(vectorstore, docs, embed_texts, window: int):
+    """
+    Met l'index en phase avec chunks.json, par id de chunk :
+    supprime les ids disparus, n'embedde que les nouveaux chunks (par
+    fenêtres de `window` chunks), met à jour les métadonnées des autres
+    (liste des doublons) sans les ré-embedder.
+    """
+    indexed = set(vectorstore.index_to_docstore_id.values())
+    wanted = set()
+    new, added = [], 0
+
+    for d in docs:
+        i = str(d.metadata["chunk_id"])
+        wanted.add(i)
+        if i in indexed:
+            stored = vectorstore.docstore.search(i)
+            if stored.metadata != d.metadata:
+                stored.metadata = d.metadata
+            continue
+        new.append(d)
+        if len(new) >= window:
+            add_to_index(vectorstore, new, vectorstore.embedding_function, embed_texts)
+            added += len(new)
+            new = []
+    if new:
+        add_to_index(vectorstore, new, vectorstore.embedding_function, embed_texts)
+        added += len(new)
+
+    stale = [i for i in indexed if i not in wanted]
+    if stale:
+        vectorstore.delete(stale)
+
+    print(f"[INDEX] Incrémental : +{added} chunks, -{len(stale)} chunks")
+
+
+def index_sidecars(vectorstore):
+    """
+    Fichiers publiés avec l'index FAISS :
+    - l'index BM25, reconstruit depuis le docstore,
+    - le docstore au format mmap (chargement rapide, partagé entre processus),
+    - l'index des métadonnées (filtres fichier / auteur / année / page).
+    """
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(len(vectorstore.index_to_docstore_id))]
+    docs = [vectorstore.docstore.search(i) for i in ids]
+    bm25 = BM25Index.build([d.page_content for d in docs], ids)
+    print(f"[BM25] {len(bm25)} chunks, {len(bm25.vocab)} termes")
+    metadata_index = MetadataIndex.build([d.metadata for d in docs])
+    print(f"[META] {len(metadata_index.file_names)} fichiers, {len(metadata_index.authors)} auteurs")
+    return {
+        SPARSE_INDEX_NAME: bm25.save,
+        METADATA_INDEX_NAME: metadata_index.save,
+        DOCSTORE_NAME: lambda path: write_mmap_docstore(vectorstore, path),
+    }
+
+
+def publish_traced(vectorstore, **manifest_extra):
+    """
+    publish_index dans INDEX_DIR, avec ses fichiers annexes (étape tracée).
+    Le backend d'embeddings est inscrit dans le manifest : rag_pipeline refuse
+    de chercher avec d'autres embeddings.
+    """
+    manifest_extra = {**embedding_spec(vectorstore.embedding_function), **manifest_extra}
+    with span("index.publish", chunks=len(vectorstore.index_to_docstore_id)) as s:
+        manifest = publish_index(vectorstore, INDEX_DIR, sidecars=index_sidecars(vectorstore), **manifest_extra)
+        if s.recording:
+            version_dir = resolve_index_dir(INDEX_DIR, manifest)
+            s.set(bytes=sum(path.stat().st_size for path in version_dir.iterdir() if path.is_file()))
+    return manifest
+
+
+def make_embeddings():
+    # Backend choisi par LITTERA_EMBEDDING_BACKEND (voir embedding_backends.py)
+    settings = embedding_settings()
+    if settings["backend"] != "openai":
+        return CachedEmbeddings(create_local_embeddings(settings["backend"], settings["model"], settings["int8"]))
+    # Pas de retries internes au client : c'est embed_in_batches qui gère les 429
+    model = {"model": settings["model"]} if settings["model"] else {}
+    return CachedEmbeddings(OpenAIEmbeddings(max_retries=0, **model))
+
+
+def remove_from_index(ids):
+    """Retire des chunks de l'index publié, sans reconstruction."""
+    vectorstore = load_existing_index(make_embeddings())
+    if vectorstore is None:
+        return
+    present = set(vectorstore.index_to_docstore_id.values())
+    to_delete = [i for i in ids if i in present]
+    if not to_delete:
+        return
+    try:
+        vectorstore.delete(to_delete)
+    except RuntimeError:
+        # HNSW ne sait pas supprimer de vecteurs
+        print("[INDEX] Ce type d'index ne supporte pas la suppression : "
+              "relancer build_index.py pour le reconstruire.")
+        return
+    manifest = read_manifest(INDEX_DIR)
+    publish_traced(
+        vectorstore,
+        nb_chunks=len(vectorstore.index_to_docstore_id),
+        index_type=manifest.get("index_type", "flat"),
+        index_params=manifest.get("index_params", {}),
+    )
+    print(f"[INDEX] {len(to_delete)} chunks retirés de {INDEX_DIR}")
+
+
+def build_index(
+    full: bool = False,
+    batch_size: int = 128,
+    parallelism: int = 4,
+    index_type: str = "flat",
+    **index_params,
+):
+    with span("index.build", index_type=index_type, full=full):
+        _build_index(full, batch_size, parallelism, index_type, **index_params)
+
+
+def _build_index(full: bool, batch_size: int, parallelism: int, index_type: str, **index_params):
+    # Cache disque : seuls les chunks nouveaux/modifiés partent à l'API
+    embeddings = make_embeddings()
+    # chunks.json est lu en flux : jamais plus d'une fenêtre de textes et de
+    # vecteurs en mémoire en plus de l'index lui-même
+    window = batch_size * WINDOW_BATCHES
+    batches_done = 0
+
+    def embed_texts(texts):
+        nonlocal batches_done
+        vectors = embed_in_batches(
+            texts,
+            embeddings,
+            batch_size=batch_size,
+            parallelism=parallelism,
+            checkpoint_dir=CHECKPOINT_DIR,
+            first_batch=batches_done,
+        )
+        batches_done += -(-len(texts) // batch_size)
+        return vectors
+
+    # Mise à jour incrémentale uniquement pour l'index exact : les index
+    # approximatifs sont réentraînés sur tout le corpus (embeddings en cache).
+    previous = read_manifest(INDEX_DIR)
+    incremental = not full and index_type == "flat" and previous.get("index_type", "flat") == "flat"
+    if incremental and (resolve_index_dir(INDEX_DIR, previous) / "index.faiss").exists():
+        try:
+            check_embedding_spec(previous, embeddings)
+        except EmbeddingMismatchError as e:
+            # Vecteurs d'un autre modèle : rien n'est réutilisable
+            print(f"[INDEX] {e} → reconstruction complète")
+            incremental = False
+    vectorstore = load_existing_index(embeddings) if incremental else None
+    resolved = {}
+    if vectorstore is None:
+        vectorstore = build_flat_index(iter_chunk_docs(), embeddings, embed_texts, window)
+        if vectorstore is None:
+            print(f"[INDEX] Aucun chunk dans {CHUNKS_PATH}, index inchangé.")
+            return
+        if index_type != "flat":
+            # Vecteurs relus depuis l'index exact (float32, pas de copie en listes Python)
+            vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+            resolved = resolve_params(index_type, *vectors.shape, **index_params)
+            # Même ordre d'ajout : index_to_docstore_id reste valable
+            vectorstore.index = build_faiss_index(vectors, index_type, **resolved)
+            del vectors
+    else:
+        sync_index(vectorstore, iter_chunk_docs(), embed_texts, window)
+    nb_chunks = len(vectorstore.index_to_docstore_id)
+    print(f"[INDEX] Nb documents/chunks: {nb_chunks} (type {index_type})")
+    stats = embeddings.stats()
+    print(f"[CACHE] Embeddings : {stats['hits']} hits / {stats['misses']} appels API")
+    current_span().set(
+        chunks=nb_chunks, incremental=incremental, cache_hits=stats["hits"], cache_misses=stats["misses"]
+    )
+
+    # Publication atomique : les processus qui servent l'index le rechargent à chaud
+    publish_traced(
+        vectorstore,
+        nb_chunks=nb_chunks,
+        index_type=index_type,
+        index_params=resolved,
+    )
+    clear_checkpoints(CHECKPOINT_DIR)
     print(f"[INDEX] FAISS sauvé dans {INDEX_DIR}")
 
 
+def report_index_types(index_types, k: int = 10, nprobe: int = 16, ef_search: int = 64, **index_params):
+    """Compare les types d'index sur les embeddings du corpus (lus depuis le cache)."""
+    texts = [d.page_content for d in load_chunks()]
+    vectors = np.asarray(embed_in_batches(texts, make_embeddings()), dtype=np.float32)
+    reports = compare_index_types(
+        vectors, index_types, k=k, nprobe=nprobe, ef_search=ef_search, **index_params
+    )
+    print(format_report(reports, k))
+    return reports
+
+
 if __name__ == "__main__":
-    build_index()
+    parser = argparse.ArgumentParser(description="Construit / met à jour l'index FAISS")
+    parser.add_argument("--full", action="store_true",
+                        help="reconstruit tout l'index au lieu de le mettre à jour")
+    parser.add_argument("--batch-size", type=int, default=128,
+                        help="nombre de chunks par appel d'embeddings")
+    parser.add_argument("--parallelism", type=int, default=4,
+                        help="nombre d'appels d'embeddings simultanés")
+    parser.add_argument("--index-type", choices=list(INDEX_TYPES), default="flat",
+                        help="flat (exact), ivf, ivfpq, ivfsq, hnsw ou sq")
+    parser.add_argument("--nlist", type=int, help="cellules IVF")
+    parser.add_argument("--pq-m", type=int, help="sous-quantifieurs PQ")
+    parser.add_argument("--pq-nbits", type=int, help="bits par code PQ")
+    parser.add_argument("--hnsw-m", type=int, help="voisins par nœud HNSW")
+    parser.add_argument("--ef-construction", type=int, help="efConstruction HNSW")
+    parser.add_argument("--report", action="store_true",
+                        help="compare recall@k / latence / mémoire des types d'index, sans rien publier")
+    parser.add_argument("--k", type=int, default=10, help="k du recall@k (rapport)")
+    parser.add_argument("--nprobe", type=int, default=16, help="nprobe IVF (rapport)")
+    parser.add_argument("--ef-search", type=int, default=64, help="efSearch HNSW (rapport)")
+    args = parser.parse_args()
+
+    index_params = {
+        "nlist": args.nlist,
+        "pq_m": args.pq_m,
+        "pq_nbits": args.pq_nbits,
+        "hnsw_m": args.hnsw_m,
+        "ef_construction": args.ef_construction,
+    }
+    if args.report:
+        report_index_types(
+            list(INDEX_TYPES), k=args.k, nprobe=args.nprobe, ef_search=args.ef_search, **index_params
+        )
+    else:
+        build_index(
+            full=args.full,
+            batch_size=args.batch_size,
+            parallelism=args.parallelism,
+            index_type=args.index_type,
+            **index_params,
+        )
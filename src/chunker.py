@@ -0,0 +1,129 @@
+# src/chunker.py
+"""
+Découpage des pages en chunks mesurés en tokens (tokenizer.py), partagé par
+l'ingestion (ingest.py, stream_pipeline.py) et les uploads de l'app.
+
+- chaque page est encodée une seule fois (toutes les pages en un seul
+  appel) : une page qui tient dans CHUNK_TOKENS est un chunk à elle seule,
+  sans découpage en phrases ;
+- les autres pages sont coupées en phrases (ponctuation finale, ou
+  paragraphe) ; les tokens d'une phrase sont ceux de la page qui finissent
+  dans la phrase (token_ends_batch) : aucune phrase n'est réencodée ;
+- les phrases sont regroupées jusqu'à CHUNK_TOKENS tokens ; un chunk ne
+  coupe jamais une phrase, sauf une phrase à elle seule trop longue (coupée
+  entre deux mots), et ne déborde jamais sur la page suivante ;
+- deux chunks consécutifs partagent leurs dernières / premières phrases, dans
+  la limite de CHUNK_OVERLAP_TOKENS.
+
+Les tokens d'un chunk sont ceux de l'encodage de la page : le chunk réencodé
+seul peut en compter un ou deux de plus ou de moins, à ses bords.
+"""
+import re
+
+import numpy as np
+from langchain_core.documents import Document
+
+from tokenizer import get_encoding, token_ends_batch
+
+# Dans la fourchette 400–800 tokens ; budget de contexte (3000) = 4 à 5 chunks
+CHUNK_TOKENS = 600
+CHUNK_OVERLAP_TOKENS = 80
+
+# Fin de phrase suivie d'un blanc, ou saut de paragraphe : le segment suivant
+# commence au blanc. Chaque motif commence par un caractère précis : le moteur
+# de regex saute directement aux candidats.
+_BOUNDARY_RE = re.compile(r"[.!?…:;][\"'»”)\]]*(?=\s)|\n[ \t]*\n")
+_WORD_RE = re.compile(r"\s*\S+")
+
+
+def chunker_id() -> str:
+    """
+    Inscrit dans le manifest d'ingestion : un PDF découpé autrement est refait.
+    Comprend l'encodage (chargé au premier appel) : des chunks comptés avec
+    l'encodage approximatif sont refaits quand tiktoken devient disponible.
+    """
+    return f"tokens-{get_encoding().name}-{CHUNK_TOKENS}-{CHUNK_OVERLAP_TOKENS}-page"
+
+
+def _sentence_spans(text: str):
+    """(début, fin) des phrases de `text`, qui le recouvrent entièrement."""
+    # Paragraphe : la phrase s'arrête avant le saut de ligne
+    ends = [m.start() if text[m.start()] == "\n" else m.end() for m in _BOUNDARY_RE.finditer(text)]
+    ends.append(len(text))
+    # Fins croissantes ; une fin répétée (point juste avant un saut de paragraphe) ne crée rien
+    return [(a, b) for a, b in zip([0] + ends, ends) if b > a]
+
+
+def _tokens_before(ends, positions):
+    """Nombre de tokens de la page finis à chacune des positions (croissantes)."""
+    return np.searchsorted(ends, positions, side="right").tolist()
+
+
+def _split_long(text: str, start: int, end: int, max_tokens: int, ends):
+    """Phrase trop longue → morceaux de mots entiers d'au plus max_tokens tokens."""
+    word_starts = [m.start() for m in _WORD_RE.finditer(text, start, end)]
+    # Un morceau commence au début d'un mot ; le dernier va jusqu'à la fin de la phrase
+    cuts = _tokens_before(ends, word_starts[1:] + [end])
+    pieces, piece_start = [], start
+    piece_first = previous = _tokens_before(ends, [start])[0]
+    for a, tokens_at_end in zip(word_starts, cuts):
+        if a > piece_start and tokens_at_end - piece_first > max_tokens:
+            pieces.append((piece_start, a, previous - piece_first))
+            piece_start, piece_first = a, previous
+        previous = tokens_at_end
+    pieces.append((piece_start, end, previous - piece_first))
+    return pieces
+
+
+def _pack(segments, chunk_tokens: int, overlap_tokens: int):
+    """Segments (début, fin, tokens) d'une page → (début, fin) des chunks."""
+    chunks, current, used = [], [], 0
+    for segment in segments:
+        if current and used + segment[2] > chunk_tokens:
+            chunks.append((current[0][0], current[-1][1]))
+            # Recouvrement : dernières phrases du chunk, jamais le chunk entier
+            kept = []
+            for previous in reversed(current[1:]):
+                if sum(s[2] for s in kept) + previous[2] > overlap_tokens:
+                    break
+                kept.insert(0, previous)
+            current, used = kept, sum(s[2] for s in kept)
+            if used + segment[2] > chunk_tokens:
+                current, used = [], 0
+        current.append(segment)
+        used += segment[2]
+    if current:
+        chunks.append((current[0][0], current[-1][1]))
+    return chunks
+
+
+def _segments(text: str, ends, max_tokens: int):
+    """Phrases de la page → segments (début, fin, tokens), phrases trop longues coupées."""
+    spans = _sentence_spans(text)
+    bounds = _tokens_before(ends, [b for _, b in spans])
+    segments = []
+    for (a, b), first, last in zip(spans, [0] + bounds, bounds):
+        if last - first > max_tokens:
+            segments.extend(_split_long(text, a, b, max_tokens, ends))
+        else:
+            segments.append((a, b, last - first))
+    return segments
+
+
+def split_documents(docs, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+    """Pages (Documents) → chunks (Documents, métadonnées de la page recopiées)."""
+    texts = [d.page_content for d in docs]
+    # Un seul encodage par page, pour toutes les pages du lot
+    page_ends = token_ends_batch(texts, get_encoding())
+
+    chunks = []
+    for doc, text, ends in zip(docs, texts, page_ends):
+        if len(ends) <= chunk_tokens:
+            spans = [(0, len(text))]
+        else:
+            spans = _pack(_segments(text, ends, chunk_tokens), chunk_tokens, overlap_tokens)
+        for a, b in spans:
+            content = text[a:b].strip()
+            if content:
+                chunks.append(Document(page_content=content, metadata=dict(doc.metadata)))
+    return chunks
@@ -0,0 +1,151 @@
+# src/context_packing.py
+"""
+Construction du contexte envoyé au LLM, sous un budget de tokens.
+
+Les chunks sont découpés avec un recouvrement (chunk_overlap) : deux chunks
+voisins récupérés ensemble répètent le même passage. Ici :
+- les chunks d'un même fichier et d'une même page qui se recouvrent ou se
+  suivent (ids consécutifs) sont fusionnés en un seul extrait, sans doublon ;
+- un chunk entièrement contenu dans un extrait déjà retenu est ignoré ;
+- les extraits remplissent le budget dans l'ordre de pertinence, le dernier
+  est tronqué s'il dépasse ;
+- les autres pages où figure le passage (quasi-doublons retirés de l'index,
+  voir dedup.py) sont citées dans l'en-tête de l'extrait.
+
+pack_context renvoie le contexte et un rapport (tokens avant / après).
+"""
+from tokenizer import get_encoding
+
+DEFAULT_TOKEN_BUDGET = 3000
+
+# Recouvrement minimal (en caractères) pour considérer deux chunks comme voisins,
+# et recouvrement maximal recherché (80 tokens à l'ingestion, voir chunker.py)
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 600
+
+
+def _source_of(doc):
+    meta = doc.metadata or {}
+    return meta.get("file_name", "unknown"), meta.get("page", meta.get("page_num", "?"))
+
+
+def _also_sources(doc):
+    """(fichier, page) des quasi-doublons du chunk, retirés de l'index à l'ingestion."""
+    duplicates = (doc.metadata or {}).get("duplicates") or []
+    return [(d.get("file_name") or "unknown", d.get("page", "?")) for d in duplicates]
+
+
+def _sequence_of(doc):
+    """(hash du fichier, numéro du chunk) depuis un chunk_id "<hash>-<i>", sinon None."""
+    chunk_id = (doc.metadata or {}).get("chunk_id") or doc.id or ""
+    prefix, _, number = str(chunk_id).rpartition("-")
+    return (prefix, int(number)) if prefix and number.isdigit() else None
+
+
+def _overlap(left: str, right: str) -> int:
+    """Longueur du plus long suffixe de `left` qui est un préfixe de `right`."""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _follows(left_seq, right_seq) -> bool:
+    return (
+        left_seq is not None and right_seq is not None
+        and left_seq[0] == right_seq[0] and left_seq[1] + 1 == right_seq[1]
+    )
+
+
+class _Excerpt:
+    def __init__(self, doc):
+        self.source = _source_of(doc)
+        self.also = _also_sources(doc)
+        self.text = doc.page_content
+        self.first_seq = self.last_seq = _sequence_of(doc)
+
+    def absorb(self, doc) -> bool:
+        """Fusionne `doc` dans l'extrait s'il le recouvre ou le prolonge."""
+        if not self._merge_text(doc):
+            return False
+        self.also += [s for s in _also_sources(doc) if s not in self.also]
+        return True
+
+    def _merge_text(self, doc) -> bool:
+        if _source_of(doc) != self.source:
+            return False
+        text, seq = doc.page_content, _sequence_of(doc)
+        if text in self.text:
+            return True
+
+        after = _overlap(self.text, text)
+        if after or _follows(self.last_seq, seq):
+            self.text = self.text + (text[after:] if after else "\n" + text)
+            self.last_seq = seq or self.last_seq
+            return True
+
+        before = _overlap(text, self.text)
+        if before or _follows(seq, self.first_seq):
+            self.text = (text[:-before] if before else text + "\n") + self.text
+            self.first_seq = seq or self.first_seq
+            return True
+        return False
+
+
+def _format(i: int, source, text: str, also=()) -> str:
+    file_name, page = source
+    header = f"[Source {i} | {file_name} | page {page}"
+    if also:
+        header += " | aussi : " + ", ".join(f"{name} p. {p}" for name, p in also)
+    return f"{header}]\n{text}"
+
+
+def pack_context(docs, token_budget: int = DEFAULT_TOKEN_BUDGET):
+    """
+    Contexte à partir des docs (triés par pertinence) sous `token_budget` tokens.
+    Renvoie (contexte, rapport).
+    """
+    encoding = get_encoding()
+
+    excerpts = []
+    for doc in docs:
+        if not any(excerpt.absorb(doc) for excerpt in excerpts):
+            excerpts.append(_Excerpt(doc))
+
+    parts = []
+    used = 0
+    truncated = False
+    separator_tokens = len(encoding.encode_ordinary("\n\n"))
+    for excerpt in excerpts:
+        separator = separator_tokens if parts else 0
+        tokens = encoding.encode_ordinary(_format(len(parts) + 1, excerpt.source, excerpt.text, excerpt.also))
+        if used + separator + len(tokens) <= token_budget:
+            parts.append(encoding.decode(tokens))
+            used += separator + len(tokens)
+            continue
+        # Dernier extrait coupé au budget restant, les suivants sont abandonnés
+        remaining = token_budget - used - separator
+        if remaining > 0:
+            parts.append(encoding.decode(tokens[:remaining]).rstrip("\ufffd"))
+            truncated = True
+        break
+
+    context = "\n\n".join(parts)
+    # Référence : l'ancien contexte (tous les chunks entiers, sans fusion ni budget)
+    raw = "\n\n".join(
+        _format(i + 1, _source_of(d), d.page_content, _also_sources(d)) for i, d in enumerate(docs)
+    )
+    raw_tokens = len(encoding.encode_ordinary(raw))
+    context_tokens = len(encoding.encode_ordinary(context))
+    report = {
+        "docs": len(docs),
+        "excerpts": len(parts),
+        "merged_docs": len(docs) - len(excerpts),
+        "dropped_excerpts": len(excerpts) - len(parts),
+        "truncated": truncated,
+        "raw_tokens": raw_tokens,
+        "context_tokens": context_tokens,
+        "saved_tokens": raw_tokens - context_tokens,
+        "token_budget": token_budget,
+    }
+    return context, report
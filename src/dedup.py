@@ -0,0 +1,218 @@
+# src/dedup.py
+"""
+Nettoyage des chunks à l'ingestion.
+
+1. En-têtes / pieds de page (optionnel, par PDF) : une ligne répétée en haut
+   ou en bas de la plupart des pages (titre courant, nom de revue, licence,
+   "Page 3 of 12"...) est retirée de chaque page avant le découpage.
+
+2. Quasi-doublons (tout le corpus) : MinHash sur les 3-grammes de mots de
+   chaque chunk, index LSH par bandes pour ne comparer que les candidats.
+   Deux chunks dont la similarité de Jaccard estimée dépasse le seuil sont des
+   doublons : le premier dans l'ordre du corpus est gardé, les suivants restent
+   dans chunks.json avec "duplicate_of" (id du chunk gardé) et ne sont pas
+   indexés. Le chunk gardé liste ses doublons dans "duplicates" (fichier, page,
+   id, auteur, année) : la réponse peut citer toutes les pages où le passage
+   apparaît, et les filtres de métadonnées le trouvent aussi sous ces fichiers.
+
+Le calcul est refait sur tout le corpus à chaque ingestion : le résultat ne
+dépend que des chunks présents, pas de l'ordre des ajouts.
+"""
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from tokenizer import get_encoding
+
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 128
+# 16 bandes de 8 lignes : paires candidates à partir d'une similarité ~0,7
+LSH_BANDS = 16
+SHINGLE_WORDS = 3
+# En dessous, trop peu de 3-grammes pour une estimation fiable (titres, légendes)
+MIN_WORDS = 12
+
+_WORD_RE = re.compile(r"\w+")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+# ====== En-têtes et pieds de page ======
+
+def _line_key(line: str) -> str:
+    # Numéros de page et dates varient d'une page à l'autre
+    return " ".join(_DIGITS_RE.sub("#", line.lower()).split())
+
+
+def strip_headers_footers(pages, edge_lines: int = 2, min_share: float = 0.5, min_pages: int = 3):
+    """
+    Retire des pages (Documents d'un même PDF, modifiés en place) les lignes
+    répétées dans les `edge_lines` premières ou dernières lignes d'au moins
+    `min_share` des pages. Renvoie {"lines", "tokens"} retirés.
+    """
+    removed = {"lines": 0, "tokens": 0}
+    if len(pages) < min_pages:
+        return removed
+
+    split = [d.page_content.splitlines() for d in pages]
+
+    def edges(lines):
+        kept = [i for i, line in enumerate(lines) if line.strip()]
+        return kept[:edge_lines] + kept[-edge_lines:]
+
+    counts = Counter()
+    for lines in split:
+        counts.update({_line_key(lines[i]) for i in edges(lines)})
+    threshold = max(min_pages, min_share * len(pages))
+    repeated = {key for key, n in counts.items() if n >= threshold and key}
+    if not repeated:
+        return removed
+
+    encoding = get_encoding()
+    for doc, lines in zip(pages, split):
+        drop = {i for i in edges(lines) if _line_key(lines[i]) in repeated}
+        if not drop:
+            continue
+        removed["lines"] += len(drop)
+        removed["tokens"] += sum(len(encoding.encode_ordinary(lines[i])) for i in drop)
+        doc.page_content = "\n".join(line for i, line in enumerate(lines) if i not in drop)
+    return removed
+
+
+# ====== MinHash / LSH ======
+
+class MinHasher:
+    """
+    Signatures MinHash : hachage multiply-shift (a·x + b mod 2^64) >> 32 des
+    3-grammes, une permutation par ligne de la signature.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2**63, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, size=(num_perm, 1), dtype=np.uint64)
+
+    @staticmethod
+    def shingles(text: str):
+        words = _WORD_RE.findall(text.lower())
+        if len(words) < MIN_WORDS:
+            return None
+        grams = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+        # crc32 : stable d'un processus à l'autre (contrairement à hash())
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str):
+        hashes = self.shingles(text)
+        if hashes is None:
+            return None
+        with np.errstate(over="ignore"):
+            permuted = (self.a * hashes[None, :] + self.b) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateFilter:
+    """
+    Quasi-doublons chunk par chunk, dans l'ordre du corpus : chaque chunk est
+    comparé (via l'index LSH) aux chunks gardés avant lui. Utilisé sur tout
+    le corpus par deduplicate_records, et au fil de l'eau par stream_pipeline.py.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = NUM_PERM):
+        self.threshold = threshold
+        self._hasher = MinHasher(num_perm)
+        self._rows = num_perm // LSH_BANDS
+        self._buckets = [{} for _ in range(LSH_BANDS)]
+        self._signatures = []  # signatures des chunks gardés, dans l'ordre
+        self._keys = []  # clé de chaque chunk gardé
+
+    def original_of(self, key, text: str):
+        """
+        Clé du chunk gardé dont `text` est un quasi-doublon, ou None : le
+        chunk est alors gardé, sous la clé `key`.
+        """
+        signature = self._hasher.signature(text)
+        if signature is None:
+            return None
+        rows = self._rows
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(LSH_BANDS)]
+
+        candidates = sorted({c for band, k in enumerate(keys) for c in self._buckets[band].get(k, ())})
+        original = next(
+            (c for c in candidates if np.mean(self._signatures[c] == signature) >= self.threshold), None
+        )
+        if original is not None:
+            return self._keys[original]
+
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        self._keys.append(key)
+        for band, k in enumerate(keys):
+            self._buckets[band].setdefault(k, []).append(position)
+        return None
+
+
+def duplicate_pointer(metadata) -> dict:
+    """Ce que le chunk gardé retient d'un de ses doublons (citation, filtres)."""
+    return {
+        "chunk_id": metadata.get("chunk_id"),
+        "file_name": metadata.get("file_name"),
+        "page": metadata.get("page", metadata.get("page_num")),
+        "author": metadata.get("author"),
+        "year": metadata.get("year"),
+    }
+
+
+def deduplicate_records(records, threshold: float = DEFAULT_THRESHOLD, num_perm: int = NUM_PERM):
+    """
+    Marque les quasi-doublons dans les records (modifiés en place, ordre du
+    corpus conservé). Renvoie le rapport : chunks et tokens retirés de l'index,
+    groupes de doublons.
+    """
+    dedup_filter = NearDuplicateFilter(threshold, num_perm)
+    groups = {}  # position du chunk gardé → positions des doublons
+
+    # Résultat d'une ingestion précédente : recalculé
+    clear_duplicate_marks(records)
+    for position, record in enumerate(records):
+        original = dedup_filter.original_of(position, record["text"])
+        if original is not None:
+            groups.setdefault(original, []).append(position)
+
+    removed_texts = []
+    for original, duplicates in groups.items():
+        canonical = records[original]["metadata"]
+        pointers = []
+        for position in duplicates:
+            meta = records[position]["metadata"]
+            meta["duplicate_of"] = canonical.get("chunk_id")
+            pointers.append(duplicate_pointer(meta))
+            removed_texts.append(records[position]["text"])
+        canonical["duplicates"] = pointers
+
+    encoding = get_encoding()
+    removed_tokens = sum(len(tokens) for tokens in encoding.encode_ordinary_batch(removed_texts))
+    return {
+        "chunks": len(records),
+        "removed_chunks": len(removed_texts),
+        "removed_tokens": removed_tokens,
+        "threshold": threshold,
+        "groups": [
+            {
+                "kept": records[original]["metadata"].get("chunk_id"),
+                "duplicates": [records[p]["metadata"].get("chunk_id") for p in duplicates],
+            }
+            for original, duplicates in groups.items()
+        ],
+    }
+
+
+def clear_duplicate_marks(records):
+    for record in records:
+        record["metadata"].pop("duplicate_of", None)
+        record["metadata"].pop("duplicates", None)
+
+
+def is_duplicate(metadata) -> bool:
+    return bool((metadata or {}).get("duplicate_of"))
+
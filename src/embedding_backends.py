@@ -0,0 +1,324 @@
+# src/embedding_backends.py
+"""
+Backends d'embeddings : OpenAI (API) ou modèle local sur CPU.
+
+Choix par configuration (.env ou variables d'environnement) :
+- LITTERA_EMBEDDING_BACKEND : "openai" (défaut), "sentence-transformers" ou "onnx" ;
+- LITTERA_EMBEDDING_MODEL : nom du modèle (défaut selon le backend) ;
+  pour "onnx" : dossier local (model.onnx + tokenizer.json) ou dépôt Hugging Face ;
+- LITTERA_EMBEDDING_INT8=1 : quantification int8 dynamique (modèle local).
+
+Les backends locaux ne sont importés que s'ils sont choisis :
+    pip install sentence-transformers        # backend "sentence-transformers"
+    pip install onnxruntime tokenizers huggingface_hub   # backend "onnx"
+
+LocalEmbeddings regroupe les textes par lots :
+- documents : triés par longueur (moins de padding), lots bornés en textes et
+  en tokens estimés, plusieurs lots en parallèle dans un pool de threads ;
+- questions : les appels simultanés (serveur HTTP, sessions Streamlit) sont
+  regroupés en un seul passage du modèle par un thread dédié.
+Le pool et les threads internes du modèle se partagent les cœurs de la machine.
+
+Le backend et le modèle sont inscrits dans le manifest de l'index
+(embedding_spec) ; check_embedding_spec refuse de charger un index construit
+avec d'autres embeddings que ceux des questions.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+# Réexportés : lecture des réglages sans importer LangChain (voir embedding_config)
+from embedding_config import EMBEDDING_BACKENDS, LOCAL_BACKENDS, embedding_settings  # noqa: F401
+
+# Multilingue (corpus en français et en anglais), 384 dimensions, rapide sur CPU
+DEFAULT_LOCAL_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+SPEC_KEYS = ("embedding_backend", "embedding_model", "embedding_int8")
+
+# Classes LangChain des backends distants (index construits avant ce module)
+_BACKEND_BY_CLASS = {"OpenAIEmbeddings": "openai"}
+
+
+class EmbeddingMismatchError(ValueError):
+    pass
+
+
+def plan_threads(cpu_count: int = None, workers: int = None):
+    """
+    (lots traités en parallèle, threads internes du modèle par lot) :
+    le produit ne dépasse pas le nombre de cœurs. Un lot par tranche de 4 cœurs :
+    les produits matriciels d'un modèle de cette taille ne profitent plus au-delà.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    workers = workers or max(1, cpu_count // 4)
+    workers = min(workers, cpu_count)
+    return workers, max(1, cpu_count // workers)
+
+
+def _estimate_tokens(text: str) -> int:
+    # ~4 caractères par token, plus les tokens spéciaux
+    return len(text) // 4 + 2
+
+
+def length_batches(texts, max_batch_size: int, max_batch_tokens: int):
+    """
+    Indices de `texts` regroupés par longueur croissante. Un lot est rempli
+    jusqu'à max_batch_size textes ou max_batch_tokens tokens de padding compris
+    (nb de textes × longueur du plus long).
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches, current = [], []
+    for i in order:
+        longest = _estimate_tokens(texts[i])  # ordre croissant : le dernier est le plus long
+        if current and (len(current) == max_batch_size or (len(current) + 1) * longest > max_batch_tokens):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class _QueryBatcher:
+    """
+    Regroupe les embed_query simultanés : un thread dédié prend toutes les
+    questions en attente (jusqu'à max_batch) et les encode en un seul passage.
+    Sans concurrence, une question est encodée seule, sans attente ajoutée.
+    """
+
+    def __init__(self, encode, max_batch: int):
+        self._encode = encode
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+
+    def embed(self, text: str):
+        future = Future()
+        self._queue.put((text, future))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embed-queries", daemon=True)
+                    self._thread.start()
+        return future.result()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self._max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.batches += 1
+            try:
+                vectors = self._encode([text for text, _ in items])
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(items, vectors):
+                future.set_result(vector)
+
+
+class LocalEmbeddings(Embeddings):
+    """Embeddings calculés sur la machine par `encoder` (encode(textes) → matrice normalisée)."""
+
+    def __init__(
+        self,
+        encoder,
+        backend: str,
+        model_name: str,
+        int8: bool = False,
+        workers: int = 1,
+        max_batch_size: int = 64,
+        max_batch_tokens: int = 16384,
+    ):
+        self.encoder = encoder
+        self.backend = backend
+        self.model_name = model_name
+        self.int8 = int8
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        # Nom vu par le cache disque : des vecteurs int8 ne remplacent pas des vecteurs float
+        self.model = f"{backend}:{model_name}" + (":int8" if int8 else "")
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed")
+        self._queries = _QueryBatcher(self._encode, max_batch_size)
+
+    def _encode(self, texts):
+        return [[float(x) for x in vector] for vector in self.encoder.encode(list(texts))]
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        batches = length_batches(texts, self.max_batch_size, self.max_batch_tokens)
+        results = [None] * len(texts)
+        encoded = self._pool.map(lambda batch: self._encode([texts[i] for i in batch]), batches)
+        for batch, vectors in zip(batches, encoded):
+            for i, vector in zip(batch, vectors):
+                results[i] = vector
+        return results
+
+    def embed_query(self, text):
+        return self._queries.embed(text)
+
+
+# ====== Encodeurs locaux ======
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name: str, int8: bool = False, threads: int = None):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "Backend 'sentence-transformers' : pip install sentence-transformers"
+            ) from e
+
+        if threads:
+            torch.set_num_threads(threads)
+        self._torch = torch
+        self.model = SentenceTransformer(model_name, device="cpu")
+        if int8:
+            # Couches linéaires en int8, activations quantifiées à la volée
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, texts):
+        with self._torch.inference_mode():
+            return self.model.encode(
+                texts,
+                batch_size=len(texts),
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+
+
+class OnnxEncoder:
+    """Modèle de type BERT exporté en ONNX : tokenizer.json + model.onnx, pooling moyen."""
+
+    def __init__(self, model_name: str, int8: bool = False, threads: int = None, max_length: int = 512):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("Backend 'onnx' : pip install onnxruntime tokenizers huggingface_hub") from e
+
+        model_dir = self._model_dir(model_name)
+        model_path = next((p for p in (model_dir / "model.onnx", model_dir / "onnx/model.onnx") if p.exists()), None)
+        if model_path is None:
+            raise FileNotFoundError(f"model.onnx introuvable dans {model_dir}")
+        if int8:
+            model_path = self._quantized(model_path)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or 0  # 0 : choix d'onnxruntime
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+    @staticmethod
+    def _model_dir(model_name: str) -> Path:
+        if Path(model_name).is_dir():
+            return Path(model_name)
+        from huggingface_hub import snapshot_download
+
+        return Path(snapshot_download(model_name, allow_patterns=["*.json", "model.onnx", "onnx/model.onnx"]))
+
+    @staticmethod
+    def _quantized(model_path: Path) -> Path:
+        # Quantifié une fois, à côté du modèle d'origine
+        int8_path = model_path.with_name("model_int8.onnx")
+        if not int8_path.exists():
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            print(f"[EMBED] Quantification int8 de {model_path}")
+            quantize_dynamic(str(model_path), str(int8_path), weight_type=QuantType.QInt8)
+        return int8_path
+
+    def encode(self, texts):
+        import numpy as np
+
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        # Moyenne des tokens réels (padding exclu), puis normalisation L2
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+
+_ENCODERS = {
+    "sentence-transformers": SentenceTransformerEncoder,
+    "onnx": OnnxEncoder,
+}
+
+
+def create_local_embeddings(backend: str, model: str = None, int8: bool = False, workers: int = None):
+    """Embeddings locaux du backend demandé ; threads répartis selon les cœurs de la machine."""
+    if backend not in _ENCODERS:
+        raise ValueError(f"Backend local inconnu : {backend} (choix : {', '.join(LOCAL_BACKENDS)})")
+    model = model or DEFAULT_LOCAL_MODEL
+    workers, threads = plan_threads(workers=workers)
+    encoder = _ENCODERS[backend](model, int8=int8, threads=threads)
+    print(f"[EMBED] {backend} : {model}{' (int8)' if int8 else ''}, {workers} lot(s) × {threads} thread(s)")
+    return LocalEmbeddings(encoder, backend, model, int8=int8, workers=workers)
+
+
+# ====== Cohérence index / questions ======
+
+def _innermost(embeddings):
+    # Traverse les caches (CachedEmbeddings, QueryEmbeddingCache)
+    while hasattr(embeddings, "underlying"):
+        embeddings = embeddings.underlying
+    return embeddings
+
+
+def embedding_spec(embeddings) -> dict:
+    """Backend / modèle des embeddings, tels qu'inscrits dans le manifest de l'index."""
+    inner = _innermost(embeddings)
+    backend = getattr(inner, "backend", None) or _BACKEND_BY_CLASS.get(type(inner).__name__, type(inner).__name__)
+    model = getattr(inner, "model_name", None) or getattr(inner, "model", None) or type(inner).__name__
+    return {
+        "embedding_backend": backend,
+        "embedding_model": str(model),
+        "embedding_int8": bool(getattr(inner, "int8", False)),
+    }
+
+
+def check_embedding_spec(manifest: dict, embeddings):
+    """Lève EmbeddingMismatchError si l'index a été construit avec d'autres embeddings."""
+    current = embedding_spec(embeddings)
+    recorded = {key: manifest[key] for key in SPEC_KEYS if key in manifest}
+    if not recorded:
+        # Index antérieur à l'inscription du backend : toujours construit avec OpenAI
+        if current["embedding_backend"] in LOCAL_BACKENDS:
+            raise EmbeddingMismatchError(
+                "Index construit avec les embeddings OpenAI, backend configuré : "
+                f"{current['embedding_backend']}. Relancer build_index.py --full."
+            )
+        return
+    if any(recorded[key] != current[key] for key in recorded):
+        raise EmbeddingMismatchError(
+            f"Index construit avec {_describe(recorded)}, embeddings configurés : {_describe(current)}. "
+            "Relancer build_index.py --full, ou revenir au backend de l'index (LITTERA_EMBEDDING_BACKEND)."
+        )
+
+
+def _describe(spec: dict) -> str:
+    text = f"{spec.get('embedding_backend')} / {spec.get('embedding_model')}"
+    return text + (" (int8)" if spec.get("embedding_int8") else "")
@@ -0,0 +1,340 @@
+# src/embedding_cache.py
+"""
+Cache disque des embeddings, adressé par le contenu.
+
+Clé = sha256(nom du modèle + texte du chunk) → un chunk déjà vu n'est plus
+jamais renvoyé à l'API, que ce soit depuis build_index.py, les uploads de
+app.py ou les questions de rag_pipeline.py.
+
+Stockage SQLite (mode WAL) : plusieurs threads et processus peuvent lire
+et écrire en même temps. Le cache est borné en nombre d'entrées, les
+moins récemment utilisées sont supprimées en premier (LRU).
+
+Une lecture n'écrit rien : les dates d'accès sont gardées en mémoire et
+écrites par lots (ou juste avant une éviction), et le nombre d'entrées est
+suivi par un compteur, recompté en SQL de temps en temps (les autres
+processus écrivent aussi). L'ordre LRU est donc approximatif, à quelques
+secondes près.
+
+Devant lui, QueryEmbeddingCache garde en mémoire les embeddings des
+dernières questions : une question reposée (rerun Streamlit, changement
+du slider top_k) ne coûte plus aucun appel.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = BASE_DIR / "data/cache/embeddings.sqlite"
+DEFAULT_MAX_ENTRIES = 500_000
+
+# Limite de variables par requête SQLite
+_SQL_BATCH = 500
+# Dates d'accès en attente : écrites par lots de cette taille, ou après ce délai
+TOUCH_FLUSH_KEYS = 1000
+TOUCH_FLUSH_SECONDS = 30.0
+# Insertions entre deux vrais COUNT(*) (compteur approximatif entre les deux)
+RECOUNT_EVERY = 10_000
+# Questions absentes du cache embeddées en même temps par embed_queries
+QUERY_WORKERS = 8
+
+
+def embedding_key(model_name: str, text: str) -> str:
+    """Clé du cache pour un texte donné et un modèle d'embeddings."""
+    return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def _model_name_of(embeddings) -> str:
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None)
+    return str(model or type(embeddings).__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """Enveloppe un objet Embeddings LangChain avec le cache disque."""
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        cache_path: Path = DEFAULT_CACHE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        model_name: str = None,
+    ):
+        self.underlying = underlying
+        self.cache_path = Path(cache_path)
+        self.max_entries = max_entries
+        self.model_name = model_name or _model_name_of(underlying)
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self._touched = {}  # clé -> date d'accès pas encore écrite
+        self._last_flush = time.monotonic()
+        self._entries = 0  # approximatif, voir _store
+        self._inserts_since_count = 0
+        self._cache_lock = threading.Lock()
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)"
+        )
+        conn.commit()
+        (self._entries,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    # ---- Connexion SQLite (une par thread) ----
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.cache_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---- Lecture / écriture ----
+
+    def _lookup(self, keys):
+        found = {}
+        conn = self._conn()
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), _SQL_BATCH):
+            batch = unique_keys[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                batch,
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        # Date d'accès (LRU) : en mémoire, écrite plus tard par lot
+        if found:
+            now = time.time()
+            with self._cache_lock:
+                self._touched.update(dict.fromkeys(found, now))
+                due = (len(self._touched) >= TOUCH_FLUSH_KEYS
+                       or time.monotonic() - self._last_flush >= TOUCH_FLUSH_SECONDS)
+            if due:
+                self._flush_touched()
+        return found
+
+    def _flush_touched(self):
+        with self._cache_lock:
+            touched, self._touched = self._touched, {}
+            self._last_flush = time.monotonic()
+        if not touched:
+            return
+        conn = self._conn()
+        conn.executemany(
+            "UPDATE embeddings SET last_access = ? WHERE key = ?",
+            [(when, key) for key, when in touched.items()],
+        )
+        conn.commit()
+
+    def _store(self, items):
+        if not items:
+            return
+        now = time.time()
+        conn = self._conn()
+        # Même clé écrite en même temps par un autre thread / processus : même
+        # vecteur, la ligne existante est gardée (et pas comptée deux fois)
+        inserted = conn.executemany(
+            "INSERT INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO NOTHING",
+            [
+                (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for key, vector in items
+            ],
+        ).rowcount
+        conn.commit()
+        with self._cache_lock:
+            self._entries += inserted
+            self._inserts_since_count += inserted
+            recount = self._inserts_since_count >= RECOUNT_EVERY
+            over = self._entries > self.max_entries
+        if recount or over:
+            self._evict(recount)
+
+    def _evict(self, recount: bool = False):
+        conn = self._conn()
+        if recount:
+            (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            with self._cache_lock:
+                self._entries, self._inserts_since_count = count, 0
+        excess = self._entries - self.max_entries
+        if excess <= 0:
+            return
+        # Les accès récents doivent être sur disque avant de choisir les plus anciens
+        self._flush_touched()
+        deleted = conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (excess,),
+        ).rowcount
+        conn.commit()
+        with self._cache_lock:
+            self._entries -= deleted
+
+    def _count(self, hits: int, misses: int):
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+
+    # ---- Interface Embeddings ----
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        keys = [embedding_key(self.model_name, t) for t in texts]
+        cached = self._lookup(keys)
+
+        # Textes manquants (dédupliqués) → un seul appel à l'API
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            self._store(new_items)
+            cached.update(new_items)
+
+        self._count(hits=len(texts) - len(missing), misses=len(missing))
+        return [list(cached[key]) for key in keys]
+
+    def embed_query(self, text):
+        key = embedding_key(self.model_name, text)
+        cached = self._lookup([key])
+        if key in cached:
+            self._count(hits=1, misses=0)
+            return cached[key]
+
+        vector = self.underlying.embed_query(text)
+        self._store([(key, vector)])
+        self._count(hits=0, misses=1)
+        return list(vector)
+
+    # ---- Statistiques ----
+
+    def stats(self) -> dict:
+        """
+        Hits/misses depuis le démarrage du processus + taille du cache
+        (compteur approximatif, sans COUNT(*) : voir _store).
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+        }
+
+
+class QueryEmbeddingCache(Embeddings):
+    """
+    Cache LRU en mémoire des embeddings de questions, avec durée de vie (TTL).
+    La clé du cache est la question normalisée (espaces, casse) :
+    "  Data  Governance ?" et "data governance ?" partagent la même entrée.
+    C'est la question telle que posée qui est embeddée, toujours par
+    embed_query (préfixe de question des modèles e5 / bge).
+    Les embeddings de documents passent directement à l'objet enveloppé.
+    """
+
+    def __init__(self, underlying: Embeddings, max_entries: int = 1024, ttl: float = 3600.0):
+        self.underlying = underlying
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # question normalisée -> (date, vecteur)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split()).lower()
+
+    def embed_query(self, text):
+        key = self.normalize(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+
+        vector = tuple(self.underlying.embed_query(text))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = (now, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return list(vector)
+
+    def embed_queries(self, texts):
+        """
+        Plusieurs questions d'un coup : les absentes du cache sont embeddées
+        en parallèle (les embeddings locaux regroupent ces embed_query
+        simultanés en un seul passage).
+        """
+        texts = list(texts)
+        keys = [self.normalize(t) for t in texts]
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+            self.hits += sum(1 for key in keys if key in found)
+
+        # Une question par clé manquante, telle que posée la première fois
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            if len(missing) == 1:
+                vectors = [self.underlying.embed_query(text) for text in missing.values()]
+            else:
+                with ThreadPoolExecutor(max_workers=min(len(missing), QUERY_WORKERS)) as pool:
+                    vectors = list(pool.map(self.underlying.embed_query, missing.values()))
+            with self._lock:
+                self.misses += len(missing)
+                for key, vector in zip(missing, vectors):
+                    found[key] = tuple(vector)
+                    self._entries[key] = (now, found[key])
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return [list(found[key]) for key in keys]
+
+    def embed_documents(self, texts):
+        return self.underlying.embed_documents(texts)
+
+    def stats(self) -> dict:
+        """Stats du cache de questions, plus celles du cache disque enveloppé."""
+        stats = self.underlying.stats() if hasattr(self.underlying, "stats") else {}
+        return {
+            **stats,
+            "query_hits": self.hits,
+            "query_misses": self.misses,
+            "query_entries": len(self._entries),
+        }
@@ -0,0 +1,22 @@
+# src/embedding_config.py
+"""
+Réglages d'embeddings lus dans l'environnement (.env), sans dépendance :
+partagés par rag_pipeline (dont l'import doit rester léger), build_index,
+stream_pipeline et embedding_backends.
+"""
+import os
+
+LOCAL_BACKENDS = ("sentence-transformers", "onnx")
+EMBEDDING_BACKENDS = ("openai",) + LOCAL_BACKENDS
+
+
+def embedding_settings() -> dict:
+    """Réglages d'embeddings lus dans l'environnement (normalisés et vérifiés)."""
+    backend = os.getenv("LITTERA_EMBEDDING_BACKEND", "openai").strip().lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Backend d'embeddings inconnu : {backend} (choix : {', '.join(EMBEDDING_BACKENDS)})")
+    return {
+        "backend": backend,
+        "model": os.getenv("LITTERA_EMBEDDING_MODEL", "").strip() or None,
+        "int8": os.getenv("LITTERA_EMBEDDING_INT8", "").strip().lower() in ("1", "true", "yes"),
+    }
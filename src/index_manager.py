@@ -0,0 +1,239 @@
+# src/index_manager.py
+"""
+Index FAISS "chaud" partagé par tout le processus.
+
+L'index est chargé une seule fois, puis servi à tous les appelants
+(CLI, app Streamlit, tests). Quand build_index.py publie un nouvel index,
+le manifest change : le nouvel index est rechargé en arrière-plan et
+remplacé d'un coup, sans bloquer les lecteurs.
+
+Chaque publication est écrite dans son propre dossier, versions/<build_id>,
+jamais modifié ensuite. Le manifest à la racine de l'index désigne le dossier
+servi : la bascule est un seul os.replace, un lecteur voit l'ancienne ou la
+nouvelle version, jamais un mélange des deux.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.json"
+INDEX_FILES = ("index.faiss", "index.pkl")
+VERSIONS_DIR = "versions"
+# Versions gardées sur disque : un lecteur qui vient de lire l'ancien manifest
+# trouve encore son dossier
+KEEP_VERSIONS = 3
+
+
+def read_manifest(index_dir: Path) -> dict:
+    """Lit le manifest de l'index ({} s'il n'existe pas ou est illisible)."""
+    try:
+        with open(Path(index_dir) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def resolve_index_dir(index_dir: Path, manifest: dict = None) -> Path:
+    """
+    Dossier qui contient les fichiers de la version publiée : celui que
+    désigne le manifest, ou `index_dir` lui-même (index publié avant les
+    dossiers de version).
+    """
+    index_dir = Path(index_dir)
+    if manifest is None:
+        manifest = read_manifest(index_dir)
+    version_dir = manifest.get("version_dir")
+    return index_dir / version_dir if version_dir else index_dir
+
+
+def read_index_signature(index_dir: Path):
+    """
+    Signature de la version de l'index sur disque :
+    - le build_id du manifest s'il existe,
+    - sinon les mtimes/tailles des fichiers de l'index,
+    - None si l'index n'existe pas.
+    """
+    index_dir = Path(index_dir)
+    build_id = read_manifest(index_dir).get("build_id")
+    if build_id:
+        return ("manifest", build_id)
+
+    sig = []
+    for name in INDEX_FILES:
+        try:
+            stat = (index_dir / name).stat()
+        except FileNotFoundError:
+            return None
+        sig.append((stat.st_mtime_ns, stat.st_size))
+    return ("mtime", tuple(sig))
+
+
+def _write_manifest_file(directory: Path, manifest: dict):
+    tmp_path = directory / (MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, directory / MANIFEST_NAME)
+
+
+def write_manifest(index_dir: Path, **extra) -> dict:
+    """Écrit atomiquement un nouveau manifest (nouveau build_id)."""
+    manifest = {
+        **extra,
+        "build_id": uuid.uuid4().hex,
+        "built_at": time.time(),
+    }
+    _write_manifest_file(Path(index_dir), manifest)
+    return manifest
+
+
+def publish_index(vectorstore, index_dir: Path, sidecars: dict = None, **manifest_extra) -> dict:
+    """
+    Publie un index FAISS de façon atomique :
+    - tous les fichiers (et une copie du manifest) sont écrits dans un
+      dossier temporaire, renommé en versions/<build_id> une fois complet ;
+    - le manifest racine, qui désigne ce dossier, est remplacé en dernier :
+      c'est lui qui bascule les lecteurs et déclenche le rechargement ;
+    - les versions au-delà des KEEP_VERSIONS plus récentes sont supprimées.
+
+    `sidecars` : {nom de fichier: fonction(chemin)} pour les fichiers publiés
+    avec l'index (ex: index BM25).
+    """
+    index_dir = Path(index_dir)
+    versions_dir = index_dir / VERSIONS_DIR
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    build_id = uuid.uuid4().hex
+    manifest = {
+        **manifest_extra,
+        "build_id": build_id,
+        "built_at": time.time(),
+        "version_dir": f"{VERSIONS_DIR}/{build_id}",
+    }
+    tmp_dir = versions_dir / f".tmp-{build_id}"
+    try:
+        vectorstore.save_local(str(tmp_dir))
+        for name, write in (sidecars or {}).items():
+            write(tmp_dir / name)
+        _write_manifest_file(tmp_dir, manifest)
+        os.rename(tmp_dir, versions_dir / build_id)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _write_manifest_file(index_dir, manifest)
+    _prune_versions(versions_dir, keep=build_id)
+    return manifest
+
+
+def _prune_versions(versions_dir: Path, keep: str):
+    # Les dossiers .tmp-* sont des publications en cours : on n'y touche pas
+    versions = [p for p in versions_dir.iterdir() if p.is_dir() and not p.name.startswith(".")]
+    versions.sort(key=lambda p: p.stat().st_mtime_ns, reverse=True)
+    for path in versions[KEEP_VERSIONS:]:
+        if path.name != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class IndexManager:
+    """
+    Garde en mémoire un objet chargé depuis `index_dir` (par `loader`)
+    et le recharge à chaud quand la signature de l'index change.
+
+    - get() ne bloque que pour le tout premier chargement ;
+    - un rechargement se fait dans un thread, l'ancien index reste servi
+      jusqu'à ce que le nouveau soit entièrement chargé ;
+    - le remplacement est une simple affectation (atomique).
+    """
+
+    def __init__(self, index_dir: Path, loader, check_interval: float = 2.0):
+        self.index_dir = Path(index_dir)
+        self.check_interval = check_interval
+        self._loader = loader
+        self._current = None  # (signature, objet chargé)
+        self._load_lock = threading.Lock()
+        self._last_check = 0.0
+
+    @property
+    def version(self):
+        """Signature de l'index actuellement servi (None si rien n'est chargé)."""
+        current = self._current
+        return current[0] if current else None
+
+    def peek(self):
+        """Index actuellement servi, sans le charger (None si rien n'est chargé)."""
+        current = self._current
+        return current[1] if current else None
+
+    def get(self):
+        """Renvoie l'index courant (le charge au premier appel)."""
+        current = self._current
+        if current is None:
+            with self._load_lock:
+                if self._current is None:
+                    self._current = self._load()
+                    self._last_check = time.monotonic()
+                return self._current[1]
+
+        self._maybe_reload(current[0])
+        return current[1]
+
+    def reload(self):
+        """Recharge l'index de façon synchrone et le renvoie."""
+        with self._load_lock:
+            self._current = self._load()
+            self._last_check = time.monotonic()
+            return self._current[1]
+
+    def _load(self, max_attempts: int = 3):
+        for _ in range(max_attempts):
+            manifest = read_manifest(self.index_dir)
+            version_dir = resolve_index_dir(self.index_dir, manifest)
+            if version_dir != self.index_dir:
+                # Dossier de version immuable : rien ne peut changer pendant
+                # la lecture, sauf sa suppression par une publication très
+                # rapprochée (on relit alors le manifest).
+                try:
+                    obj = self._loader(version_dir)
+                except FileNotFoundError:
+                    if version_dir.is_dir():
+                        raise
+                    continue
+                if version_dir.is_dir():
+                    return ("manifest", manifest["build_id"]), obj
+                continue
+
+            # Index publié avant les dossiers de version : fichiers remplacés
+            # un à un, on recommence si l'index a changé pendant la lecture.
+            sig_before = read_index_signature(self.index_dir)
+            obj = self._loader(self.index_dir)
+            sig_after = read_index_signature(self.index_dir)
+            if sig_before == sig_after:
+                return sig_after, obj
+        # Jamais de mélange de deux versions : l'appelant garde l'ancien index
+        raise RuntimeError(f"Index {self.index_dir} modifié pendant chacune des {max_attempts} lectures")
+
+    def _maybe_reload(self, current_sig):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        sig = read_index_signature(self.index_dir)
+        if sig is None or sig == current_sig:
+            return
+
+        # Un seul rechargement à la fois ; les lecteurs ne l'attendent jamais.
+        if not self._load_lock.acquire(blocking=False):
+            return
+        thread = threading.Thread(target=self._reload_in_background, daemon=True)
+        thread.start()
+
+    def _reload_in_background(self):
+        try:
+            self._current = self._load()
+        except Exception as e:
+            print(f"[INDEX] Rechargement impossible, on garde l'ancien index : {e}")
+        finally:
+            self._load_lock.release()
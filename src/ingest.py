@@ -1,60 +1,353 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import argparse
+import hashlib
 import json
+import os
+import re
 
 from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from chunker import chunker_id, split_documents
+from dedup import DEFAULT_THRESHOLD, clear_duplicate_marks, deduplicate_records, strip_headers_footers
+from tracing import current_span, span
 
 PDF_DIR = Path("data/pdf")
 OUT_PATH = Path("data/processed/chunks.json")
+# Pour chaque PDF : hash du contenu + ids de ses chunks (ingestion incrémentale)
+MANIFEST_PATH = Path("data/processed/ingest_manifest.json")
+# Quasi-doublons retirés de l'index à la dernière ingestion (à côté de chunks.json)
+DEDUP_REPORT_NAME = "dedup_report.json"
 
 
-def load_pdfs(pdf_dir: Path):
-    all_docs = []
-    for pdf_path in pdf_dir.glob("*.pdf"):
-        print(f"[LOAD] {pdf_path.name}")
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def make_chunk_id(file_hash: str, index: int) -> str:
+    """Id stable d'un chunk : ne dépend que du contenu du PDF et de sa position dans ce PDF."""
+    return f"{file_hash[:16]}-{index:05d}"
+
+
+_YEAR_RE = re.compile(r"(?<!\d)(19\d{2}|20\d{2})(?!\d)")
+# Dates PDF : "D:20110304120000" ou "2011-03-04T12:00:00"
+_PDF_DATE_RE = re.compile(r"^(?:D:)?(19\d{2}|20\d{2})")
+
+
+def extract_author_year(metadata: dict, file_name: str):
+    """
+    Auteur et année d'un article, pour les filtres de recherche :
+    - auteur : champ "author" des métadonnées PDF ;
+    - année : dans le nom du fichier (ex. "Otto_2011.pdf"), sinon date de création du PDF.
+    """
+    author = " ".join(str(metadata.get("author") or "").split())
+    match = _YEAR_RE.search(Path(file_name).stem)
+    if match is None:
+        created = str(metadata.get("creationdate") or metadata.get("creationDate") or "")
+        match = _PDF_DATE_RE.match(created.strip())
+    return author, int(match.group(1)) if match else None
+
+
+def load_pdf(pdf_path: Path):
+    print(f"[LOAD] {pdf_path.name}")
+    with span("ingest.load_pdf", file_name=pdf_path.name) as s:
         loader = PyMuPDFLoader(str(pdf_path))
         docs = loader.load()
         for d in docs:
             d.metadata["file_name"] = pdf_path.name
-        all_docs.extend(docs)
+            d.metadata["author"], d.metadata["year"] = extract_author_year(d.metadata, pdf_path.name)
+        if s.recording:
+            s.set(pages=len(docs), bytes=pdf_path.stat().st_size, chars=sum(len(d.page_content) for d in docs))
+    return docs
+
+
+def load_pdfs(pdf_dir: Path):
+    all_docs = []
+    for pdf_path in sorted(pdf_dir.glob("*.pdf")):
+        all_docs.extend(load_pdf(pdf_path))
     return all_docs
 
 
 def chunk_documents(docs):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1200,
-        chunk_overlap=200,
-        separators=["\n\n", "\n", ". ", " ", ""],
-    )
+    # Chunks mesurés en tokens, coupés entre deux phrases, jamais à cheval sur deux pages
     print(f"[CHUNK] {len(docs)} documents (pages) → chunking...")
-    chunks = splitter.split_documents(docs)
+    with span("ingest.chunk", pages=len(docs)) as s:
+        chunks = split_documents(docs)
+        s.set(chunks=len(chunks))
     print(f"[CHUNK] Total chunks: {len(chunks)}")
     return chunks
 
 
-def save_chunks(chunks, out_path: Path):
-    serializable = []
+def chunk_to_record(chunk) -> dict:
+    return {
+        "text": chunk.page_content,
+        "metadata": dict(chunk.metadata) if chunk.metadata else {},
+    }
+
+
+def process_pdf(pdf_path: Path, file_hash: str, strip_headers: bool = False):
+    """Parse + chunk un PDF et attribue les ids stables. Renvoie des records JSON."""
+    pages = load_pdf(pdf_path)
+    if strip_headers:
+        removed = strip_headers_footers(pages)
+        if removed["lines"]:
+            print(f"[HEADERS] {pdf_path.name} : {removed['lines']} lignes répétées retirées "
+                  f"({removed['tokens']} tokens)")
+    chunks = chunk_documents(pages)
+    records = []
     for i, c in enumerate(chunks):
-        meta = dict(c.metadata) if c.metadata else {}
-        meta["chunk_id"] = i
-        serializable.append(
-            {
-                "text": c.page_content,
-                "metadata": meta,
-            }
-        )
+        record = chunk_to_record(c)
+        record["metadata"]["chunk_id"] = make_chunk_id(file_hash, i)
+        records.append(record)
+    return records
+
+
+def _process_pdf_safe(pdf_path: Path, file_hash: str, strip_headers: bool = False):
+    # Une erreur sur un PDF (corrompu, chiffré...) ne doit pas arrêter le lot
+    try:
+        return process_pdf(pdf_path, file_hash, strip_headers), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def process_pdfs(pdf_paths, hashes: dict, workers: int = 1, strip_headers: bool = False):
+    """
+    Parse + chunk une liste de PDF, en série ou dans un pool de processus.
+    Génère (pdf_path, records, erreur) dans l'ordre des PDF donnés :
+    la sortie est identique quel que soit le nombre de workers.
+    """
+    if workers <= 1 or len(pdf_paths) <= 1:
+        for pdf_path in pdf_paths:
+            yield (pdf_path, *_process_pdf_safe(pdf_path, hashes[pdf_path.name], strip_headers))
+        return
+
+    # Fenêtre bornée de PDF en cours : la mémoire ne dépend pas de la taille du corpus
+    window = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        paths = iter(pdf_paths)
+        for pdf_path in paths:
+            pending.append((pdf_path, pool.submit(_process_pdf_safe, pdf_path, hashes[pdf_path.name], strip_headers)))
+            if len(pending) >= window:
+                break
+        while pending:
+            pdf_path, future = pending.popleft()
+            try:
+                records, error = future.result()
+            except Exception as e:  # worker tué (ex: crash natif de PyMuPDF)
+                records, error = None, f"{type(e).__name__}: {e}"
+            yield pdf_path, records, error
+
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append(
+                    (next_path, pool.submit(_process_pdf_safe, next_path, hashes[next_path.name], strip_headers))
+                )
+
+
+class ChunkWriter:
+    """
+    Écrit chunks.json au fil de l'eau : un tableau JSON avec un chunk par ligne,
+    relisible en streaming par iter_saved_chunks (et par un simple json.load).
+    """
+
+    def __init__(self, out_path: Path):
+        self.out_path = out_path
+        self.tmp_path = out_path.with_name(out_path.name + ".tmp")
+        self.count = 0
+        self._f = None
+
+    def __enter__(self):
+        self.out_path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.tmp_path, "w", encoding="utf-8")
+        self._f.write("[")
+        return self
 
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(serializable, f, ensure_ascii=False, indent=2)
-    print(f"[SAVE] {len(chunks)} chunks → {out_path}")
+    def write(self, record: dict):
+        self._f.write(",\n" if self.count else "\n")
+        self._f.write(json.dumps(record, ensure_ascii=False))
+        self.count += 1
 
+    def __exit__(self, exc_type, exc, tb):
+        self._f.write("\n]\n")
+        self._f.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.out_path)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
 
-def main():
-    docs = load_pdfs(PDF_DIR)
-    chunks = chunk_documents(docs)
-    save_chunks(chunks, OUT_PATH)
+
+def iter_saved_chunks(path: Path):
+    """Relit chunks.json chunk par chunk, sans charger tout le fichier."""
+    if not path.exists():
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        if f.readline().strip() != "[":
+            f.seek(0)
+            yield from json.load(f)
+            return
+        for line in f:
+            line = line.strip().rstrip(",")
+            if not line or line == "]":
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Ancien format (indent=2) : lecture complète
+                f.seek(0)
+                yield from json.load(f)
+                return
+
+
+def load_saved_chunks(path: Path):
+    return list(iter_saved_chunks(path))
+
+
+def save_chunks(records, out_path: Path):
+    with ChunkWriter(out_path) as writer:
+        for record in records:
+            writer.write(record)
+    print(f"[SAVE] {writer.count} chunks → {out_path}")
+
+
+def load_manifest(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def chunking_settings(strip_headers: bool = False) -> dict:
+    """Réglages du découpage, inscrits pour chaque PDF dans le manifest."""
+    return {"chunker": chunker_id(), "strip_headers": strip_headers}
+
+
+def plan_ingestion(pdf_paths, manifest: dict, strip_headers: bool = False):
+    """
+    Compare les PDF présents au manifest.
+    Renvoie (hashes, PDF nouveaux/modifiés, noms des PDF supprimés, ids de chunks obsolètes).
+    Un PDF découpé avec d'autres réglages (chunking_settings) est aussi à refaire.
+    """
+    hashes = {p.name: file_sha256(p) for p in pdf_paths}
+    settings = chunking_settings(strip_headers)
+    to_process = [
+        p for p in pdf_paths
+        if manifest.get(p.name, {}).get("sha256") != hashes[p.name]
+        or manifest[p.name].get("chunking") != settings
+    ]
+    deleted = sorted(name for name in manifest if name not in hashes)
+
+    stale_ids = []
+    for name in deleted + [p.name for p in to_process]:
+        stale_ids.extend(manifest.get(name, {}).get("chunk_ids", []))
+    return hashes, to_process, deleted, stale_ids
+
+
+def dedup_chunks(records, report_path: Path, threshold: float = DEFAULT_THRESHOLD):
+    """Marque les quasi-doublons (voir dedup.py) et écrit le rapport."""
+    with span("ingest.dedup", chunks=len(records)) as s:
+        report = deduplicate_records(records, threshold)
+        s.set(removed_chunks=report["removed_chunks"], removed_tokens=report["removed_tokens"])
+    print(f"[DEDUP] {report['removed_chunks']} quasi-doublons sur {report['chunks']} chunks "
+          f"({report['removed_tokens']} tokens) retirés de l'index → {report_path}")
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def main(workers: int = 1, dedup: bool = True, dedup_threshold: float = DEFAULT_THRESHOLD,
+         strip_headers: bool = False):
+    with span("ingest.run", workers=workers):
+        _run(workers, dedup, dedup_threshold, strip_headers)
+
+
+def _run(workers: int, dedup: bool, dedup_threshold: float, strip_headers: bool):
+    pdf_paths = sorted(PDF_DIR.glob("*.pdf"))
+    manifest = load_manifest(MANIFEST_PATH)
+    hashes, to_process, deleted, stale_ids = plan_ingestion(pdf_paths, manifest, strip_headers)
+
+    if not to_process and not deleted:
+        print(f"[SKIP] {len(pdf_paths)} PDF déjà à jour, rien à faire.")
+        return
+
+    current_span().set(pdfs=len(to_process), deleted=len(deleted), unchanged=len(pdf_paths) - len(to_process))
+    print(f"[PLAN] {len(to_process)} PDF nouveaux/modifiés, {len(deleted)} supprimés, "
+          f"{len(pdf_paths) - len(to_process)} inchangés")
+
+    # Chunks conservés : ceux des PDF inchangés (déjà dans le manifest)
+    by_file = {}
+    stale = set(stale_ids)
+    for record in iter_saved_chunks(OUT_PATH):
+        meta = record["metadata"]
+        if meta.get("file_name") in manifest and meta.get("chunk_id") not in stale:
+            by_file.setdefault(meta["file_name"], []).append(record)
+
+    failed = []
+    for pdf_path, records, error in process_pdfs(to_process, hashes, workers, strip_headers):
+        if error is not None:
+            # Retiré du manifest : il sera retenté au prochain passage
+            print(f"[ERREUR] {pdf_path.name} ignoré : {error}")
+            manifest.pop(pdf_path.name, None)
+            failed.append(pdf_path.name)
+            continue
+        by_file[pdf_path.name] = records
+        manifest[pdf_path.name] = {
+            "sha256": hashes[pdf_path.name],
+            "chunk_ids": [r["metadata"]["chunk_id"] for r in records],
+            "chunking": chunking_settings(strip_headers),
+        }
+    for name in deleted:
+        print(f"[DELETE] {name}")
+        del manifest[name]
+
+    # Même ordre qu'une ingestion complète : PDF triés, chunks dans l'ordre du PDF
+    records = [r for p in pdf_paths for r in by_file.get(p.name, [])]
+    if dedup:
+        # Doublons gardés dans chunks.json, mais pas indexés (build_index.py)
+        dedup_chunks(records, OUT_PATH.with_name(DEDUP_REPORT_NAME), dedup_threshold)
+    else:
+        clear_duplicate_marks(records)
+    with span("ingest.save", chunks=len(records)) as save_span:
+        save_chunks(records, OUT_PATH)
+        if save_span.recording:
+            save_span.set(bytes=OUT_PATH.stat().st_size)
+    current_span().set(chunks=len(records), failed=len(failed))
+    save_manifest(manifest, MANIFEST_PATH)
+    if failed:
+        print(f"[ERREUR] {len(failed)} PDF en échec : {', '.join(failed)}")
+
+    # Les chunks des PDF supprimés/modifiés sortent aussi de l'index FAISS (par id)
+    if stale_ids:
+        from build_index import remove_from_index
+        remove_from_index(stale_ids)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Ingestion des PDF (parsing + chunking)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="nombre de processus de parsing (0 = tous les cœurs)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="garder les quasi-doublons dans l'index")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="similarité de Jaccard à partir de laquelle deux chunks sont des doublons")
+    parser.add_argument("--strip-headers", action="store_true",
+                        help="retirer les en-têtes / pieds de page répétés de chaque PDF")
+    args = parser.parse_args()
+    main(
+        workers=args.workers or os.cpu_count(),
+        dedup=not args.no_dedup,
+        dedup_threshold=args.dedup_threshold,
+        strip_headers=args.strip_headers,
+    )
@@ -0,0 +1,262 @@
+# src/metadata_index.py
+"""
+Index des métadonnées des chunks, pour filtrer la recherche FAISS à la source.
+
+Une colonne par attribut, alignée sur les positions FAISS :
+- file_name, author : codes entiers + vocabulaire,
+- page, year : entiers (-1 si inconnu).
+
+Un filtre ({"file_name": ..., "author": ..., "year": (2015, 2020), "page": 3})
+se résout en tableau de positions par quelques opérations NumPy, puis est
+appliqué pendant la recherche FAISS (IDSelectorBatch dans SearchParameters) :
+pas de sur-récupération suivie d'un filtrage, et toujours k résultats s'il
+existe au moins k chunks qui passent le filtre. Le sélecteur d'un filtre déjà
+vu est réutilisé (selection()), pas reconstruit à chaque question.
+
+Un chunk gardé par la déduplication (dedup.py) vaut aussi pour ses doublons
+non indexés : chaque pointeur de "duplicates" ajoute une ligne (fichier,
+auteur, année, page) rattachée à la position du chunk gardé. Une position
+passe le filtre si l'une de ses lignes le passe en entier.
+
+Publié avec l'index (metadata.npz), comme l'index BM25.
+"""
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+METADATA_INDEX_NAME = "metadata.npz"
+# Filtres dont la sélection (positions + IDSelector) reste en mémoire
+SELECTION_CACHE_SIZE = 64
+
+FILTER_FIELDS = ("file_name", "author", "year", "page")
+
+
+def _encode(values):
+    """Valeurs texte → (vocabulaire trié, codes int32 ; -1 pour une valeur vide)."""
+    vocab = sorted({v for v in values if v})
+    lookup = {v: i for i, v in enumerate(vocab)}
+    codes = np.fromiter((lookup.get(v, -1) for v in values), dtype=np.int32, count=len(values))
+    return vocab, codes
+
+
+def _int_or_missing(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+def _range_mask(column: np.ndarray, value):
+    # Entier, (min, max) inclus (une borne peut valoir None), ou liste de valeurs
+    if isinstance(value, tuple):
+        low, high = value
+        mask = column >= 0
+        if low is not None:
+            mask &= column >= int(low)
+        if high is not None:
+            mask &= column <= int(high)
+        return mask
+    if isinstance(value, (list, set)):
+        return np.isin(column, [int(v) for v in value])
+    return column == int(value)
+
+
+def _filters_key(filters: dict) -> str:
+    # Un tuple (intervalle) reste distinct d'une liste (valeurs) ; un ensemble est trié
+    return repr(sorted((field, sorted(v) if isinstance(v, set) else v) for field, v in filters.items()))
+
+
+class Selection:
+    """Positions FAISS qui passent un filtre, avec leur IDSelector (construit une seule fois)."""
+
+    def __init__(self, mask: np.ndarray):
+        self.mask = mask
+        self.positions = np.flatnonzero(mask).astype(np.int64)
+        self.selector = faiss.IDSelectorBatch(self.positions)
+
+
+class MetadataIndex:
+    """
+    Colonnes de len(self) lignes (une par position FAISS), suivies des lignes
+    des doublons ; `duplicate_positions[j]` est la position de la ligne
+    len(self) + j.
+    """
+
+    def __init__(self, file_names, file_codes, authors, author_codes, years, pages, duplicate_positions=None):
+        self.file_names = list(file_names)
+        self.file_codes = file_codes
+        self.authors = list(authors)
+        self.author_codes = author_codes
+        self.years = years
+        self.pages = pages
+        if duplicate_positions is None:
+            duplicate_positions = np.zeros(0, dtype=np.int64)
+        self.duplicate_positions = duplicate_positions
+        self._selections = OrderedDict()  # clé du filtre -> Selection (LRU)
+        self._selections_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.file_codes) - len(self.duplicate_positions)
+
+    @classmethod
+    def build(cls, metadatas):
+        """`metadatas` : métadonnées des chunks, dans l'ordre des positions FAISS."""
+        rows = [m or {} for m in metadatas]
+        duplicate_positions = []
+        for position, m in enumerate(list(rows)):
+            for pointer in m.get("duplicates") or []:
+                rows.append(pointer)
+                duplicate_positions.append(position)
+
+        file_names, file_codes = _encode([str(m.get("file_name") or "") for m in rows])
+        authors, author_codes = _encode([str(m.get("author") or "").strip() for m in rows])
+        years = np.array([_int_or_missing(m.get("year")) for m in rows], dtype=np.int32)
+        pages = np.array(
+            [_int_or_missing(m.get("page", m.get("page_num"))) for m in rows], dtype=np.int32
+        )
+        return cls(
+            file_names, file_codes, authors, author_codes, years, pages,
+            np.array(duplicate_positions, dtype=np.int64),
+        )
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        n = len(vectorstore.index_to_docstore_id)
+        docs = (vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]) for i in range(n))
+        return cls.build([getattr(doc, "metadata", None) for doc in docs])
+
+    def save(self, path: Path):
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                file_names=np.frombuffer("\n".join(self.file_names).encode("utf-8"), dtype=np.uint8),
+                file_codes=self.file_codes,
+                authors=np.frombuffer("\n".join(self.authors).encode("utf-8"), dtype=np.uint8),
+                author_codes=self.author_codes,
+                years=self.years,
+                pages=self.pages,
+                duplicate_positions=self.duplicate_positions,
+            )
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path) as data:
+            file_names = data["file_names"].tobytes().decode("utf-8")
+            authors = data["authors"].tobytes().decode("utf-8")
+            return cls(
+                file_names=file_names.split("\n") if file_names else [],
+                file_codes=data["file_codes"],
+                authors=authors.split("\n") if authors else [],
+                author_codes=data["author_codes"],
+                years=data["years"],
+                pages=data["pages"],
+                # Absent des index publiés avant la déduplication
+                duplicate_positions=data["duplicate_positions"] if "duplicate_positions" in data.files else None,
+            )
+
+    def mask(self, filters: dict) -> np.ndarray:
+        """Masque booléen des positions qui passent tous les filtres."""
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"Filtre inconnu : {', '.join(sorted(unknown))} (choix : {', '.join(FILTER_FIELDS)})")
+
+        mask = np.ones(len(self.file_codes), dtype=bool)
+        for field, value in filters.items():
+            if value is None:
+                continue
+            if field == "file_name":
+                wanted = {value} if isinstance(value, str) else set(value)
+                codes = [i for i, name in enumerate(self.file_names) if name in wanted]
+                mask &= np.isin(self.file_codes, codes)
+            elif field == "author":
+                # Sous-chaîne, sans casse : "otto" trouve "Boris Otto; Vijay Khatri"
+                needles = [value] if isinstance(value, str) else list(value)
+                needles = [n.lower() for n in needles]
+                codes = [i for i, a in enumerate(self.authors) if any(n in a.lower() for n in needles)]
+                mask &= np.isin(self.author_codes, codes)
+            elif field == "year":
+                mask &= _range_mask(self.years, value)
+            elif field == "page":
+                mask &= _range_mask(self.pages, value)
+        # Lignes des doublons → position du chunk gardé
+        n = len(self)
+        positions = mask[:n].copy()
+        positions[self.duplicate_positions[mask[n:]]] = True
+        return positions
+
+    def positions(self, filters: dict) -> np.ndarray:
+        """Positions FAISS (int64, triées) des chunks qui passent les filtres."""
+        return np.flatnonzero(self.mask(filters)).astype(np.int64)
+
+    def selection(self, filters: dict) -> Selection:
+        """Sélection des chunks qui passent les filtres, gardée pour les filtres déjà vus."""
+        key = _filters_key(filters)
+        with self._selections_lock:
+            selection = self._selections.get(key)
+            if selection is not None:
+                self._selections.move_to_end(key)
+                return selection
+        selection = Selection(self.mask(filters))
+        with self._selections_lock:
+            self._selections[key] = selection
+            while len(self._selections) > SELECTION_CACHE_SIZE:
+                self._selections.popitem(last=False)
+        return selection
+
+    def values(self, field: str):
+        """Valeurs disponibles d'un attribut (pour proposer les filtres dans l'interface)."""
+        if field == "file_name":
+            return list(self.file_names)
+        if field == "author":
+            return list(self.authors)
+        column = self.years if field == "year" else self.pages
+        return sorted(int(v) for v in np.unique(column) if v >= 0)
+
+
+def _selector_params(index, selector, exhaustive: bool):
+    # Les SearchParameters remplacent les réglages de l'index : on reprend
+    # nprobe / efSearch courants, ou on les élargit pour une recherche exhaustive
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist if exhaustive else ivf.nprobe)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        ef = max(hnsw.efSearch, 4 * hnsw.efSearch if exhaustive else 0)
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _scan_positions(index, queries: np.ndarray, k: int, positions: np.ndarray):
+    """Recherche exacte parmi les vecteurs stockés aux `positions` (même métrique que l'index)."""
+    from mmr import reconstruct_vectors
+
+    vectors = reconstruct_vectors(index, positions)
+    distances, found = faiss.knn(queries, vectors, k, metric=index.metric_type)
+    ids = np.where(found >= 0, positions[np.maximum(found, 0)], -1)
+    return distances, ids
+
+
+def filtered_search(index, queries: np.ndarray, k: int, positions: np.ndarray, selector=None):
+    """
+    Recherche FAISS restreinte à `positions` (id selector ; `selector` : celui
+    d'une Selection, déjà construit).
+    Si un index approximatif renvoie moins de min(k, nb positions) résultats
+    (cellules IVF non visitées, graphe HNSW), la recherche est refaite en
+    élargissant, puis, s'il en manque encore, par un parcours exact des
+    seules positions filtrées.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    if selector is None:
+        selector = faiss.IDSelectorBatch(positions)
+    expected = min(k, len(positions))
+
+    distances, ids = index.search(queries, k, params=_selector_params(index, selector, exhaustive=False))
+    if expected and (ids[:, :expected] < 0).any():
+        distances, ids = index.search(queries, k, params=_selector_params(index, selector, exhaustive=True))
+    if expected and (ids[:, :expected] < 0).any():
+        # HNSW : même élargi, le graphe peut ne pas mener à assez de positions filtrées
+        distances, ids = _scan_positions(index, queries, k, positions)
+    return distances, ids
@@ -0,0 +1,149 @@
+# src/mmap_store.py
+"""
+Chargement de l'index FAISS en mémoire mappée (mmap), en lecture seule.
+
+FAISS.load_local lit tout index.faiss en RAM et désérialise le docstore
+(index.pkl) : chaque processus paie ce temps et garde sa propre copie.
+Ici, les vecteurs sont mappés depuis index.faiss et le docstore est écrit
+dans un format adressable directement sur disque :
+
+- docstore.jsonl          : un document par ligne {"id", "text", "metadata"}
+- docstore.offsets.npy    : position de début de chaque ligne (int64, n+1 valeurs)
+- docstore.ids.npy        : id du document à chaque position FAISS
+- docstore.ids_sorted.npy + docstore.ids_order.npy : ids triés → recherche binaire
+
+Les pages sont partagées entre processus via le cache du système et le
+démarrage ne dépend presque plus de la taille de l'index.
+"""
+import json
+import mmap
+from collections.abc import Mapping
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+DOCSTORE_NAME = "docstore.jsonl"
+
+
+def _sibling(path: Path, suffix: str) -> Path:
+    return path.with_name(path.name.replace(".jsonl", suffix))
+
+
+def write_mmap_docstore(vectorstore, path: Path):
+    """Écrit le docstore de `vectorstore` au format mmap (sidecar de publish_index)."""
+    path = Path(path)
+    n = len(vectorstore.index_to_docstore_id)
+    ids = [vectorstore.index_to_docstore_id[i] for i in range(n)]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    with open(path, "wb") as f:
+        for i, doc_id in enumerate(ids):
+            doc = vectorstore.docstore.search(doc_id)
+            line = json.dumps(
+                {"id": doc_id, "text": doc.page_content, "metadata": doc.metadata},
+                ensure_ascii=False,
+            ).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets[i + 1] = offsets[i] + len(line)
+
+    encoded = np.array([i.encode("utf-8") for i in ids], dtype=bytes) if ids else np.array([], dtype="S1")
+    order = np.argsort(encoded, kind="stable").astype(np.int64)
+    np.save(_sibling(path, ".offsets.npy"), offsets)
+    np.save(_sibling(path, ".ids.npy"), encoded)
+    np.save(_sibling(path, ".ids_sorted.npy"), encoded[order])
+    np.save(_sibling(path, ".ids_order.npy"), order)
+
+
+class MmapDocstore(Docstore):
+    """Docstore en lecture seule, lu à la demande depuis docstore.jsonl mappé."""
+
+    def __init__(self, path: Path):
+        path = Path(path)
+        self._file = open(path, "rb")
+        size = path.stat().st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.offsets = np.load(_sibling(path, ".offsets.npy"), mmap_mode="r")
+        self.ids = np.load(_sibling(path, ".ids.npy"), mmap_mode="r")
+        self._ids_sorted = np.load(_sibling(path, ".ids_sorted.npy"), mmap_mode="r")
+        self._ids_order = np.load(_sibling(path, ".ids_order.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, doc_id: str):
+        encoded = doc_id.encode("utf-8")
+        if len(encoded) > self._ids_sorted.dtype.itemsize:
+            return None
+        key = np.asarray(encoded, dtype=self._ids_sorted.dtype)
+        i = int(np.searchsorted(self._ids_sorted, key))
+        if i < len(self._ids_sorted) and self._ids_sorted[i] == key:
+            return int(self._ids_order[i])
+        return None
+
+    def document_at(self, position: int) -> Document:
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        record = json.loads(self._data[start:end])
+        return Document(id=record["id"], page_content=record["text"], metadata=record["metadata"])
+
+    def search(self, search: str):
+        position = self.position(search)
+        if position is None:
+            # Même convention que InMemoryDocstore
+            return f"ID {search} not found."
+        return self.document_at(position)
+
+    def delete(self, ids):
+        raise NotImplementedError("Index mappé en lecture seule : utiliser load_vectorstore() pour une copie modifiable.")
+
+
+class PositionIds(Mapping):
+    """index_to_docstore_id adossé au tableau mappé des ids (pas de dict à construire)."""
+
+    def __init__(self, ids: np.ndarray):
+        self._ids = ids
+
+    def __getitem__(self, position):
+        if not 0 <= int(position) < len(self._ids):
+            raise KeyError(position)
+        return self._ids[int(position)].decode("utf-8")
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(range(len(self._ids)))
+
+
+def has_mmap_layout(index_dir: Path) -> bool:
+    return (Path(index_dir) / DOCSTORE_NAME).exists()
+
+
+def read_index_mmap(path: Path, index_type: str = "flat"):
+    """Lit index.faiss en mémoire mappée, en lecture seule (repli sur une lecture normale)."""
+    # Les listes inversées IVF se mappent avec IO_FLAG_MMAP, les codes "plats"
+    # (Flat, SQ, HNSW) avec IO_FLAG_MMAP_IFC ; les deux ensemble échouent sur IVF.
+    if index_type.startswith("ivf"):
+        attempts = [faiss.IO_FLAG_MMAP, faiss.IO_FLAG_MMAP_IFC]
+    else:
+        attempts = [faiss.IO_FLAG_MMAP_IFC, faiss.IO_FLAG_MMAP]
+    for flags in attempts:
+        try:
+            return faiss.read_index(str(path), flags | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(str(path))
+
+
+def load_mmap_vectorstore(index_dir: Path, embeddings, index_type: str = "flat"):
+    """Vectorstore FAISS en lecture seule : vecteurs et docstore mappés depuis le disque."""
+    index_dir = Path(index_dir)
+    docstore = MmapDocstore(index_dir / DOCSTORE_NAME)
+    return FAISS(
+        embedding_function=embeddings,
+        index=read_index_mmap(index_dir / "index.faiss", index_type),
+        docstore=docstore,
+        index_to_docstore_id=PositionIds(docstore.ids),
+    )
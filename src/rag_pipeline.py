@@ -1,90 +1,563 @@
 # src/rag_pipeline.py
+"""
+Pipeline RAG : recherche dans l'index FAISS + génération par le LLM (OpenRouter).
+
+L'import est quasi instantané : les clients, les embeddings, les index et les
+caches sont créés au premier usage, et les bibliothèques lourdes (LangChain,
+FAISS, OpenAI, NumPy) ne sont importées qu'à ce moment-là. Les réglages sont
+regroupés dans `config`, modifiable avant le premier usage.
+"""
 import os
+import threading
+import weakref
+from dataclasses import dataclass, field
 from pathlib import Path
 
 # ⚠️ Workaround OpenMP (FAISS sous Windows)
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
 from dotenv import load_dotenv
-from openai import OpenAI
 
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings  # pour les embeddings uniquement
+from context_packing import pack_context
+from embedding_config import embedding_settings
+from index_manager import IndexManager, read_manifest, resolve_index_dir
+from tracing import span
 
 # ====== Chargement env & config ======
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv(BASE_DIR / ".env")
 
-# Clé OpenRouter
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-
-if OPENROUTER_API_KEY is None:
-    raise ValueError("OPENROUTER_API_KEY n'est pas défini dans le .env")
-
-# Modèle OpenRouter (modifiable à un seul endroit)
-OPENROUTER_MODEL = "deepseek/deepseek-chat-v3.1:free"
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+RETRIEVAL_MODES = ("dense", "hybrid", "mmr")
+
+
+@dataclass
+class RagConfig:
+    # Clé OpenRouter (vérifiée au premier appel du LLM, pas à l'import)
+    openrouter_api_key: str = field(default_factory=lambda: os.getenv("OPENROUTER_API_KEY"))
+    # Modèle OpenRouter (modifiable à un seul endroit)
+    openrouter_model: str = "deepseek/deepseek-chat-v3.1:free"
+    # Index FAISS déjà construit
+    index_dir: Path = BASE_DIR / "data/processed/index"
+    # Réglages de requête des index approximatifs (ignorés pour l'index exact)
+    # nprobe : cellules IVF visitées ; ef_search : largeur de recherche HNSW
+    search_params: dict = field(default_factory=lambda: {"nprobe": 16, "ef_search": 64})
+    # Budget du contexte envoyé au LLM (tokens tiktoken, sources comprises)
+    context_token_budget: int = 3000
+    # Cache sémantique des réponses : seuil de similarité cosinus entre questions
+    answer_cache_threshold: float = 0.95
+    answer_cache_max_entries: int = 5000
+    answer_cache_max_age: float = 7 * 24 * 3600
+    # Recherche : "dense" (FAISS seul), "hybrid" (BM25 + FAISS) ou "mmr" (FAISS + diversification)
+    retrieval_mode: str = "dense"
+    # Fusion des classements en mode hybride : "rrf" (par rangs) ou "linear" (scores normalisés)
+    fusion_method: str = "rrf"
+    # Poids (dense, lexical) dans la fusion
+    fusion_weights: tuple = (1.0, 1.0)
+    # Mode "mmr" : candidats récupérés avant la diversification, et compromis
+    # pertinence / diversité (1 : pertinence seule, 0 : diversité maximale)
+    mmr_fetch_k: int = 50
+    mmr_lambda: float = 0.5
+    # Embeddings : "openai" (API), "sentence-transformers" ou "onnx" (modèle local sur CPU).
+    # Doivent être ceux de l'index (inscrits dans son manifest par build_index.py)
+    # Mêmes valeurs par défaut que build_index.py (embedding_settings)
+    embedding_backend: str = field(default_factory=lambda: embedding_settings()["backend"])
+    embedding_model: str = field(default_factory=lambda: embedding_settings()["model"])
+    embedding_int8: bool = field(default_factory=lambda: embedding_settings()["int8"])
+
+
+config = RagConfig()
+
+
+# ====== Initialisation paresseuse ======
+
+def _make_client():
+    if not config.openrouter_api_key:
+        raise ValueError("OPENROUTER_API_KEY n'est pas défini dans le .env")
+    from openai import OpenAI
+
+    # Client OpenRouter (LLM)
+    return OpenAI(base_url=OPENROUTER_BASE_URL, api_key=config.openrouter_api_key)
+
+
+def _make_async_client():
+    if not config.openrouter_api_key:
+        raise ValueError("OPENROUTER_API_KEY n'est pas défini dans le .env")
+    from openai import AsyncOpenAI
+
+    # Client asynchrone (answer_questions : plusieurs appels LLM en parallèle)
+    return AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=config.openrouter_api_key)
+
+
+def _make_embeddings():
+    from embedding_cache import CachedEmbeddings, QueryEmbeddingCache
+
+    if config.embedding_backend == "openai":
+        from langchain_openai import OpenAIEmbeddings  # pour les embeddings uniquement
+
+        # Embeddings OpenAI (pour FAISS) - nécessite OPENAI_API_KEY dans .env
+        underlying = OpenAIEmbeddings(model=config.embedding_model) if config.embedding_model else OpenAIEmbeddings()
+    else:
+        from embedding_backends import create_local_embeddings
+
+        # Modèle local sur CPU (sentence-transformers ou onnxruntime)
+        underlying = create_local_embeddings(config.embedding_backend, config.embedding_model, config.embedding_int8)
+    # Derrière le cache disque partagé avec build_index.py et les uploads,
+    # et le cache mémoire des questions (mêmes embeddings pour le CLI et app.py)
+    return QueryEmbeddingCache(CachedEmbeddings(underlying))
+
+
+def _make_answer_cache():
+    from answer_cache import AnswerCache
+
+    # Réponses déjà générées (même modèle, mêmes sources, question proche)
+    return AnswerCache(
+        threshold=config.answer_cache_threshold,
+        max_entries=config.answer_cache_max_entries,
+        max_age=config.answer_cache_max_age,
+    )
 
-# Index FAISS déjà construit
-INDEX_DIR = BASE_DIR / "data/processed/index"
 
+def _check_embeddings(index_dir: Path):
+    from embedding_backends import check_embedding_spec
 
-# ====== Initialisation clients ======
+    # Questions et index dans le même espace de vecteurs, sinon la recherche ne veut rien dire
+    check_embedding_spec(read_manifest(index_dir), get_embeddings())
 
-# Client OpenRouter (LLM)
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=OPENROUTER_API_KEY,
-)
 
-# Embeddings OpenAI (pour FAISS) - nécessite OPENAI_API_KEY dans .env
-embeddings = OpenAIEmbeddings()
+def _load_vectorstore_from(index_dir: Path):
+    from langchain_community.vectorstores import FAISS
 
+    from ann_index import set_search_params
 
-def load_vectorstore():
-    """Charge l'index FAISS existant."""
+    _check_embeddings(index_dir)
     vectorstore = FAISS.load_local(
-        str(INDEX_DIR),
-        embeddings,
+        str(index_dir),
+        get_embeddings(),
         allow_dangerous_deserialization=True,  # pour FAISS sur disque
     )
+    set_search_params(vectorstore.index, **config.search_params)
+    _index_dirs[vectorstore] = index_dir
     return vectorstore
 
 
+def _load_shared_vectorstore_from(index_dir: Path):
+    from ann_index import set_search_params
+    from mmap_store import has_mmap_layout, load_mmap_vectorstore
+
+    # Vecteurs + docstore mappés en lecture seule : démarrage quasi instantané,
+    # pages partagées entre tous les processus de la machine
+    if has_mmap_layout(index_dir):
+        _check_embeddings(index_dir)
+        index_type = read_manifest(index_dir).get("index_type", "flat")
+        vectorstore = load_mmap_vectorstore(index_dir, get_embeddings(), index_type)
+        set_search_params(vectorstore.index, **config.search_params)
+        _index_dirs[vectorstore] = index_dir
+    else:
+        vectorstore = _load_vectorstore_from(index_dir)
+    # Fichiers annexes lus avec l'index (en arrière-plan lors d'un rechargement
+    # à chaud) plutôt qu'à la première requête qui en a besoin
+    _index_sidecar(vectorstore, _load_metadata_index_from)
+    if config.retrieval_mode == "hybrid":
+        _index_sidecar(vectorstore, _load_sparse_index_from)
+    return vectorstore
+
+
+def _load_sparse_index_from(index_dir: Path):
+    from sparse_index import SPARSE_INDEX_NAME, BM25Index
+
+    path = index_dir / SPARSE_INDEX_NAME
+    return BM25Index.load(path) if path.exists() else None
+
+
+def _load_metadata_index_from(index_dir: Path):
+    from metadata_index import METADATA_INDEX_NAME, MetadataIndex
+
+    path = index_dir / METADATA_INDEX_NAME
+    return MetadataIndex.load(path) if path.exists() else None
+
+
+# Dossier (de version) d'où vient chaque vectorstore chargé depuis l'index
+# publié, et ses fichiers annexes lus dans ce même dossier : l'index BM25 et
+# les métadonnées servis avec un vectorstore sont toujours ceux de son build,
+# même pendant un rechargement à chaud.
+_index_dirs = weakref.WeakKeyDictionary()
+_sidecars = weakref.WeakKeyDictionary()
+_sidecar_lock = threading.Lock()
+
+
+def _index_sidecar(vectorstore, loader):
+    """Fichier annexe de `vectorstore` chargé par `loader` (une fois), None s'il n'y en a pas."""
+    index_dir = _index_dirs.get(vectorstore)
+    if index_dir is None:  # vectorstore construit en mémoire (uploads, tests)
+        return None
+    with _sidecar_lock:
+        loaded = _sidecars.setdefault(vectorstore, {})
+        if loader not in loaded:
+            loaded[loader] = loader(index_dir)
+        return loaded[loader]
+
+
+_FACTORIES = {
+    "client": _make_client,
+    "async_client": _make_async_client,
+    "embeddings": _make_embeddings,
+    "answer_cache": _make_answer_cache,
+    # Index partagé par tout le processus (chargé une fois, rechargé à chaud),
+    # avec ses fichiers annexes (BM25, métadonnées) du même build
+    "index_manager": lambda: IndexManager(config.index_dir, _load_shared_vectorstore_from),
+}
+_lazy_lock = threading.RLock()
+
+
+def _lazy(name: str):
+    """Objet partagé `name`, créé au premier appel (remplaçable par simple affectation)."""
+    value = globals().get(name)
+    if value is None:
+        with _lazy_lock:
+            value = globals().get(name)
+            if value is None:
+                value = globals()[name] = _FACTORIES[name]()
+    return value
+
+
+def __getattr__(name):
+    # rag_pipeline.client, rag_pipeline.embeddings... restent accessibles comme avant
+    if name in _FACTORIES:
+        return _lazy(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_client():
+    return _lazy("client")
+
+
+def get_embeddings():
+    return _lazy("embeddings")
+
+
+def get_answer_cache():
+    return _lazy("answer_cache")
+
+
+def load_vectorstore():
+    """Charge une copie privée et modifiable de l'index FAISS (relue depuis le disque)."""
+    return _load_vectorstore_from(resolve_index_dir(config.index_dir))
+
+
+def get_vectorstore():
+    """Renvoie l'index FAISS partagé, à ne pas modifier (utiliser load_vectorstore pour une copie)."""
+    return _lazy("index_manager").get()
+
+
+# Index de métadonnées construits à la volée (copies privées, anciens index)
+_metadata_indexes = weakref.WeakKeyDictionary()
+
+
+def get_sparse_index(vectorstore):
+    """Index BM25 publié avec `vectorstore` (None s'il n'y en a pas)."""
+    return _index_sidecar(vectorstore, _load_sparse_index_from)
+
+
+def get_metadata_index(vectorstore):
+    """Index des métadonnées aligné sur les positions FAISS de `vectorstore`."""
+    from metadata_index import MetadataIndex
+
+    metadata_index = _index_sidecar(vectorstore, _load_metadata_index_from)
+    # Une copie privée modifiée depuis le chargement n'est plus alignée
+    if metadata_index is not None and len(metadata_index) == vectorstore.index.ntotal:
+        return metadata_index
+    # Copie privée modifiée, vectorstore en mémoire ou index sans metadata.npz : construit une fois par taille
+    cached = _metadata_indexes.get(vectorstore)
+    if cached is None or len(cached) != vectorstore.index.ntotal:
+        cached = MetadataIndex.from_vectorstore(vectorstore)
+        _metadata_indexes[vectorstore] = cached
+    return cached
+
+
 # ====== Brique RAG ======
 
-def retrieve_relevant_docs(question: str, k: int = 4):
-    """Fait la recherche sémantique dans FAISS et renvoie les meilleurs chunks."""
-    vectorstore = load_vectorstore()
-    docs = vectorstore.similarity_search(question, k=k)
+def search_docs(
+    vectorstore, question: str, k: int = 4, mode: str = None, fusion: str = None,
+    filters: dict = None, overlay=None, mmr_lambda: float = None,
+):
+    """
+    Recherche dans `vectorstore` :
+    - mode "dense" : similarité FAISS seule,
+    - mode "hybrid" : FAISS + BM25, classements fusionnés (RRF ou linéaire),
+    - mode "mmr" : config.mmr_fetch_k candidats FAISS, puis k passages pertinents
+      mais différents les uns des autres (voir mmr ; `mmr_lambda` : compromis).
+    `filters` : restriction par métadonnées, ex. {"author": "otto", "year": (2010, 2015)},
+    appliquée pendant la recherche FAISS (voir metadata_index).
+    `overlay` : petit index propre à la session (PDF uploadés), interrogé en plus
+    de `vectorstore` (index de base partagé, jamais modifié) ; top-k fusionné par distance.
+    """
+    mode = mode or config.retrieval_mode
+    fusion = fusion or config.fusion_method
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Mode de recherche inconnu : {mode}")
+
+    vector = embed_question(vectorstore.embedding_function, question)
+    with span("rag.search", mode=mode, k=k, filtered=bool(filters), overlay=overlay is not None) as s:
+        if filters or overlay is not None or mode == "mmr":
+            docs = _search_docs_batch(
+                vectorstore, [question], [vector], k, mode, fusion, filters, overlay, mmr_lambda
+            )[0]
+        else:
+            sparse_index = get_sparse_index(vectorstore) if mode == "hybrid" else None
+            if sparse_index is None:
+                docs = vectorstore.similarity_search_by_vector(vector, k=k)
+            else:
+                dense = vectorstore.similarity_search_with_score_by_vector(vector, k=_fetch_k(k))
+                docs = _fuse_hybrid(vectorstore, sparse_index, question, dense, k, fusion)
+        s.set(docs=len(docs))
     return docs
 
 
-def build_context_from_docs(docs):
-    """Construit un gros contexte texte à partir des docs récupérés."""
-    context_parts = []
-    for i, doc in enumerate(docs):
-        meta = doc.metadata or {}
-        file_name = meta.get("file_name", "unknown")
-        page = meta.get("page", meta.get("page_num", "?"))
-        context_parts.append(
-            f"[Source {i+1} | {file_name} | page {page}]\n{doc.page_content}"
+def embed_question(embeddings, question: str):
+    """Embedding de la question (étape tracée à part de la recherche FAISS)."""
+    with span("rag.embed_query") as s:
+        hits = getattr(embeddings, "hits", 0)
+        vector = embeddings.embed_query(question)
+        if s.recording:
+            s.set(cache_hits=getattr(embeddings, "hits", 0) - hits)
+    return vector
+
+
+def _fetch_k(k: int) -> int:
+    # Candidats récupérés de chaque côté avant la fusion hybride
+    return max(4 * k, 20)
+
+
+def _fuse_hybrid(vectorstore, sparse_index, question: str, dense, k: int, fusion: str, allowed=None):
+    """Fusionne les résultats FAISS (doc, distance) avec ceux de BM25 pour `question`."""
+    from sparse_index import linear_fusion, reciprocal_rank_fusion
+
+    lexical = sparse_index.search(question, k=_fetch_k(k), allowed=allowed)
+
+    if fusion == "linear":
+        # Distance L2 : plus petite = meilleure, d'où le signe
+        ranked = linear_fusion(
+            [[(doc.id, -float(dist)) for doc, dist in dense], lexical],
+            config.fusion_weights,
+        )
+    else:
+        ranked = reciprocal_rank_fusion(
+            [[doc.id for doc, _ in dense], [chunk_id for chunk_id, _ in lexical]],
+            list(config.fusion_weights),
         )
 
-    context = "\n\n".join(context_parts)
-    return context
+    by_id = {doc.id: doc for doc, _ in dense}
+    docs = []
+    for doc_id in ranked:
+        doc = by_id.get(doc_id) or vectorstore.docstore.search(doc_id)
+        if isinstance(doc, str):  # id absent de ce vectorstore
+            continue
+        docs.append(doc)
+        if len(docs) == k:
+            break
+    return docs
 
 
-def call_llm_with_openrouter(question: str, context: str) -> str:
+def _sparse_mask(sparse_index, vectorstore, mask):
+    # BM25 et métadonnées sont construits dans l'ordre des positions FAISS de
+    # l'index publié ; pour un autre vectorstore (copie privée), pas de côté lexical
+    n = len(mask)
+    ids = vectorstore.index_to_docstore_id
+    if n and len(sparse_index) == n and sparse_index.chunk_ids[0] == ids[0] and sparse_index.chunk_ids[-1] == ids[n - 1]:
+        return mask
+    return None
+
+
+def _dense_candidates(vectorstore, matrix, fetch_k: int, selection=None, with_vectors: bool = False):
     """
-    Appelle le LLM via OpenRouter (moonshotai/kimi-k2:free) avec un prompt RAG.
+    Recherche FAISS du lot (restreinte à la sélection de metadata_index s'il y en a une) → [(doc, distance)] par question.
+    `with_vectors` (diversification MMR) : [((vectorstore, position), distance, vecteur stocké dans l'index)] ;
+    le doc n'est lu dans le docstore que s'il est retenu (voir _mmr_docs).
+    """
+    import faiss
+    import numpy as np
+
+    from metadata_index import filtered_search
+
+    matrix = np.array(matrix, dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(matrix)
+    if selection is not None:
+        if not len(selection.positions):
+            return [[] for _ in matrix]
+        distances, positions = filtered_search(
+            vectorstore.index, matrix, fetch_k, selection.positions, selection.selector
+        )
+    else:
+        distances, positions = vectorstore.index.search(matrix, fetch_k)
+
+    stored = None
+    if with_vectors:
+        from mmr import reconstruct_vectors
+
+        # Une seule relecture pour tout le lot (les -1 sont ignorés plus bas)
+        stored = reconstruct_vectors(vectorstore.index, np.maximum(positions, 0).ravel())
+        stored = stored.reshape(*positions.shape, -1)
+
+    rows = []
+    for row, (row_distances, row_positions) in enumerate(zip(distances, positions)):
+        dense = []
+        for col, (dist, position) in enumerate(zip(row_distances, row_positions)):
+            if position == -1:  # moins de résultats que demandé
+                continue
+            if stored is not None:
+                dense.append(((vectorstore, int(position)), float(dist), stored[row, col]))
+                continue
+            doc = _doc_at(vectorstore, int(position))
+            if doc is not None:
+                dense.append((doc, float(dist)))
+        rows.append(dense)
+    return rows
+
+
+def _doc_at(vectorstore, position: int):
+    doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+    return None if isinstance(doc, str) else doc
+
+
+def _candidate_id(candidate):
+    # (doc, distance), ou ((vectorstore, position), distance, vecteur) pour MMR
+    first = candidate[0]
+    if isinstance(first, tuple):
+        vectorstore, position = first
+        return vectorstore.index_to_docstore_id[position]
+    return first.id
+
+
+def _merge_candidates(base, extra, fetch_k: int):
+    """
+    Candidats de l'index et de l'overlay, par distance croissante. Un chunk
+    présent dans les deux (PDF du corpus uploadé à nouveau) n'est gardé
+    qu'une fois : il ne prend pas deux places dans les k résultats.
+    """
+    merged, seen = [], set()
+    for candidate in sorted(base + extra, key=lambda c: c[1]):
+        chunk_id = _candidate_id(candidate)
+        if chunk_id is not None:
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+        merged.append(candidate)
+        if len(merged) == fetch_k:
+            break
+    return merged
+
+
+def search_docs_batch(
+    vectorstore, questions, vectors, k: int = 4, mode: str = None, fusion: str = None,
+    filters: dict = None, overlay=None, mmr_lambda: float = None,
+):
+    """
+    Comme search_docs pour plusieurs questions à la fois, à partir de leurs
+    embeddings déjà calculés : une seule recherche FAISS pour tout le lot.
     """
-    # Tu peux personnaliser ces meta-infos pour le ranking openrouter
-    extra_headers = {
-        "HTTP-Referer": "https://litteria.local",  # par ex. nom du projet
-        "X-Title": "Litteria - Academic RAG",
-    }
+    mode = mode or config.retrieval_mode
+    fusion = fusion or config.fusion_method
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Mode de recherche inconnu : {mode}")
+    if not questions:
+        return []
+    with span("rag.search_batch", mode=mode, k=k, questions=len(questions), filtered=bool(filters)) as s:
+        results = _search_docs_batch(vectorstore, questions, vectors, k, mode, fusion, filters, overlay, mmr_lambda)
+        s.set(docs=sum(len(docs) for docs in results))
+    return results
+
+
+def _search_docs_batch(vectorstore, questions, vectors, k, mode, fusion, filters, overlay, mmr_lambda=None):
+    sparse_index = get_sparse_index(vectorstore) if mode == "hybrid" else None
+    selection = allowed = None
+    if filters:
+        selection = get_metadata_index(vectorstore).selection(filters)
+        if sparse_index is not None:
+            allowed = _sparse_mask(sparse_index, vectorstore, selection.mask)
+            sparse_index = sparse_index if allowed is not None else None
+    if mode == "mmr":
+        fetch_k = max(config.mmr_fetch_k, k)
+    else:
+        fetch_k = k if sparse_index is None else _fetch_k(k)
+    with_vectors = mode == "mmr"
+
+    rows = _dense_candidates(vectorstore, vectors, fetch_k, selection, with_vectors)
+    if overlay is not None and overlay.index.ntotal:
+        # Index de session (uploads) : même modèle d'embeddings, même métrique L2,
+        # les distances des deux index se comparent directement
+        overlay_selection = get_metadata_index(overlay).selection(filters) if filters else None
+        overlay_rows = _dense_candidates(overlay, vectors, fetch_k, overlay_selection, with_vectors)
+        rows = [_merge_candidates(base, extra, fetch_k) for base, extra in zip(rows, overlay_rows)]
+
+    results = []
+    for question, vector, dense in zip(questions, vectors, rows):
+        if mode == "mmr":
+            results.append(_mmr_docs(vector, dense, k, config.mmr_lambda if mmr_lambda is None else mmr_lambda))
+        elif sparse_index is None:
+            results.append([doc for doc, _ in dense[:k]])
+        else:
+            results.append(_fuse_hybrid(vectorstore, sparse_index, question, dense, k, fusion, allowed))
+    return results
+
+
+def _mmr_docs(query_vector, dense, k: int, mmr_lambda: float):
+    """k docs choisis par MMR parmi les candidats [((vectorstore, position), distance, vecteur)]."""
+    import numpy as np
+
+    from mmr import mmr_select
+
+    if not dense:
+        return []
+    with span("rag.mmr", candidates=len(dense), k=k, mmr_lambda=mmr_lambda):
+        chosen = mmr_select(query_vector, np.stack([vector for _, _, vector in dense]), k, mmr_lambda)
+    docs = (_doc_at(*dense[i][0]) for i in chosen)
+    return [doc for doc in docs if doc is not None]
+
+
+def retrieve_relevant_docs(
+    question: str, k: int = 4, mode: str = None, filters: dict = None, mmr_lambda: float = None
+):
+    """
+    Fait la recherche (sémantique, hybride ou diversifiée par MMR) dans l'index
+    et renvoie les meilleurs chunks.
+    """
+    vectorstore = get_vectorstore()
+    docs = search_docs(vectorstore, question, k=k, mode=mode, filters=filters, mmr_lambda=mmr_lambda)
+    return docs
+
+
+def build_context_from_docs(docs, context_report: dict = None):
+    """
+    Construit le contexte texte à partir des docs récupérés : chunks voisins
+    fusionnés sans doublon, dans la limite de config.context_token_budget tokens.
+    Le rapport de pack_context (tokens, économies) est copié dans `context_report` s'il est fourni.
+    """
+    with span("rag.context", docs=len(docs), token_budget=config.context_token_budget) as s:
+        context, report = pack_context(docs, config.context_token_budget)
+        s.set(
+            context_tokens=report["context_tokens"],
+            saved_tokens=report["saved_tokens"],
+            merged_docs=report["merged_docs"],
+            bytes=len(context.encode("utf-8")),
+        )
+    if context_report is not None:
+        context_report.update(report)
+    return context
+
+
+# Tu peux personnaliser ces meta-infos pour le ranking openrouter
+LLM_EXTRA_HEADERS = {
+    "HTTP-Referer": "https://litteria.local",  # par ex. nom du projet
+    "X-Title": "Litteria - Academic RAG",
+}
 
+
+def build_llm_messages(question: str, context: str):
+    """Prompt RAG (system + user) envoyé au LLM."""
     system_prompt = (
         "Tu es un assistant académique. "
         "Tu dois répondre uniquement à partir des SOURCES fournies ci-dessous. "
@@ -100,45 +573,298 @@ def call_llm_with_openrouter(question: str, context: str) -> str:
         "et ajoute une section 'Références utilisées' à la fin."
     )
 
-    completion = client.chat.completions.create(
-        extra_headers=extra_headers,
-        model=OPENROUTER_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_content},
-        ],
-    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+    ]
 
-    return completion.choices[0].message.content
+
+def call_llm_with_openrouter(question: str, context: str) -> str:
+    """
+    Appelle le LLM via OpenRouter (moonshotai/kimi-k2:free) avec un prompt RAG.
+    """
+    with span("rag.llm", model=config.openrouter_model, stream=False) as s:
+        completion = get_client().chat.completions.create(
+            extra_headers=LLM_EXTRA_HEADERS,
+            model=config.openrouter_model,
+            messages=build_llm_messages(question, context),
+        )
+        answer = completion.choices[0].message.content
+        _record_llm_usage(s, completion, answer)
+    return answer
 
 
-def answer_question(question: str, k: int = 4):
+def stream_llm_with_openrouter(question: str, context: str):
+    """
+    Variante en streaming : renvoie les morceaux de texte au fur et à mesure
+    qu'OpenRouter les génère (le premier token arrive bien avant la fin).
+    """
+    with span("rag.llm", model=config.openrouter_model, stream=True) as s:
+        stream = get_client().chat.completions.create(
+            extra_headers=LLM_EXTRA_HEADERS,
+            model=config.openrouter_model,
+            messages=build_llm_messages(question, context),
+            stream=True,
+        )
+
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if s.recording:
+                    if not parts:
+                        s.set(first_token_seconds=round(s.elapsed(), 6))
+                    parts.append(delta)
+                yield delta
+        _record_llm_usage(s, None, "".join(parts))
+
+
+async def acall_llm_with_openrouter(question: str, context: str) -> str:
+    """Version asynchrone de call_llm_with_openrouter."""
+    with span("rag.llm", model=config.openrouter_model, stream=False) as s:
+        completion = await _lazy("async_client").chat.completions.create(
+            extra_headers=LLM_EXTRA_HEADERS,
+            model=config.openrouter_model,
+            messages=build_llm_messages(question, context),
+        )
+        answer = completion.choices[0].message.content
+        _record_llm_usage(s, completion, answer)
+    return answer
+
+
+async def astream_llm_with_openrouter(question: str, context: str):
+    """Version asynchrone de stream_llm_with_openrouter (générateur asynchrone)."""
+    with span("rag.llm", model=config.openrouter_model, stream=True) as s:
+        stream = await _lazy("async_client").chat.completions.create(
+            extra_headers=LLM_EXTRA_HEADERS,
+            model=config.openrouter_model,
+            messages=build_llm_messages(question, context),
+            stream=True,
+        )
+
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if s.recording:
+                    if not parts:
+                        s.set(first_token_seconds=round(s.elapsed(), 6))
+                    parts.append(delta)
+                yield delta
+        _record_llm_usage(s, None, "".join(parts))
+
+
+def _record_llm_usage(s, completion, answer: str):
+    # Tokens facturés renvoyés par l'API s'il y en a, sinon estimés sur la réponse
+    if not s.recording:
+        return
+    usage = getattr(completion, "usage", None)
+    if usage is not None and getattr(usage, "completion_tokens", None) is not None:
+        s.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+    else:
+        from tokenizer import count_tokens
+        s.set(completion_tokens=count_tokens(answer or ""))
+    s.set(bytes=len((answer or "").encode("utf-8")))
+
+
+def doc_ids(docs):
+    return [doc.id or str((doc.metadata or {}).get("chunk_id")) for doc in docs]
+
+
+def _index_version():
+    # Clé du cache de réponses : None tant qu'aucun index publié n'est chargé
+    version = _lazy("index_manager").version
+    return None if version is None else str(version)
+
+
+def generate_answer(question: str, docs) -> str:
+    """
+    Réponse du LLM à partir des docs récupérés, via le cache sémantique :
+    une question proche avec les mêmes sources renvoie la réponse déjà générée.
+    """
+    with span("rag.answer", docs=len(docs), stream=False) as s:
+        question_embedding = embed_question(get_embeddings(), question)  # déjà en cache après la recherche
+        ids = doc_ids(docs)
+        index_version = _index_version()
+        answer_cache = get_answer_cache()
+
+        answer = _lookup_answer(answer_cache, question_embedding, ids, index_version)
+        s.set(cache_hit=answer is not None)
+        if answer is not None:
+            return answer
+
+        context = build_context_from_docs(docs)
+        answer = call_llm_with_openrouter(question, context)
+        answer_cache.store(question, question_embedding, ids, config.openrouter_model, index_version, answer)
+    return answer
+
+
+def _lookup_answer(answer_cache, question_embedding, ids, index_version: str):
+    with span("rag.answer_cache") as s:
+        answer = answer_cache.lookup(question_embedding, ids, config.openrouter_model, index_version)
+        s.set(cache_hits=int(answer is not None))
+    return answer
+
+
+def stream_answer(question: str, docs, context_report: dict = None):
+    """
+    Comme generate_answer, mais renvoie la réponse morceau par morceau.
+    Une réponse en cache est renvoyée d'un bloc ; une réponse générée n'est
+    mise en cache qu'une fois le stream terminé.
+    `context_report` (dict) reçoit le rapport de pack_context du contexte
+    réellement envoyé au LLM ; il reste vide pour une réponse en cache.
+    """
+    with span("rag.answer", docs=len(docs), stream=True) as s:
+        question_embedding = embed_question(get_embeddings(), question)
+        ids = doc_ids(docs)
+        index_version = _index_version()
+        answer_cache = get_answer_cache()
+
+        answer = _lookup_answer(answer_cache, question_embedding, ids, index_version)
+        s.set(cache_hit=answer is not None)
+        if answer is not None:
+            yield answer
+            return
+
+        context = build_context_from_docs(docs, context_report)
+        parts = []
+        for delta in stream_llm_with_openrouter(question, context):
+            parts.append(delta)
+            yield delta
+        answer_cache.store(question, question_embedding, ids, config.openrouter_model, index_version, "".join(parts))
+
+
+async def astream_answer(question: str, docs, llm_slots=None):
+    """
+    Version asynchrone de stream_answer, pour le serveur HTTP : embedding,
+    cache et contexte (bloquants) passent dans un thread ; `llm_slots`
+    (asyncio.Semaphore) borne le nombre d'appels LLM en cours.
+    """
+    import asyncio
+    import contextlib
+
+    with span("rag.answer", docs=len(docs), stream=True) as s:
+        question_embedding = await asyncio.to_thread(embed_question, get_embeddings(), question)
+        ids = doc_ids(docs)
+        index_version = _index_version()
+        answer_cache = get_answer_cache()
+
+        answer = await asyncio.to_thread(_lookup_answer, answer_cache, question_embedding, ids, index_version)
+        s.set(cache_hit=answer is not None)
+        if answer is not None:
+            yield answer
+            return
+
+        context = await asyncio.to_thread(build_context_from_docs, docs)
+        parts = []
+        async with llm_slots or contextlib.nullcontext():
+            async for delta in astream_llm_with_openrouter(question, context):
+                parts.append(delta)
+                yield delta
+        await asyncio.to_thread(
+            answer_cache.store, question, question_embedding, ids, config.openrouter_model, index_version, "".join(parts)
+        )
+
+
+async def agenerate_answer(question: str, docs, llm_slots=None) -> str:
+    """Version asynchrone de generate_answer (réponse complète, via astream_answer)."""
+    return "".join([delta async for delta in astream_answer(question, docs, llm_slots)])
+
+
+def answer_question(question: str, k: int = 4, filters: dict = None):
     """
     Pipeline complet :
     - retrieve depuis FAISS
     - construire le contexte
-    - appeler le LLM
+    - appeler le LLM (ou reprendre une réponse en cache)
     - renvoyer la réponse finale + les docs utilisés
     """
-    docs = retrieve_relevant_docs(question, k=k)
+    docs = retrieve_relevant_docs(question, k=k, filters=filters)
 
     if not docs:
         return "Je n'ai trouvé aucune source pertinente pour répondre à cette question.", []
 
-    context = build_context_from_docs(docs)
-    answer = call_llm_with_openrouter(question, context)
+    answer = generate_answer(question, docs)
     return answer, docs
 
 
+async def answer_questions(
+    questions, k: int = 4, concurrency: int = 4, mode: str = None, filters: dict = None
+):
+    """
+    Répond à une liste de questions (jeu d'évaluation, FAQ d'un cours...) :
+    - les embeddings de toutes les questions d'un coup (cache, puis questions manquantes en parallèle),
+    - une seule recherche FAISS pour tout le lot,
+    - les appels LLM en parallèle, au plus `concurrency` à la fois.
+    Renvoie [(réponse, docs)] dans l'ordre des questions.
+    """
+    questions = list(questions)
+    if not questions:
+        return []
+
+    with span("rag.answer_batch", questions=len(questions), k=k, concurrency=concurrency):
+        return await _answer_questions(questions, k, concurrency, mode, filters)
+
+
+async def _answer_questions(questions, k, concurrency, mode, filters):
+    import asyncio
+
+    # Embedding, recherche, cache (SQLite) et contexte : bloquants, hors de
+    # la boucle asyncio, comme dans astream_answer
+    with span("rag.embed_queries", questions=len(questions)):
+        vectors = await asyncio.to_thread(get_embeddings().embed_queries, questions)
+    vectorstore = await asyncio.to_thread(get_vectorstore)
+    all_docs = await asyncio.to_thread(search_docs_batch, vectorstore, questions, vectors, k, mode, None, filters)
+    index_version = _index_version()
+    answer_cache = await asyncio.to_thread(get_answer_cache)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer_one(question, vector, docs):
+        if not docs:
+            return "Je n'ai trouvé aucune source pertinente pour répondre à cette question.", []
+
+        ids = doc_ids(docs)
+        answer = await asyncio.to_thread(_lookup_answer, answer_cache, vector, ids, index_version)
+        if answer is None:
+            context = await asyncio.to_thread(build_context_from_docs, docs)
+            async with semaphore:
+                answer = await acall_llm_with_openrouter(question, context)
+            await asyncio.to_thread(
+                answer_cache.store, question, vector, ids, config.openrouter_model, index_version, answer
+            )
+        return answer, docs
+
+    return await asyncio.gather(*(
+        answer_one(question, vector, docs)
+        for question, vector, docs in zip(questions, vectors, all_docs)
+    ))
+
+
 # ====== Test CLI ======
 
 if __name__ == "__main__":
     q = input("Pose ta question : ")
     print("[QUESTION]", q)
     print()
-    answer, docs = answer_question(q, k=4)
+    docs = retrieve_relevant_docs(q, k=4)
     print("[RÉPONSE]\n")
-    print(answer)
+    if docs:
+        report = {}
+        for delta in stream_answer(q, docs, report):
+            print(delta, end="", flush=True)
+        print()
+        if report:
+            print(f"\n[CONTEXT] {report['context_tokens']} tokens "
+                  f"({report['saved_tokens']} économisés sur {report['raw_tokens']}, "
+                  f"{report['merged_docs']} chunk(s) fusionné(s))")
+        else:
+            print("\n[CONTEXT] Réponse issue du cache (aucun contexte envoyé)")
+    else:
+        print("Je n'ai trouvé aucune source pertinente pour répondre à cette question.")
 
     print("\n[SOURCES UTILISÉES]")
     for i, d in enumerate(docs):
@@ -146,4 +872,6 @@ if __name__ == "__main__":
         file_name = meta.get("file_name", "unknown")
         page = meta.get("page", meta.get("page_num", "?"))
         print(f"- Source {i+1}: {file_name}, page {page}")
+        for dup in meta.get("duplicates") or []:
+            print(f"  aussi : {dup.get('file_name')}, page {dup.get('page', '?')}")
 
@@ -0,0 +1,265 @@
+# src/server.py
+"""
+Service HTTP de recherche / réponse, pour les autres outils (scripts
+d'évaluation, intégrations) : contrairement à app.py, rien n'est réexécuté
+à chaque requête.
+
+- GET  /health : état du service (index chargé, version, appels LLM en cours) ;
+- POST /search : {"question", "k", "mode", "filters", "mmr_lambda"} → passages trouvés ;
+- POST /answer : idem + "stream" ; réponse complète en JSON, ou en NDJSON
+  ligne par ligne ({"sources": [...]}, puis {"delta": "..."}, puis {"done": true}) ;
+- GET  /metrics : métriques Prometheus (si LITTERA_TRACING est actif).
+
+L'index, les embeddings et les caches de rag_pipeline sont chargés au
+démarrage et restent en mémoire (l'index est rechargé à chaud quand
+build_index.py en publie un nouveau). Les appels au LLM en cours sont bornés
+(--llm-concurrency) : les requêtes en plus attendent leur tour.
+
+Usage : python src/server.py --port 8000 [--llm-concurrency 8]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import rag_pipeline
+import tracing
+from tracing import span
+
+DEFAULT_K = 4
+MAX_K = 50
+LLM_CONCURRENCY = 8
+
+NO_SOURCE_ANSWER = "Je n'ai trouvé aucune source pertinente pour répondre à cette question."
+
+
+class LlmSlots:
+    """Sémaphore des appels LLM, avec compteurs (exposés par /health)."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
+        return False
+
+
+def warm_up():
+    """Charge l'index et les caches avant la première requête. Renvoie l'erreur éventuelle."""
+    try:
+        vectorstore = rag_pipeline.get_vectorstore()
+        rag_pipeline.get_metadata_index(vectorstore)
+        if rag_pipeline.config.retrieval_mode == "hybrid":
+            rag_pipeline.get_sparse_index(vectorstore)
+        rag_pipeline.get_answer_cache()
+    except Exception as e:
+        print(f"[SERVER] Index indisponible ({rag_pipeline.config.index_dir}) : {e}")
+        return str(e)
+    print(f"[SERVER] Index chargé : {vectorstore.index.ntotal} chunks")
+    return None
+
+
+# ====== Requêtes ======
+
+def parse_filters(raw):
+    """Filtres JSON → filtres de metadata_index ({"min": a, "max": b} devient l'intervalle (a, b))."""
+    if raw is None:
+        return None
+    if not isinstance(raw, dict):
+        raise HTTPException(400, "'filters' doit être un objet")
+    filters = {}
+    for field, value in raw.items():
+        if isinstance(value, dict):
+            value = (value.get("min"), value.get("max"))
+        filters[field] = value
+    return filters or None
+
+
+async def read_query(request: Request) -> dict:
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise HTTPException(400, "Corps JSON invalide")
+    if not isinstance(payload, dict):
+        raise HTTPException(400, "Le corps doit être un objet JSON")
+
+    question = str(payload.get("question") or "").strip()
+    if not question:
+        raise HTTPException(400, "Champ 'question' manquant")
+    try:
+        k = int(payload.get("k", DEFAULT_K))
+    except (TypeError, ValueError):
+        raise HTTPException(400, "'k' doit être un entier")
+    if not 1 <= k <= MAX_K:
+        raise HTTPException(400, f"'k' doit être entre 1 et {MAX_K}")
+    mmr_lambda = payload.get("mmr_lambda")
+    if mmr_lambda is not None:
+        try:
+            mmr_lambda = float(mmr_lambda)
+        except (TypeError, ValueError):
+            raise HTTPException(400, "'mmr_lambda' doit être un nombre")
+        if not 0.0 <= mmr_lambda <= 1.0:
+            raise HTTPException(400, "'mmr_lambda' doit être entre 0 et 1")
+    return {
+        "question": question,
+        "k": k,
+        "mode": payload.get("mode"),
+        "filters": parse_filters(payload.get("filters")),
+        "mmr_lambda": mmr_lambda,
+        "stream": bool(payload.get("stream", False)),
+    }
+
+
+def doc_to_json(doc) -> dict:
+    meta = doc.metadata or {}
+    return {
+        "id": doc.id or meta.get("chunk_id"),
+        "file_name": meta.get("file_name"),
+        "page": meta.get("page", meta.get("page_num")),
+        "text": doc.page_content,
+        "metadata": meta,
+    }
+
+
+async def retrieve(request: Request, query: dict):
+    if request.app.state.index_error is not None:
+        # Nouvel essai : l'index a peut-être été construit depuis le démarrage
+        request.app.state.index_error = await asyncio.to_thread(warm_up)
+        if request.app.state.index_error is not None:
+            raise HTTPException(503, "Index FAISS indisponible")
+    vectorstore = rag_pipeline.get_vectorstore()
+    try:
+        # Embedding de la question + FAISS : bloquants, hors de la boucle asyncio
+        return await asyncio.to_thread(
+            rag_pipeline.search_docs,
+            vectorstore,
+            query["question"],
+            k=query["k"],
+            mode=query["mode"],
+            filters=query["filters"],
+            mmr_lambda=query["mmr_lambda"],
+        )
+    except ValueError as e:  # mode ou filtre inconnu
+        raise HTTPException(400, str(e))
+
+
+# ====== Endpoints ======
+
+async def health(request: Request):
+    state = request.app.state
+    vectorstore = rag_pipeline._lazy("index_manager").peek()
+    body = {
+        "status": "ok" if vectorstore is not None else "unavailable",
+        "index_version": rag_pipeline._lazy("index_manager").version,
+        "chunks": vectorstore.index.ntotal if vectorstore is not None else 0,
+        "model": rag_pipeline.config.openrouter_model,
+        "llm_limit": state.llm_slots.limit,
+        "llm_in_flight": state.llm_slots.in_flight,
+        "llm_waiting": state.llm_slots.waiting,
+    }
+    return JSONResponse(body, status_code=200 if vectorstore is not None else 503)
+
+
+async def search(request: Request):
+    query = await read_query(request)
+    with span("http.search", k=query["k"]) as s:
+        docs = await retrieve(request, query)
+        s.set(docs=len(docs))
+    return JSONResponse({"question": query["question"], "sources": [doc_to_json(d) for d in docs]})
+
+
+async def answer(request: Request):
+    query = await read_query(request)
+    llm_slots = request.app.state.llm_slots
+    with span("http.search", k=query["k"]):
+        docs = await retrieve(request, query)
+    sources = [doc_to_json(d) for d in docs]
+
+    if not query["stream"]:
+        text = NO_SOURCE_ANSWER
+        if docs:
+            with span("http.answer", docs=len(docs)):
+                text = await rag_pipeline.agenerate_answer(query["question"], docs, llm_slots)
+        return JSONResponse({"question": query["question"], "answer": text, "sources": sources})
+
+    async def lines():
+        yield json.dumps({"sources": sources}, ensure_ascii=False) + "\n"
+        if not docs:
+            yield json.dumps({"delta": NO_SOURCE_ANSWER}, ensure_ascii=False) + "\n"
+        else:
+            try:
+                with span("http.answer", docs=len(docs), stream=True):
+                    async for delta in rag_pipeline.astream_answer(query["question"], docs, llm_slots):
+                        yield json.dumps({"delta": delta}, ensure_ascii=False) + "\n"
+            except Exception as e:
+                # Les en-têtes sont déjà partis : l'erreur est signalée dans le flux
+                print(f"[SERVER] Échec de la génération : {e}")
+                yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+                return
+        yield json.dumps({"done": True}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def metrics(request: Request):
+    if not tracing.is_enabled():
+        raise HTTPException(404, "Tracing désactivé (LITTERA_TRACING)")
+    return PlainTextResponse(tracing.metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+async def http_error(request: Request, exc: HTTPException):
+    return JSONResponse({"error": exc.detail}, status_code=exc.status_code)
+
+
+def create_app(llm_concurrency: int = LLM_CONCURRENCY, warm: bool = True) -> Starlette:
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        app.state.llm_slots = LlmSlots(llm_concurrency)
+        app.state.index_error = await asyncio.to_thread(warm_up) if warm else None
+        yield
+
+    return Starlette(
+        routes=[
+            Route("/health", health, methods=["GET"]),
+            Route("/search", search, methods=["POST"]),
+            Route("/answer", answer, methods=["POST"]),
+            Route("/metrics", metrics, methods=["GET"]),
+        ],
+        exception_handlers={HTTPException: http_error},
+        lifespan=lifespan,
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Service HTTP de recherche / réponse (index chargé en mémoire)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY,
+                        help="appels LLM simultanés au maximum (les autres attendent)")
+    parser.add_argument("--mode", choices=rag_pipeline.RETRIEVAL_MODES, help="mode de recherche par défaut")
+    args = parser.parse_args()
+
+    if args.mode:
+        rag_pipeline.config.retrieval_mode = args.mode
+    uvicorn.run(create_app(args.llm_concurrency), host=args.host, port=args.port, log_level="warning")
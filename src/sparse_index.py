@@ -0,0 +1,172 @@
+# src/sparse_index.py
+"""
+Index lexical BM25 construit à côté de l'index FAISS.
+
+Les poids BM25 de chaque couple (terme, chunk) sont précalculés au build :
+à la requête, il ne reste qu'à additionner des tranches de tableaux NumPy
+(addition indexée), ce qui coûte quelques millisecondes même sur des centaines
+de milliers de chunks.
+
+Stockage compact (.npz) : listes de postings au format CSR
+(indptr int64, doc int32, poids float32) + vocabulaire + ids des chunks.
+"""
+import re
+import unicodedata
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+SPARSE_INDEX_NAME = "bm25.npz"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_COMBINING_RE = re.compile(r"[\u0300-\u036f]")
+
+# Mots trop fréquents pour aider au classement (français + anglais)
+STOPWORDS = frozenset(
+    """
+    le la les un une des du de d l et ou en au aux ce ces cet cette est sont
+    qui que quoi dont où pour par sur dans avec sans plus ne pas se sa son ses
+    leur leurs nous vous ils elles il elle on a y
+    the a an and or of to in on for by with is are was were be been this that
+    these those it its as at from not but which
+    """.split()
+)
+
+
+def tokenize(text: str):
+    """Minuscules, sans accents, mots alphanumériques hors mots vides."""
+    text = text.lower()
+    if not text.isascii():
+        text = _COMBINING_RE.sub("", unicodedata.normalize("NFKD", text))
+    return [t for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, vocab, indptr, doc_ids, weights, chunk_ids, k1=1.5, b=0.75):
+        self.vocab = vocab  # terme -> id
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.chunk_ids = chunk_ids
+        self.k1 = k1
+        self.b = b
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, texts, chunk_ids, k1: float = 1.5, b: float = 0.75):
+        chunk_ids = [str(c) for c in chunk_ids]
+        n_docs = len(chunk_ids)
+
+        # Couples (terme, chunk) de tout le corpus, puis comptage vectorisé
+        vocab = {}
+        term_col = array("q")
+        doc_len = np.zeros(n_docs, dtype=np.float32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[doc] = len(tokens)
+            term_col.extend([vocab.setdefault(t, len(vocab)) for t in tokens])
+        doc_col = np.repeat(np.arange(n_docs, dtype=np.int64), doc_len.astype(np.int64))
+
+        stride = max(n_docs, 1)
+        keys = np.frombuffer(term_col, dtype=np.int64) * stride + doc_col
+        keys, tf = np.unique(keys, return_counts=True)  # trié par terme puis par chunk
+        terms = keys // stride
+        docs = (keys % stride).astype(np.int32)
+
+        df = np.bincount(terms, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+
+        avg_len = float(doc_len.mean()) if n_docs else 0.0
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        tf = tf.astype(np.float32)
+        norm = k1 * (1.0 - b + b * doc_len[docs] / max(avg_len, 1e-9))
+        weights = (idf[terms] * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32)
+
+        return cls(vocab, indptr, docs, weights, chunk_ids, k1, b)
+
+    def save(self, path: Path):
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                chunk_ids=np.frombuffer("\n".join(self.chunk_ids).encode("utf-8"), dtype=np.uint8),
+                indptr=self.indptr,
+                doc_ids=self.doc_ids,
+                weights=self.weights,
+                params=np.asarray([self.k1, self.b], dtype=np.float64),
+            )
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path) as data:
+            terms = data["terms"].tobytes().decode("utf-8")
+            chunk_ids = data["chunk_ids"].tobytes().decode("utf-8")
+            k1, b = data["params"].tolist()
+            return cls(
+                vocab={t: i for i, t in enumerate(terms.split("\n"))} if terms else {},
+                indptr=data["indptr"],
+                doc_ids=data["doc_ids"],
+                weights=data["weights"],
+                chunk_ids=chunk_ids.split("\n") if chunk_ids else [],
+                k1=k1,
+                b=b,
+            )
+
+    def search(self, query: str, k: int = 10, allowed: np.ndarray = None):
+        """
+        Renvoie les k meilleurs (chunk_id, score BM25).
+        `allowed` : masque booléen optionnel des chunks autorisés (filtre de métadonnées).
+        """
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids or not len(self):
+            return []
+
+        # Un chunk apparaît au plus une fois par liste de postings :
+        # une addition indexée par terme suffit (pas de doublons à cumuler)
+        scores = np.zeros(len(self), dtype=np.float32)
+        for t in term_ids:
+            start, end = self.indptr[t], self.indptr[t + 1]
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        if allowed is not None:
+            scores[~allowed] = 0
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.chunk_ids[i], float(scores[i])) for i in top]
+
+
+# ====== Fusion des classements dense + lexical ======
+
+def reciprocal_rank_fusion(rankings, weights=None, k: int = 60):
+    """RRF : score(id) = Σ poids / (k + rang). `rankings` = listes d'ids triées."""
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    for ranking, w in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + w / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def linear_fusion(scored_lists, weights):
+    """
+    Combinaison linéaire de scores normalisés min-max dans chaque liste.
+    `scored_lists` = listes de (id, score) où un score plus grand est meilleur.
+    """
+    scores = {}
+    for scored, w in zip(scored_lists, weights):
+        if not scored:
+            continue
+        values = np.asarray([s for _, s in scored], dtype=np.float64)
+        lo, hi = values.min(), values.max()
+        span = hi - lo if hi > lo else 1.0
+        for (doc_id, _), v in zip(scored, values):
+            scores[doc_id] = scores.get(doc_id, 0.0) + w * (v - lo) / span
+    return sorted(scores, key=scores.get, reverse=True)
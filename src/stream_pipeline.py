@@ -0,0 +1,264 @@
+# src/stream_pipeline.py
+"""
+Pipeline PDF → FAISS en streaming, à mémoire bornée.
+
+Étapes en générateurs : parse → chunk → quasi-doublons → embedding par
+batchs → ajout à l'index. Le parsing tourne dans un thread producteur (file
+d'attente bornée) pendant que le thread principal attend les réponses de
+l'API d'embeddings. Les chunks sont écrits dans chunks.json au fil de l'eau.
+
+Les quasi-doublons sont marqués comme par ingest.py (voir dedup.py) : gardés
+dans chunks.json, jamais embeddés ni indexés. La liste des doublons de chaque
+chunk gardé n'est connue qu'à la fin : elle est alors ajoutée à son document
+dans l'index et à chunks.json (relu et réécrit en flux).
+
+Usage : python src/stream_pipeline.py [--batch-size 256] [--workers 4] [--no-dedup]
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(BASE_DIR / ".env")
+
+from langchain_community.vectorstores import FAISS
+from langchain_openai import OpenAIEmbeddings
+
+import ingest
+from build_index import index_sidecars
+from dedup import DEFAULT_THRESHOLD, NearDuplicateFilter, duplicate_pointer, is_duplicate
+from embedding_backends import create_local_embeddings, embedding_settings, embedding_spec
+from embedding_cache import CachedEmbeddings
+from index_manager import publish_index
+from tokenizer import get_encoding
+
+INDEX_DIR = Path("data/processed/index")
+
+_DONE = object()
+
+
+def iter_pdf_records(pdf_paths, hashes: dict, manifest: dict, workers: int = 1):
+    """Étapes parse + chunk : génère les chunks PDF par PDF et remplit le manifest."""
+    for pdf_path, records, error in ingest.process_pdfs(pdf_paths, hashes, workers):
+        if error is not None:
+            print(f"[ERREUR] {pdf_path.name} ignoré : {error}")
+            continue
+        manifest[pdf_path.name] = {
+            "sha256": hashes[pdf_path.name],
+            "chunk_ids": [r["metadata"]["chunk_id"] for r in records],
+            "chunking": ingest.chunking_settings(),
+        }
+        yield from records
+
+
+class StreamDeduplicator:
+    """
+    Étape quasi-doublons : marque "duplicate_of" au fil de l'eau et retient,
+    pour chaque chunk gardé, la liste de ses doublons (appliquée à la fin).
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.groups = {}  # id du chunk gardé → pointeurs vers ses doublons
+        self.chunks = 0
+        self.removed_tokens = 0
+        self._filter = NearDuplicateFilter(threshold)
+        self._encoding = get_encoding()
+
+    def mark(self, records):
+        for record in records:
+            self.chunks += 1
+            meta = record["metadata"]
+            original = self._filter.original_of(meta["chunk_id"], record["text"])
+            if original is not None:
+                meta["duplicate_of"] = original
+                self.groups.setdefault(original, []).append(duplicate_pointer(meta))
+                self.removed_tokens += len(self._encoding.encode_ordinary(record["text"]))
+            yield record
+
+    def report(self) -> dict:
+        """Même rapport que ingest.dedup_chunks."""
+        return {
+            "chunks": self.chunks,
+            "removed_chunks": sum(len(pointers) for pointers in self.groups.values()),
+            "removed_tokens": self.removed_tokens,
+            "threshold": self.threshold,
+            "groups": [
+                {"kept": kept, "duplicates": [p["chunk_id"] for p in pointers]}
+                for kept, pointers in self.groups.items()
+            ],
+        }
+
+
+def add_duplicate_pointers(out_path: Path, groups: dict):
+    """Ajoute "duplicates" aux chunks gardés de chunks.json, relu et réécrit en flux."""
+    rewritten = out_path.with_name(out_path.name + ".dedup")
+    with ingest.ChunkWriter(rewritten) as writer:
+        for record in ingest.iter_saved_chunks(out_path):
+            pointers = groups.get(record["metadata"].get("chunk_id"))
+            if pointers:
+                record["metadata"]["duplicates"] = pointers
+            writer.write(record)
+    os.replace(rewritten, out_path)
+
+
+def batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prefetch(iterable, max_items: int):
+    """
+    Consomme `iterable` dans un thread séparé, avec au plus `max_items`
+    éléments d'avance : le producteur travaille pendant que le consommateur attend.
+    """
+    q = queue.Queue(maxsize=max_items)
+    stop = threading.Event()
+
+    def producer():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        q.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            q.put(_DONE)
+        except BaseException as e:
+            q.put(e)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def embed_batches(batches, embeddings):
+    """
+    Étape embedding : génère (records, records à indexer, leurs vecteurs)
+    batch par batch. Les quasi-doublons ne sont pas embeddés.
+    """
+    for records in batches:
+        indexed = [r for r in records if not is_duplicate(r["metadata"])]
+        vectors = embeddings.embed_documents([r["text"] for r in indexed]) if indexed else []
+        yield records, indexed, vectors
+
+
+def run_streaming(
+    pdf_dir: Path = ingest.PDF_DIR,
+    out_path: Path = ingest.OUT_PATH,
+    manifest_path: Path = ingest.MANIFEST_PATH,
+    index_dir: Path = INDEX_DIR,
+    embeddings=None,
+    batch_size: int = 256,
+    prefetch_batches: int = 4,
+    workers: int = 1,
+    dedup: bool = True,
+    dedup_threshold: float = DEFAULT_THRESHOLD,
+):
+    """Reconstruit chunks.json, le manifest d'ingestion et l'index FAISS en un seul passage."""
+    if embeddings is None:
+        settings = embedding_settings()
+        if settings["backend"] == "openai":
+            model = {"model": settings["model"]} if settings["model"] else {}
+            embeddings = CachedEmbeddings(OpenAIEmbeddings(**model))
+        else:
+            embeddings = CachedEmbeddings(create_local_embeddings(settings["backend"], settings["model"], settings["int8"]))
+
+    pdf_paths = sorted(Path(pdf_dir).glob("*.pdf"))
+    hashes = {p.name: ingest.file_sha256(p) for p in pdf_paths}
+    manifest = {}
+
+    records = iter_pdf_records(pdf_paths, hashes, manifest, workers)
+    deduplicator = StreamDeduplicator(dedup_threshold) if dedup else None
+    if deduplicator is not None:
+        records = deduplicator.mark(records)
+    batches = prefetch(batched(records, batch_size), prefetch_batches)
+
+    vectorstore = None
+    with ingest.ChunkWriter(Path(out_path)) as writer:
+        for batch, indexed, vectors in embed_batches(batches, embeddings):
+            if indexed:
+                text_embeddings = [(r["text"], v) for r, v in zip(indexed, vectors)]
+                metadatas = [r["metadata"] for r in indexed]
+                ids = [str(r["metadata"]["chunk_id"]) for r in indexed]
+                if vectorstore is None:
+                    vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas, ids)
+                else:
+                    vectorstore.add_embeddings(text_embeddings, metadatas, ids)
+            for record in batch:
+                writer.write(record)
+            print(f"[STREAM] {writer.count} chunks traités")
+
+    if deduplicator is not None:
+        report = deduplicator.report()
+        if deduplicator.groups:
+            # Chunks gardés : déjà écrits et indexés avant de connaître leurs doublons
+            for kept, pointers in deduplicator.groups.items():
+                vectorstore.docstore.search(str(kept)).metadata["duplicates"] = pointers
+            add_duplicate_pointers(Path(out_path), deduplicator.groups)
+        report_path = Path(out_path).with_name(ingest.DEDUP_REPORT_NAME)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[DEDUP] {report['removed_chunks']} quasi-doublons sur {report['chunks']} chunks "
+              f"({report['removed_tokens']} tokens) retirés de l'index → {report_path}")
+
+    ingest.save_manifest(manifest, Path(manifest_path))
+    if vectorstore is None:
+        print("[STREAM] Aucun chunk produit, index inchangé.")
+        return None
+
+    nb_chunks = len(vectorstore.index_to_docstore_id)
+    publish_index(
+        vectorstore,
+        index_dir,
+        sidecars=index_sidecars(vectorstore),
+        nb_chunks=nb_chunks,
+        **embedding_spec(embeddings),
+    )
+    print(f"[STREAM] {writer.count} chunks → {out_path}, {nb_chunks} indexés → FAISS {index_dir}")
+    return vectorstore
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion + indexation en streaming")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="nombre de chunks par appel d'embeddings")
+    parser.add_argument("--prefetch", type=int, default=4,
+                        help="nombre de batchs parsés d'avance")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="nombre de processus de parsing (0 = tous les cœurs)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="garder les quasi-doublons dans l'index")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="similarité de Jaccard à partir de laquelle deux chunks sont des doublons")
+    args = parser.parse_args()
+    run_streaming(
+        batch_size=args.batch_size,
+        prefetch_batches=args.prefetch,
+        workers=args.workers or os.cpu_count(),
+        dedup=not args.no_dedup,
+        dedup_threshold=args.dedup_threshold,
+    )
@@ -0,0 +1,138 @@
+# src/tokenizer.py
+"""
+Comptage de tokens partagé (budget de contexte, découpage en chunks).
+
+tiktoken télécharge son fichier BPE au premier usage : sans réseau (CI,
+machine hors ligne), on se rabat sur un découpage approximatif par regex
+(mots + ponctuation, espace de tête collé au mot comme dans tiktoken),
+avec la même interface encode_ordinary / encode_ordinary_batch / decode.
+"""
+import os
+import re
+import threading
+from functools import lru_cache
+
+TOKEN_ENCODING = "cl100k_base"
+
+_APPROX_TOKEN_RE = re.compile(r" ?\w+| ?[^\w\s]+|\s+")
+
+
+class ApproxEncoding:
+    """Encodage de secours : un token par mot / groupe de ponctuation / blanc."""
+
+    name = "approx"
+
+    def __init__(self):
+        self._ids = {}
+        self._pieces = []
+        self._lock = threading.Lock()
+
+    def _id(self, piece: str) -> int:
+        token_id = self._ids.get(piece)
+        if token_id is None:
+            # Vocabulaire partagé entre threads (serveur HTTP, uploads)
+            with self._lock:
+                token_id = self._ids.get(piece)
+                if token_id is None:
+                    token_id = len(self._pieces)
+                    self._pieces.append(piece)
+                    self._ids[piece] = token_id
+        return token_id
+
+    def encode_ordinary(self, text: str):
+        return [self._id(piece) for piece in _APPROX_TOKEN_RE.findall(text)]
+
+    def encode_ordinary_batch(self, texts, num_threads: int = 8):
+        return [self.encode_ordinary(text) for text in texts]
+
+    def count_ordinary_batch(self, texts):
+        # Sans passer par le vocabulaire : seul le nombre de tokens compte
+        return [len(_APPROX_TOKEN_RE.findall(text)) for text in texts]
+
+    def decode(self, tokens) -> str:
+        return "".join(self._pieces[t] for t in tokens)
+
+
+_encoding_lock = threading.Lock()
+
+
+def get_encoding(name: str = TOKEN_ENCODING):
+    # Un seul chargement même si plusieurs threads comptent des tokens en même temps
+    with _encoding_lock:
+        return _load_encoding(name)
+
+
+@lru_cache(maxsize=None)
+def _load_encoding(name: str):
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(name)
+    except Exception as e:  # tiktoken absent ou fichier BPE non téléchargeable
+        print(f"[TOKENS] Encodage {name} indisponible ({type(e).__name__}) → comptage approximatif")
+        return ApproxEncoding()
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode_ordinary(text))
+
+
+def count_tokens_batch(texts, encoding=None):
+    """Nombre de tokens de chaque texte, encodés en un seul lot (threads de tiktoken)."""
+    encoding = encoding or get_encoding()
+    if isinstance(encoding, ApproxEncoding):
+        return encoding.count_ordinary_batch(texts)
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+
+
+@lru_cache(maxsize=None)
+def _token_byte_lengths(encoding):
+    """Longueur en octets de chaque token du vocabulaire (0 pour les ids inutilisés)."""
+    import numpy as np
+
+    lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+    for token in range(encoding.n_vocab):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass
+    return lengths
+
+
+def _byte_to_char_offsets(text: str, byte_offsets):
+    # Octets UTF-8 de chaque caractère : un token qui finit au milieu d'un
+    # caractère est compté comme finissant avant lui
+    import numpy as np
+
+    codepoints = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    char_bytes = 1 + (codepoints >= 0x80) + (codepoints >= 0x800) + (codepoints >= 0x10000)
+    return np.searchsorted(np.cumsum(char_bytes), byte_offsets, side="right")
+
+
+def token_ends_batch(texts, encoding=None):
+    """
+    Position (en caractères) de la fin de chaque token de chaque texte, les
+    textes étant encodés en un seul lot. Les tokens d'un passage text[a:b]
+    sont ceux qui finissent dans (a, b] : compter les tokens d'une phrase ne
+    demande pas de la réencoder.
+    """
+    import numpy as np  # pas à l'import : rag_pipeline importe ce module
+
+    encoding = encoding or get_encoding()
+    if isinstance(encoding, ApproxEncoding):
+        # Les tokens approximatifs recouvrent le texte : fins = longueurs cumulées
+        return [
+            np.cumsum(np.fromiter(map(len, _APPROX_TOKEN_RE.findall(text)), dtype=np.int64))
+            for text in texts
+        ]
+    lengths = _token_byte_lengths(encoding)
+    # Sur un seul cœur, les threads de tiktoken ne font que ralentir le lot
+    if (os.cpu_count() or 1) > 1:
+        encoded = encoding.encode_ordinary_batch(texts)
+    else:
+        encoded = [encoding.encode_ordinary(text) for text in texts]
+    ends = []
+    for text, tokens in zip(texts, encoded):
+        byte_ends = np.cumsum(lengths[np.asarray(tokens, dtype=np.int64)])
+        ends.append(byte_ends if text.isascii() else _byte_to_char_offsets(text, byte_ends))
+    return ends
@@ -0,0 +1,316 @@
+# src/tracing.py
+"""
+Traces et métriques par étape (ingestion, indexation, recherche, génération).
+
+    with span("rag.search", mode="hybrid", k=4) as s:
+        docs = ...
+        s.set(docs=len(docs))
+
+Chaque span mesure sa durée et porte des attributs (tokens, chunks, hits de
+cache, octets...). Seules les mesures de COUNTER_ATTRS deviennent des
+compteurs Prometheus ; les réglages (k, token_budget, stream...) restent dans
+les traces JSON. Les spans imbriqués partagent un trace_id : on voit où
+part le temps d'une réponse lente (embedding de la question, FAISS, contexte,
+appel OpenRouter).
+
+Activation par variables d'environnement (désactivé par défaut) :
+- LITTERA_TRACING=1 : active les spans ;
+- LITTERA_TRACE_LOG=chemin : une ligne JSON par span terminé (sinon stderr) ;
+- LITTERA_METRICS_FILE=chemin : métriques au format texte Prometheus, écrites
+  à la fin du processus (et à chaque appel de write_metrics) ;
+- LITTERA_METRICS_PORT=9464 : endpoint HTTP /metrics pour Prometheus.
+
+Désactivé, span() renvoie un objet inerte partagé : coût d'un appel de
+fonction, ni horloge, ni allocation, ni verrou.
+"""
+import atexit
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+# Bornes (secondes) de l'histogramme des durées
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Attributs des spans exportés en compteurs littera_<attribut>_total : des
+# quantités qui s'additionnent d'un span à l'autre (pas les paramètres)
+COUNTER_ATTRS = frozenset({
+    "batches", "bytes", "cache_hit", "cache_hits", "cache_misses", "candidates", "chars", "chunks",
+    "completion_tokens", "context_tokens", "deleted", "docs", "failed", "merged_docs", "pages", "pdfs",
+    "prompt_tokens", "questions", "rate_limited", "removed_chunks", "removed_tokens", "resumed_batches",
+    "saved_tokens", "texts", "tokens", "unchanged",
+})
+
+_current = contextvars.ContextVar("littera_span", default=None)
+_METRIC_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class _NoopSpan:
+    """Span inerte renvoyé quand le tracing est désactivé."""
+
+    __slots__ = ()
+    recording = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, key: str, value=1):
+        pass
+
+    def elapsed(self) -> float:
+        return 0.0
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "start", "seconds", "_parent", "_t0")
+    recording = True
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+        self.seconds = None
+
+    def __enter__(self):
+        self._parent = _current.get()
+        self.trace_id = self._parent.trace_id if self._parent else uuid.uuid4().hex
+        self.parent_id = self._parent.span_id if self._parent else None
+        _current.set(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._t0
+        # set() plutôt qu'un reset par token : un générateur peut être repris
+        # dans un autre contexte (st.write_stream, to_thread)
+        _current.set(self._parent)
+        if exc_type is None:
+            status = "ok"
+        elif issubclass(exc_type, GeneratorExit):
+            status = "closed"  # stream abandonné par le consommateur
+        else:
+            status = "error"
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        _tracer.finish(self, status)
+        return False
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key: str, value=1):
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def elapsed(self) -> float:
+        """Secondes écoulées depuis l'ouverture du span (ex: premier token d'un stream)."""
+        return time.perf_counter() - self._t0
+
+
+def span(name: str, **attrs):
+    """Span `name` (ex: "rag.search") ; à utiliser comme context manager."""
+    if not _tracer.enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def current_span():
+    """Span en cours dans ce contexte (objet inerte si aucun)."""
+    return _current.get() or _NOOP
+
+
+# ====== Collecte ======
+
+def _metric_name(key: str) -> str:
+    return _METRIC_NAME_RE.sub("_", key)
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.log_path = None
+        self._lock = threading.Lock()
+        self._log_file = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # nom -> [nb par bucket, somme des durées, nb, nb d'erreurs]
+            self._durations = {}
+            # (nom, attribut) -> total des valeurs numériques
+            self._totals = {}
+
+    def configure(self, enabled: bool, log_path=None):
+        with self._lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+            self.enabled = enabled
+            self.log_path = Path(log_path) if log_path else None
+
+    def finish(self, s: Span, status: str):
+        record = {
+            "span": s.name,
+            "trace_id": s.trace_id,
+            "span_id": s.span_id,
+            "parent_id": s.parent_id,
+            "start": round(s.start, 6),
+            "seconds": round(s.seconds, 6),
+            "status": status,
+            **s.attrs,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            stats = self._durations.get(s.name)
+            if stats is None:
+                stats = self._durations[s.name] = [[0] * len(DURATION_BUCKETS), 0.0, 0, 0]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if s.seconds <= bound:
+                    stats[0][i] += 1
+            stats[1] += s.seconds
+            stats[2] += 1
+            if status == "error":
+                stats[3] += 1
+            for key, value in s.attrs.items():
+                # Compteurs : les mesures numériques (bool compris, ex: cache_hit)
+                if key in COUNTER_ATTRS and isinstance(value, (int, float)):
+                    totals_key = (s.name, key)
+                    self._totals[totals_key] = self._totals.get(totals_key, 0) + value
+            self._write(line)
+
+    def _write(self, line: str):
+        if self.log_path is None:
+            print(line, file=sys.stderr)
+            return
+        if self._log_file is None:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            self._log_file = open(self.log_path, "a", encoding="utf-8", buffering=1)
+        self._log_file.write(line + "\n")
+
+    def metrics_text(self) -> str:
+        """Métriques au format d'exposition texte de Prometheus."""
+        with self._lock:
+            durations = {name: (list(b), total, n, errors) for name, (b, total, n, errors) in self._durations.items()}
+            totals = dict(self._totals)
+
+        lines = [
+            "# HELP littera_span_seconds Durée des étapes du pipeline.",
+            "# TYPE littera_span_seconds histogram",
+        ]
+        for name in sorted(durations):
+            buckets, total, n, _ = durations[name]
+            for bound, count in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'littera_span_seconds_bucket{{span="{_label(name)}",le="{bound}"}} {count}')
+            lines.append(f'littera_span_seconds_bucket{{span="{_label(name)}",le="+Inf"}} {n}')
+            lines.append(f'littera_span_seconds_sum{{span="{_label(name)}"}} {total:.6f}')
+            lines.append(f'littera_span_seconds_count{{span="{_label(name)}"}} {n}')
+
+        lines += [
+            "# HELP littera_span_errors_total Étapes terminées par une exception.",
+            "# TYPE littera_span_errors_total counter",
+        ]
+        for name in sorted(durations):
+            lines.append(f'littera_span_errors_total{{span="{_label(name)}"}} {durations[name][3]}')
+
+        for key in sorted({key for _, key in totals}):
+            metric = f"littera_{_metric_name(key)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (name, k), value in sorted(totals.items()):
+                if k == key:
+                    lines.append(f'{metric}{{span="{_label(name)}"}} {float(value):g}')
+        return "\n".join(lines) + "\n"
+
+
+_tracer = Tracer()
+
+
+def enable(log_path=None):
+    """Active les spans ; `log_path` : fichier JSON lines (None : stderr)."""
+    _tracer.configure(True, log_path)
+
+
+def disable():
+    _tracer.configure(False)
+
+
+def is_enabled() -> bool:
+    return _tracer.enabled
+
+
+def reset_metrics():
+    _tracer.reset()
+
+
+def metrics_text() -> str:
+    return _tracer.metrics_text()
+
+
+def write_metrics(path):
+    """Écrit les métriques (format Prometheus) de façon atomique, pour un textfile collector."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(metrics_text(), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+_server = None
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Endpoint HTTP /metrics (thread daemon) ; un seul serveur par processus."""
+    global _server
+    if _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    print(f"[TRACE] Métriques sur http://{host}:{_server.server_port}/metrics")
+    return _server
+
+
+def configure_from_env():
+    if os.environ.get("LITTERA_TRACING", "").lower() in ("", "0", "false", "no"):
+        return
+    enable(os.environ.get("LITTERA_TRACE_LOG") or None)
+    metrics_file = os.environ.get("LITTERA_METRICS_FILE")
+    if metrics_file:
+        atexit.register(write_metrics, metrics_file)
+    port = os.environ.get("LITTERA_METRICS_PORT")
+    if port:
+        start_metrics_server(int(port))
+
+
+configure_from_env()
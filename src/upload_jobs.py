@@ -0,0 +1,248 @@
+# src/upload_jobs.py
+"""
+Indexation des PDF uploadés en tâche de fond.
+
+Le script Streamlit ne fait plus que soumettre un job et afficher son état :
+- chaque fichier est une tâche du pool (parsing + chunking + embeddings),
+  plusieurs fichiers avancent en parallèle ;
+- progression par fichier (étape, chunks embeddés / total) ;
+- annulation : les fichiers en attente sont abandonnés, ceux en cours
+  s'arrêtent au prochain batch d'embeddings ;
+- le vectorstore du job n'est construit qu'une fois tous les fichiers
+  terminés : la session ne voit les nouveaux vecteurs qu'à la fin.
+
+Le pool et les jobs vivent au niveau du processus : un rerun du script
+ne perd rien, il retrouve le job par son id. Chaque job écrit ses PDF dans
+son propre dossier (upload_dir/<id du job>), supprimé à la fin : deux
+sessions qui envoient un fichier du même nom ne se marchent pas dessus.
+"""
+import hashlib
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from langchain_community.vectorstores import FAISS
+
+from ingest import chunk_documents, load_pdf, make_chunk_id
+from tracing import span
+
+# Chunks embeddés par appel : granularité de la progression et de l'annulation
+EMBED_BATCH_SIZE = 64
+
+QUEUED, PARSING, EMBEDDING, DONE, FAILED, CANCELLED = (
+    "queued", "parsing", "embedding", "done", "failed", "cancelled"
+)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class FileProgress:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = QUEUED
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.error = None
+
+    @property
+    def fraction(self) -> float:
+        if self.state in (DONE, FAILED, CANCELLED):
+            return 1.0
+        if self.state == EMBEDDING and self.chunks_total:
+            # Parsing ≈ 10 % du travail, embeddings ≈ 90 %
+            return 0.1 + 0.9 * self.chunks_done / self.chunks_total
+        return 0.05 if self.state == PARSING else 0.0
+
+
+class UploadJob:
+    def __init__(self, files, embeddings, upload_dir: Path):
+        self.id = uuid.uuid4().hex
+        self.embeddings = embeddings
+        self.upload_dir = Path(upload_dir)
+        self.work_dir = self.upload_dir / self.id
+        self.files = {name: FileProgress(name) for name, _ in files}
+        self.created_at = time.time()
+        self.vectorstore = None  # construit quand tous les fichiers sont terminés
+        self.error = None
+        self._results = {}  # nom -> (textes, vecteurs, métadonnées, ids)
+        self._remaining = len(files)
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+
+    # ---- État ----
+
+    @property
+    def done(self) -> bool:
+        return self._finished.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def progress(self) -> float:
+        if not self.files:
+            return 1.0
+        return sum(f.fraction for f in self.files.values()) / len(self.files)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._finished.wait(timeout)
+
+    # ---- Travail (threads du pool) ----
+
+    def _check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def process_file(self, name: str, data: bytes):
+        progress = self.files[name]
+        path = self.work_dir / name
+        try:
+            self._check_cancelled()
+            progress.state = PARSING
+            self.work_dir.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            try:
+                chunks = chunk_documents(load_pdf(path))
+            finally:
+                path.unlink(missing_ok=True)
+            file_hash = hashlib.sha256(data).hexdigest()
+
+            progress.state = EMBEDDING
+            progress.chunks_total = len(chunks)
+            texts = [c.page_content for c in chunks]
+            vectors = []
+            with span("upload.embed", file_name=name, chunks=len(texts), bytes=len(data)):
+                for start in range(0, len(texts), EMBED_BATCH_SIZE):
+                    self._check_cancelled()
+                    vectors.extend(self.embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+                    progress.chunks_done = len(vectors)
+
+            ids = [make_chunk_id(file_hash, i) for i in range(len(chunks))]
+            metadatas = [{**c.metadata, "chunk_id": chunk_id} for c, chunk_id in zip(chunks, ids)]
+            with self._lock:
+                self._results[name] = (texts, vectors, metadatas, ids)
+            progress.state = DONE
+        except JobCancelled:
+            progress.state = CANCELLED
+        except Exception as e:
+            progress.state = FAILED
+            progress.error = str(e)
+            print(f"[UPLOAD] Échec sur {name} : {e}")
+        finally:
+            self._file_finished()
+
+    def _file_finished(self):
+        with self._lock:
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last:
+            self._finalize()
+
+    def _finalize(self):
+        try:
+            if not self._cancel.is_set():
+                self.vectorstore = self._build_vectorstore()
+        except Exception as e:
+            self.error = str(e)
+            print(f"[UPLOAD] Construction de l'index impossible : {e}")
+        finally:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self._finished.set()
+
+    def _build_vectorstore(self):
+        # Dans l'ordre de soumission des fichiers ; None si aucun n'a abouti.
+        # Ids tirés du contenu : deux fichiers identiques (même PDF sous deux
+        # noms) donnent les mêmes ids : seul le premier est indexé, l'autre est
+        # cité via "duplicates", comme les quasi-doublons de l'ingestion.
+        texts, vectors, metadatas, ids = [], [], [], []
+        seen = {}  # id → métadonnées du chunk indexé
+        for name in self.files:
+            if name not in self._results:
+                continue
+            for text, vector, metadata, chunk_id in zip(*self._results[name]):
+                if chunk_id in seen:
+                    seen[chunk_id].setdefault("duplicates", []).append({
+                        "chunk_id": chunk_id,
+                        "file_name": name,
+                        "page": metadata.get("page"),
+                        "author": metadata.get("author"),
+                        "year": metadata.get("year"),
+                    })
+                    continue
+                seen[chunk_id] = metadata
+                texts.append(text)
+                vectors.append(vector)
+                metadatas.append(metadata)
+                ids.append(chunk_id)
+        if not texts:
+            return None
+        return FAISS.from_embeddings(
+            zip(texts, vectors), self.embeddings, metadatas=metadatas, ids=ids
+        )
+
+
+def merge_into(overlay, upload_vs):
+    """
+    Ajoute les vecteurs d'un job à l'overlay de la session (ou le crée).
+    Les chunks déjà présents (même contenu uploadé plus tôt) sont ignorés :
+    FAISS refuse les ids en double.
+    """
+    if upload_vs is None:
+        return overlay
+    if overlay is None:
+        return upload_vs
+    present = set(overlay.index_to_docstore_id.values())
+    already = [i for i in upload_vs.index_to_docstore_id.values() if i in present]
+    if len(already) == len(upload_vs.index_to_docstore_id):
+        return overlay
+    if already:
+        upload_vs.delete(already)
+    overlay.merge_from(upload_vs)
+    return overlay
+
+
+class UploadJobQueue:
+    """Pool de workers partagé par toutes les sessions du processus."""
+
+    def __init__(self, workers: int = 4, keep_seconds: float = 3600.0):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.keep_seconds = keep_seconds
+
+    def submit(self, files, embeddings, upload_dir: Path) -> UploadJob:
+        """`files` : liste de (nom, contenu en octets). Renvoie le job créé."""
+        Path(upload_dir).mkdir(parents=True, exist_ok=True)
+        job = UploadJob(files, embeddings, upload_dir)
+        with self._lock:
+            self._forget_old_jobs()
+            self._jobs[job.id] = job
+        if not files:
+            job._finalize()
+        for name, data in files:
+            self._executor.submit(job.process_file, name, data)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _forget_old_jobs(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.done and now - job.created_at > self.keep_seconds:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Les modules de src/ sont importés comme des scripts (ex: `from rag_pipeline import ...`)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
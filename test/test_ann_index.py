@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from ann_index import build_faiss_index, compare_index_types, resolve_params, set_search_params
+
+
+def clustered_vectors(n=3000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(30, dim))
+    return (centers[rng.integers(0, 30, n)] + rng.normal(scale=0.3, size=(n, dim))).astype(np.float32)
+
+
+def test_resolve_params_adapts_to_corpus():
+    assert resolve_params("ivf", 390, 32)["nlist"] == 10
+    with pytest.raises(ValueError):
+        resolve_params("ivfpq", 10000, 30, pq_m=8)
+    with pytest.raises(ValueError):
+        resolve_params("lsh", 100, 32)
+
+
+@pytest.mark.parametrize("index_type", ["ivf", "hnsw", "ivfpq", "ivfsq", "sq"])
+def test_index_types_search(index_type):
+    vectors = clustered_vectors()
+    index = build_faiss_index(vectors, index_type, nlist=32, pq_m=8, pq_nbits=4, hnsw_m=16)
+    set_search_params(index, nprobe=8, ef_search=32)
+    assert index.ntotal == len(vectors)
+    _, ids = index.search(vectors[:5], 1)
+    assert ids.shape == (5, 1)
+
+
+def test_report_compares_to_flat():
+    reports = compare_index_types(
+        clustered_vectors(), ("flat", "ivf", "hnsw", "ivfpq"),
+        k=10, n_queries=50, nprobe=8, nlist=32, pq_m=8, pq_nbits=4, hnsw_m=16,
+    )
+    assert reports["flat"]["recall@10"] == 1.0
+    assert reports["hnsw"]["recall@10"] > 0.8
+    assert reports["ivfpq"]["memory_bytes"] < reports["flat"]["memory_bytes"]
+    assert reports["ivf"]["latency_p99_ms"] >= reports["ivf"]["latency_p50_ms"]
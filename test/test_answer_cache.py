@@ -0,0 +1,68 @@
+# test/test_answer_cache.py
+from answer_cache import AnswerCache
+
+
+def make_cache(tmp_path, **kwargs):
+    return AnswerCache(cache_path=tmp_path / "answers.sqlite", **kwargs)
+
+
+def test_similar_question_with_same_sources_hits(tmp_path):
+    cache = make_cache(tmp_path, threshold=0.95)
+    cache.store("Qu'est-ce que le RGPD ?", [1.0, 0.0, 0.0], ["a", "b"], "model", "v1", "réponse")
+
+    assert cache.lookup([0.99, 0.05, 0.0], ["a", "b"], "model", "v1") == "réponse"
+    assert cache.lookup([0.0, 1.0, 0.0], ["a", "b"], "model", "v1") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_sources_and_model_are_part_of_the_key(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("q", [1.0, 0.0], ["a", "b"], "model", "v1", "réponse")
+
+    assert cache.lookup([1.0, 0.0], ["b", "a"], "model", "v1") is None
+    assert cache.lookup([1.0, 0.0], ["a", "c"], "model", "v1") is None
+    assert cache.lookup([1.0, 0.0], ["a", "b"], "autre-modele", "v1") is None
+
+
+def test_new_index_version_invalidates_answers(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("q", [1.0, 0.0], ["a"], "model", "v1", "réponse")
+
+    assert cache.lookup([1.0, 0.0], ["a"], "model", "v2") is None
+    # Un autre processus sert encore v1 : ses réponses ne sont pas effacées
+    other = make_cache(tmp_path)
+    assert other.lookup([1.0, 0.0], ["a"], "model", "v1") == "réponse"
+
+
+def test_old_entries_are_pruned_by_age(tmp_path, monkeypatch):
+    import answer_cache
+
+    cache = make_cache(tmp_path, max_age=60)
+    cache.store("q1", [1.0, 0.0], ["a"], "model", "v1", "r1")
+    now = answer_cache.time.time()
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now + 120)
+    cache.store("q2", [1.0, 0.0], ["b"], "model", "v2", "r2")
+
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([1.0, 0.0], ["b"], "model", "v2") == "r2"
+
+
+def test_nothing_is_cached_without_index_version(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("q", [1.0, 0.0], ["a"], "model", None, "réponse")
+
+    assert cache.lookup([1.0, 0.0], ["a"], "model", None) is None
+    assert cache.stats() == {"hits": 0, "misses": 0, "entries": 0}
+
+
+def test_eviction_keeps_recent_entries(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.store("q1", [1.0, 0.0], ["a"], "model", "v1", "r1")
+    cache.store("q2", [1.0, 0.0], ["b"], "model", "v1", "r2")
+    cache.lookup([1.0, 0.0], ["a"], "model", "v1")
+    cache.store("q3", [1.0, 0.0], ["c"], "model", "v1", "r3")
+
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup([1.0, 0.0], ["a"], "model", "v1") == "r1"
+    assert cache.lookup([1.0, 0.0], ["b"], "model", "v1") is None
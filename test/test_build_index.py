@@ -0,0 +1,111 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+from langchain_openai import OpenAIEmbeddings
+
+from build_index import AdaptiveBackoff, embed_in_batches
+
+
+def fake_vector(text):
+    return [float(len(text)), float(sum(map(ord, text)) % 101), 1.0]
+
+
+class FakeEmbeddingsServer:
+    """Serveur local compatible /v1/embeddings : vecteurs déterministes, 429 et pannes à la demande."""
+
+    def __init__(self, rate_limit_first=0, fail_on=()):
+        self.rate_limit_first = rate_limit_first
+        self.fail_on = set(fail_on)
+        self.requests = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server.lock:
+                    server.requests.append(body["input"])
+                    n = len(server.requests)
+                if n <= server.rate_limit_first:
+                    return self._send(429, {"error": {"message": "rate limited"}},
+                                      {"retry-after": "0.05"})
+                if any(t in server.fail_on for t in body["input"]):
+                    return self._send(500, {"error": {"message": "boom"}})
+
+                data = []
+                for i, text in enumerate(body["input"]):
+                    vec = fake_vector(text)
+                    if body.get("encoding_format") == "base64":
+                        vec = base64.b64encode(np.asarray(vec, dtype=np.float32).tobytes()).decode()
+                    data.append({"object": "embedding", "index": i, "embedding": vec})
+                self._send(200, {"object": "list", "data": data, "model": body["model"],
+                                 "usage": {"prompt_tokens": 1, "total_tokens": 1}})
+
+            def _send(self, status, payload, headers=None):
+                raw = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def embeddings(self):
+        return OpenAIEmbeddings(base_url=self.url, api_key="fake", max_retries=0,
+                                check_embedding_ctx_length=False)
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def make(**kwargs):
+        servers.append(FakeEmbeddingsServer(**kwargs))
+        return servers[-1]
+
+    yield make
+    for s in servers:
+        s.close()
+
+
+TEXTS = [f"chunk numéro {i}" for i in range(50)]
+
+
+def test_batches_in_parallel_with_backoff_on_429(server_factory):
+    server = server_factory(rate_limit_first=3)
+    backoff = AdaptiveBackoff(base_delay=0.01)
+    vectors = embed_in_batches(TEXTS, server.embeddings(), batch_size=8,
+                               parallelism=4, backoff=backoff)
+    np.testing.assert_allclose(vectors, [fake_vector(t) for t in TEXTS])
+    assert backoff.rate_limited == 3
+    assert len(server.requests) == 7 + 3
+
+
+def test_resumes_from_checkpoints(server_factory, tmp_path):
+    server = server_factory(fail_on={TEXTS[45]})
+    with pytest.raises(Exception):
+        embed_in_batches(TEXTS, server.embeddings(), batch_size=8,
+                         parallelism=1, checkpoint_dir=tmp_path)
+    # Tous les batchs réussis sont sauvés, seul celui en échec manque
+    assert len(list(tmp_path.glob("batch-*.npy"))) == 6
+
+    server = server_factory()
+    vectors = embed_in_batches(TEXTS, server.embeddings(), batch_size=8,
+                               parallelism=2, checkpoint_dir=tmp_path)
+    np.testing.assert_allclose(vectors, [fake_vector(t) for t in TEXTS])
+    assert server.requests == [TEXTS[40:48]]
@@ -0,0 +1,57 @@
+# test/test_chunker.py
+from langchain_core.documents import Document
+
+from chunker import chunker_id, split_documents
+from tokenizer import count_tokens, get_encoding, token_ends_batch
+
+SENTENCES = [f"La phrase numéro {i} parle de gouvernance des données et de qualité." for i in range(60)]
+
+
+def page(text, number):
+    return Document(page_content=text, metadata={"file_name": "a.pdf", "page": number})
+
+
+def test_chunks_respect_token_limit_and_sentence_boundaries():
+    chunks = split_documents([page(" ".join(SENTENCES), 0)], chunk_tokens=100, overlap_tokens=20)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert count_tokens(chunk.page_content) <= 100 + 2
+        assert chunk.page_content.startswith("La phrase") and chunk.page_content.endswith("qualité.")
+        assert chunk.metadata == {"file_name": "a.pdf", "page": 0}
+    # Recouvrement : le chunk suivant reprend la dernière phrase du précédent
+    for previous, following in zip(chunks, chunks[1:]):
+        last = previous.page_content.rsplit("qualité. ", 1)[-1]
+        assert following.page_content.startswith(last)
+
+
+def test_pages_are_never_merged():
+    chunks = split_documents([page("Première page.", 0), page("Deuxième page.", 1), page("  ", 2)])
+    assert [(c.page_content, c.metadata["page"]) for c in chunks] == [("Première page.", 0), ("Deuxième page.", 1)]
+
+
+def test_long_sentence_is_cut_between_words():
+    words = [f"mot{i}" for i in range(300)]
+    chunks = split_documents([page(" ".join(words), 0)], chunk_tokens=50, overlap_tokens=0)
+
+    assert len(chunks) > 1
+    assert " ".join(c.page_content for c in chunks).split() == words
+    assert all(count_tokens(c.page_content) <= 50 for c in chunks)
+
+
+def test_page_that_fits_is_one_chunk():
+    text = "\n\n".join(SENTENCES[:5])
+    chunks = split_documents([page(text, 0)], chunk_tokens=count_tokens(text), overlap_tokens=20)
+    assert [c.page_content for c in chunks] == [text]
+
+
+def test_chunker_id_names_the_encoding():
+    assert get_encoding().name in chunker_id()
+
+
+def test_token_ends_are_character_offsets():
+    texts = ["Qualité des données : « déjà vu » — 3 €.", "plain ascii text", ""]
+    for text, ends in zip(texts, token_ends_batch(texts)):
+        assert len(ends) == count_tokens(text)
+        assert list(ends) == sorted(ends)
+        assert len(ends) == 0 or ends[-1] == len(text)
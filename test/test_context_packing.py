@@ -0,0 +1,54 @@
+# test/test_context_packing.py
+from langchain_core.documents import Document
+
+from context_packing import pack_context
+from tokenizer import count_tokens
+
+TEXT = " ".join(f"mot{i}" for i in range(400))
+
+
+def chunk(text, file_name="a.pdf", page=1, chunk_id=None):
+    return Document(page_content=text, metadata={"file_name": file_name, "page": page, "chunk_id": chunk_id})
+
+
+def test_overlapping_chunks_are_merged_without_repetition():
+    first, second = TEXT[:1200], TEXT[1000:2200]
+    context, report = pack_context([chunk(second), chunk(first)], token_budget=10_000)
+
+    assert TEXT[:2200] in context
+    assert context.count("[Source") == 1
+    assert report["merged_docs"] == 1
+    assert report["saved_tokens"] > 0
+
+
+def test_adjacent_chunk_ids_are_merged_and_other_pages_kept_apart():
+    docs = [
+        chunk("début du passage", chunk_id="abcd-00003"),
+        chunk("suite du passage", chunk_id="abcd-00004"),
+        chunk("autre page", page=2, chunk_id="abcd-00005"),
+        chunk("début", chunk_id="abcd-00009"),  # contenu dans le premier extrait
+    ]
+    context, report = pack_context(docs, token_budget=10_000)
+
+    assert "début du passage\nsuite du passage" in context
+    assert context.count("[Source") == 2
+    assert report["merged_docs"] == 2
+
+
+def test_duplicate_pages_are_cited_in_the_header():
+    doc = chunk("passage répété", chunk_id="abcd-00001")
+    doc.metadata["duplicates"] = [{"chunk_id": "ef01-00007", "file_name": "b.pdf", "page": 3}]
+    context, _ = pack_context([doc], token_budget=10_000)
+
+    assert context.startswith("[Source 1 | a.pdf | page 1 | aussi : b.pdf p. 3]")
+
+
+def test_budget_is_filled_in_relevance_order():
+    docs = [chunk(TEXT[:1500], file_name=f"{i}.pdf") for i in range(4)]
+    one = count_tokens(pack_context(docs[:1], token_budget=10_000)[0])
+    context, report = pack_context(docs, token_budget=int(one * 2.5))
+
+    assert context.startswith("[Source 1 | 0.pdf")
+    assert "[Source 3 | 2.pdf" in context and "3.pdf" not in context
+    assert report["truncated"] and report["dropped_excerpts"] == 1
+    assert report["context_tokens"] <= report["token_budget"]
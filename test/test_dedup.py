@@ -0,0 +1,51 @@
+# test/test_dedup.py
+from langchain_core.documents import Document
+
+from dedup import deduplicate_records, strip_headers_footers
+
+PARAGRAPH = (
+    "Data governance specifies the framework for decision rights and accountabilities "
+    "to encourage desirable behavior in the valuation, creation, storage, use, archival "
+    "and deletion of data and information across the whole enterprise"
+)
+
+
+def record(text, chunk_id, file_name="a.pdf", page=0):
+    return {"text": text, "metadata": {"chunk_id": chunk_id, "file_name": file_name, "page": page}}
+
+
+def test_near_duplicates_point_to_the_kept_chunk():
+    records = [
+        record(PARAGRAPH, "a-0"),
+        record("Une toute autre idée sur la qualité des données de référence, mesurée par des "
+               "indicateurs définis avec les métiers et suivis chaque trimestre", "a-1"),
+        record(PARAGRAPH.replace("whole enterprise", "whole organisation"), "b-0", "b.pdf", 3),
+        record("Court", "b-1", "b.pdf", 4),
+    ]
+    report = deduplicate_records(records, threshold=0.7)
+
+    assert report["removed_chunks"] == 1
+    assert report["removed_tokens"] > 0
+    assert report["groups"] == [{"kept": "a-0", "duplicates": ["b-0"]}]
+    assert records[0]["metadata"]["duplicates"] == [
+        {"chunk_id": "b-0", "file_name": "b.pdf", "page": 3, "author": None, "year": None}
+    ]
+    assert records[2]["metadata"]["duplicate_of"] == "a-0"
+    assert "duplicate_of" not in records[1]["metadata"]
+
+    # Recalcul sans le chunk gardé : l'ancien doublon redevient le chunk gardé
+    remaining = records[1:]
+    assert deduplicate_records(remaining)["removed_chunks"] == 0
+    assert all("duplicate_of" not in r["metadata"] and "duplicates" not in r["metadata"] for r in remaining)
+
+
+def test_repeated_headers_and_footers_are_stripped():
+    bodies = ["Introduction\nLes données", "Méthode\nNous avons", "Résultats\nLa qualité", "Conclusion\nEn somme"]
+    pages = [
+        Document(page_content=f"Journal of Data Management\n{body}\nPage {i + 1} of 4", metadata={"page": i})
+        for i, body in enumerate(bodies)
+    ]
+    removed = strip_headers_footers(pages)
+
+    assert removed["lines"] == 8
+    assert [p.page_content for p in pages] == bodies
@@ -0,0 +1,99 @@
+# test/test_embedding_backends.py
+import threading
+import time
+
+import pytest
+
+from embedding_backends import (
+    EmbeddingMismatchError,
+    LocalEmbeddings,
+    check_embedding_spec,
+    embedding_spec,
+    length_batches,
+    plan_threads,
+)
+from embedding_cache import CachedEmbeddings
+
+
+class FakeEncoder:
+    """Encodeur local factice : vecteur (longueur, 1), lots enregistrés."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def encode(self, texts):
+        self.batches.append(list(texts))
+        time.sleep(self.delay)
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_documents_batched_by_length_in_original_order():
+    encoder = FakeEncoder()
+    embeddings = LocalEmbeddings(encoder, "onnx", "fake-model", workers=2, max_batch_size=2)
+    texts = ["ccc", "a", "dddd", "bb", "eeeee"]
+
+    assert embeddings.embed_documents(texts) == [[float(len(t)), 1.0] for t in texts]
+    # Lots encodés en parallèle : ordre d'exécution libre
+    assert sorted(encoder.batches) == [["a", "bb"], ["ccc", "dddd"], ["eeeee"]]
+
+
+def test_length_batches_bound_padded_tokens():
+    texts = ["x" * 40] * 3 + ["y" * 400]
+    # 12 tokens estimés pour les courts, 102 pour le long : il part seul
+    assert length_batches(texts, max_batch_size=64, max_batch_tokens=100) == [[0, 1, 2], [3]]
+
+
+def test_concurrent_queries_share_one_encode():
+    encoder = FakeEncoder(delay=0.05)
+    embeddings = LocalEmbeddings(encoder, "onnx", "fake-model")
+    embeddings.embed_query("premier")  # démarre le thread, occupe l'encodeur
+
+    results = {}
+    barrier = threading.Barrier(8)
+
+    def ask(i):
+        barrier.wait()
+        results[i] = embeddings.embed_query("q" * i)
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(1, 9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {i: [float(i), 1.0] for i in range(1, 9)}
+    assert len(encoder.batches) < 1 + 8
+
+
+def test_plan_threads_fits_core_count():
+    assert plan_threads(1) == (1, 1)
+    assert plan_threads(8) == (2, 4)
+    assert plan_threads(8, workers=3) == (3, 2)
+    assert plan_threads(2, workers=4) == (2, 1)
+
+
+def test_spec_mismatch_is_refused():
+    local = CachedEmbeddings(LocalEmbeddings(FakeEncoder(), "onnx", "fake-model", int8=True))
+    spec = embedding_spec(local)
+    assert spec == {"embedding_backend": "onnx", "embedding_model": "fake-model", "embedding_int8": True}
+    check_embedding_spec(spec, local)
+
+    with pytest.raises(EmbeddingMismatchError, match="onnx / fake-model"):
+        check_embedding_spec({**spec, "embedding_int8": False}, local)
+    # Index antérieur au manifest d'embeddings : construit avec OpenAI
+    with pytest.raises(EmbeddingMismatchError):
+        check_embedding_spec({"index_type": "flat"}, local)
+
+
+def test_rag_config_reads_normalized_embedding_settings(monkeypatch):
+    import rag_pipeline
+
+    monkeypatch.setenv("LITTERA_EMBEDDING_BACKEND", " ONNX ")
+    monkeypatch.setenv("LITTERA_EMBEDDING_INT8", "True")
+    config = rag_pipeline.RagConfig()
+    assert (config.embedding_backend, config.embedding_int8) == ("onnx", True)
+
+    monkeypatch.setenv("LITTERA_EMBEDDING_BACKEND", "cohere")
+    with pytest.raises(ValueError, match="cohere"):
+        rag_pipeline.RagConfig()
@@ -0,0 +1,147 @@
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    model = "fake-model"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_rebuild_hits_cache(tmp_path):
+    fake = CountingEmbeddings()
+    cache = CachedEmbeddings(fake, tmp_path / "emb.sqlite")
+    assert cache.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert fake.calls == [["a", "bb"]]
+
+    # Nouveau processus / nouvelle instance : tout vient du disque
+    cache2 = CachedEmbeddings(fake, tmp_path / "emb.sqlite")
+    cache2.embed_documents(["a", "bb", "ccc"])
+    assert fake.calls[-1] == ["ccc"]
+    assert cache2.stats()["hits"] == 2
+    assert cache2.stats()["misses"] == 1
+    assert cache2.embed_query("bb") == [2.0, 1.0]
+    assert len(fake.calls) == 2
+
+
+def test_model_name_is_part_of_key(tmp_path):
+    fake = CountingEmbeddings()
+    CachedEmbeddings(fake, tmp_path / "emb.sqlite").embed_documents(["x"])
+    CachedEmbeddings(fake, tmp_path / "emb.sqlite", model_name="other").embed_documents(["x"])
+    assert len(fake.calls) == 2
+
+
+def test_lru_eviction(tmp_path):
+    fake = CountingEmbeddings()
+    cache = CachedEmbeddings(fake, tmp_path / "emb.sqlite", max_entries=2)
+    cache.embed_documents(["a"])
+    cache.embed_documents(["bb"])
+    cache.embed_query("a")  # "a" redevient récent
+    cache.embed_documents(["ccc"])  # évince "bb"
+    assert cache.stats()["entries"] == 2
+    cache.embed_documents(["a", "bb"])
+    assert fake.calls[-1] == ["bb"]
+
+
+def test_concurrent_access(tmp_path):
+    fake = CountingEmbeddings()
+    cache = CachedEmbeddings(fake, tmp_path / "emb.sqlite")
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(20):
+                cache.embed_documents([f"t{n}-{i}", "shared"])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert cache.stats()["entries"] == 81
+
+
+def test_query_cache_normalizes_and_expires(tmp_path, monkeypatch):
+    import embedding_cache
+    from embedding_cache import QueryEmbeddingCache
+
+    fake = CountingEmbeddings()
+    cache = QueryEmbeddingCache(fake, max_entries=2, ttl=10)
+    assert cache.embed_query("  Data   Governance ") == cache.embed_query("data governance")
+    # Normalisée pour la clé seulement : la question embeddée est celle posée
+    assert fake.calls == [["  Data   Governance "]]
+
+    # Éviction LRU
+    cache.embed_query("a")
+    cache.embed_query("b")
+    cache.embed_query("data governance")
+    assert len(fake.calls) == 4
+
+    # Expiration (TTL)
+    now = embedding_cache.time.monotonic()
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now + 11)
+    cache.embed_query("b")
+    assert len(fake.calls) == 5
+    assert cache.stats()["query_hits"] == 1
+
+
+def test_query_cache_batches_missing_questions():
+    from embedding_cache import QueryEmbeddingCache
+
+    fake = CountingEmbeddings()
+    cache = QueryEmbeddingCache(fake)
+    cache.embed_query("a")
+    vectors = cache.embed_queries(["A", "bb", "Bb ", "ccc"])
+    assert vectors == [[1.0, 1.0], [2.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert sorted(fake.calls) == [["a"], ["bb"], ["ccc"]]
+    assert cache.stats()["query_hits"] == 1
+
+
+def test_query_cache_embeds_questions_as_queries():
+    from embedding_cache import QueryEmbeddingCache
+
+    class PrefixedEmbeddings(CountingEmbeddings):
+        # Comme e5 / bge : une question n'est pas encodée comme un passage
+        def embed_query(self, text):
+            return self.embed_documents(["query: " + text])[0]
+
+    fake = PrefixedEmbeddings()
+    cache = QueryEmbeddingCache(fake)
+    cache.embed_queries(["Quoi ?", "Pourquoi ?"])
+    cache.embed_query("Comment ?")
+    assert sorted(fake.calls) == [["query: Comment ?"], ["query: Pourquoi ?"], ["query: Quoi ?"]]
+
+
+def test_cache_hits_do_not_write_until_flush(tmp_path, monkeypatch):
+    import sqlite3
+
+    import embedding_cache
+
+    monkeypatch.setattr(embedding_cache, "TOUCH_FLUSH_KEYS", 3)
+    cache = CachedEmbeddings(CountingEmbeddings(), tmp_path / "emb.sqlite")
+    cache.embed_documents(["a", "bb", "ccc"])
+
+    def last_access():
+        with sqlite3.connect(tmp_path / "emb.sqlite") as conn:
+            return dict(conn.execute("SELECT key, last_access FROM embeddings").fetchall())
+
+    before = last_access()
+    cache.embed_documents(["a", "bb"])
+    assert last_access() == before  # dates d'accès gardées en mémoire
+    cache.embed_query("ccc")  # 3 clés en attente : un seul lot écrit
+    after = last_access()
+    assert all(after[key] > before[key] for key in before)
@@ -0,0 +1,37 @@
+# test/test_import_time.py
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# Mesuré dans un interpréteur neuf : les autres tests ont déjà tout importé
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import rag_pipeline
+elapsed = time.perf_counter() - start
+heavy = [m for m in ("faiss", "numpy", "openai", "langchain_core", "langchain_community") if m in sys.modules]
+rag_pipeline.config.openrouter_api_key = None
+try:
+    rag_pipeline.get_client()
+    error = None
+except ValueError as e:
+    error = str(e)
+print(json.dumps({"elapsed": elapsed, "heavy": heavy, "error": error}))
+"""
+
+
+def test_import_is_fast_and_does_not_need_api_key():
+    env = {k: v for k, v in os.environ.items() if k not in ("OPENROUTER_API_KEY", "OPENAI_API_KEY")}
+    out = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+
+    assert result["heavy"] == []
+    assert result["elapsed"] < 0.5
+    # La clé manquante n'est signalée qu'au premier appel du LLM
+    assert "OPENROUTER_API_KEY" in result["error"]
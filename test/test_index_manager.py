@@ -0,0 +1,108 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from index_manager import (
+    KEEP_VERSIONS,
+    IndexManager,
+    publish_index,
+    read_index_signature,
+    resolve_index_dir,
+    write_manifest,
+)
+
+
+class FakeStore:
+    def __init__(self, text):
+        self.text = text
+
+    def save_local(self, folder):
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        (Path(folder) / "index.faiss").write_text(self.text)
+        (Path(folder) / "index.pkl").write_text(self.text)
+
+
+def test_loads_once_and_hot_reloads(tmp_path):
+    calls = []
+
+    def loader(index_dir):
+        calls.append(1)
+        return (index_dir / "index.faiss").read_text()
+
+    publish_index(FakeStore("v1"), tmp_path)
+    manager = IndexManager(tmp_path, loader, check_interval=0)
+
+    assert manager.get() == "v1"
+    assert manager.get() == "v1"
+    assert len(calls) == 1
+
+    publish_index(FakeStore("v2"), tmp_path)
+    # L'ancien index reste servi pendant le rechargement en arrière-plan
+    deadline = time.time() + 5
+    while manager.get() != "v2" and time.time() < deadline:
+        time.sleep(0.01)
+    assert manager.get() == "v2"
+    assert manager.version == read_index_signature(tmp_path)
+
+
+def test_readers_not_blocked_during_reload(tmp_path):
+    release = threading.Event()
+
+    def loader(index_dir):
+        if len(loaded) == 1:
+            release.wait(5)
+        loaded.append(1)
+        return len(loaded)
+
+    loaded = []
+    write_manifest(tmp_path)
+    manager = IndexManager(tmp_path, loader, check_interval=0)
+    assert manager.get() == 1
+
+    write_manifest(tmp_path)
+    start = time.perf_counter()
+    assert manager.get() == 1  # déclenche le rechargement, renvoie l'ancien
+    assert manager.get() == 1
+    assert time.perf_counter() - start < 1.0
+
+    release.set()
+    deadline = time.time() + 5
+    while manager.get() != 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert manager.get() == 2
+
+
+def test_each_publish_gets_its_own_directory(tmp_path):
+    seen = []
+
+    def loader(index_dir):
+        # Tous les fichiers lus viennent de la même publication
+        texts = {(index_dir / name).read_text() for name in ("index.faiss", "index.pkl")}
+        assert len(texts) == 1
+        seen.append(index_dir)
+        return texts.pop()
+
+    first = resolve_index_dir(tmp_path, publish_index(FakeStore("v1"), tmp_path))
+    manager = IndexManager(tmp_path, loader, check_interval=0)
+    assert manager.get() == "v1"
+
+    for i in range(2, KEEP_VERSIONS + 3):
+        publish_index(FakeStore(f"v{i}"), tmp_path)
+    assert manager.reload() == f"v{KEEP_VERSIONS + 2}"
+    assert seen[-1] == resolve_index_dir(tmp_path) != first
+    # Les fichiers d'une version publiée ne sont jamais réécrits en place
+    assert not (tmp_path / "index.faiss").exists()
+    assert len(list((tmp_path / "versions").iterdir())) == KEEP_VERSIONS
+
+
+def test_load_raises_instead_of_mixing_versions(tmp_path):
+    def loader(index_dir):
+        # Une publication (ancienne disposition) à chaque lecture
+        write_manifest(tmp_path)
+        return "mélange"
+
+    manager = IndexManager(tmp_path, loader, check_interval=0)
+    with pytest.raises(RuntimeError):
+        manager.get()
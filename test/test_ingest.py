@@ -0,0 +1,209 @@
+import json
+
+import fitz
+from langchain_core.embeddings import Embeddings
+
+import build_index
+import ingest
+from embedding_cache import CachedEmbeddings
+
+
+class FakeEmbeddings(Embeddings):
+    model = "fake"
+
+    def __init__(self, **kwargs):
+        pass
+
+    def embed_documents(self, texts):
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+    doc.save(str(path))
+
+
+def setup_paths(tmp_path, monkeypatch):
+    pdf_dir = tmp_path / "pdf"
+    pdf_dir.mkdir()
+    monkeypatch.setattr(ingest, "PDF_DIR", pdf_dir)
+    monkeypatch.setattr(ingest, "OUT_PATH", tmp_path / "chunks.json")
+    monkeypatch.setattr(ingest, "MANIFEST_PATH", tmp_path / "manifest.json")
+    monkeypatch.setattr(build_index, "CHUNKS_PATH", tmp_path / "chunks.json")
+    monkeypatch.setattr(build_index, "INDEX_DIR", tmp_path / "index")
+    monkeypatch.setattr(build_index, "CHECKPOINT_DIR", tmp_path / "checkpoints")
+    monkeypatch.setattr(build_index, "OpenAIEmbeddings", FakeEmbeddings)
+    monkeypatch.setattr(
+        build_index, "CachedEmbeddings",
+        lambda e: CachedEmbeddings(e, tmp_path / "emb.sqlite"),
+    )
+    return pdf_dir
+
+
+def saved_ids(tmp_path):
+    with open(tmp_path / "chunks.json", encoding="utf-8") as f:
+        return [r["metadata"]["chunk_id"] for r in json.load(f)]
+
+
+def indexed_ids(tmp_path):
+    vs = build_index.load_existing_index(FakeEmbeddings())
+    return set(vs.index_to_docstore_id.values())
+
+
+def test_incremental_ingestion(tmp_path, monkeypatch, capsys):
+    pdf_dir = setup_paths(tmp_path, monkeypatch)
+    make_pdf(pdf_dir / "a.pdf", ["Article A page 1", "Article A page 2"])
+    make_pdf(pdf_dir / "b.pdf", ["Article B"])
+    make_pdf(pdf_dir / "c.pdf", ["Article C"])
+
+    ingest.main()
+    build_index.build_index()
+    first = saved_ids(tmp_path)
+    assert len(first) == 4
+    assert indexed_ids(tmp_path) == set(first)
+
+    # Rien n'a changé → aucun PDF relu
+    capsys.readouterr()
+    ingest.main()
+    assert "[LOAD]" not in capsys.readouterr().out
+
+    # Ajout d'un PDF : les ids existants ne bougent pas
+    make_pdf(pdf_dir / "0_new.pdf", ["Nouvel article"])
+    ingest.main()
+    assert "[LOAD] 0_new.pdf" in capsys.readouterr().out
+    ids = saved_ids(tmp_path)
+    assert set(first) < set(ids)
+
+    # Suppression : chunks retirés de chunks.json et de l'index, sans rebuild
+    build_index.build_index()
+    (pdf_dir / "b.pdf").unlink()
+    removed = json.loads((tmp_path / "manifest.json").read_text())["b.pdf"]["chunk_ids"]
+    ingest.main()
+    ids = saved_ids(tmp_path)
+    assert not set(removed) & set(ids)
+    assert indexed_ids(tmp_path) == set(ids)
+
+
+def test_build_in_windows_matches_single_pass(tmp_path, monkeypatch):
+    pdf_dir = setup_paths(tmp_path, monkeypatch)
+    for i in range(3):
+        make_pdf(pdf_dir / f"doc{i}.pdf", [f"Document {i} page {p}" for p in range(3)])
+    ingest.main()
+    ids = saved_ids(tmp_path)
+
+    # Fenêtres de 2 chunks : 9 chunks → 5 fenêtres
+    monkeypatch.setattr(build_index, "WINDOW_BATCHES", 1)
+    build_index.build_index(full=True, batch_size=2)
+    vs = build_index.load_existing_index(FakeEmbeddings())
+    assert [vs.index_to_docstore_id[i] for i in range(len(ids))] == ids
+    expected = FakeEmbeddings().embed_documents([vs.docstore.search(i).page_content for i in ids])
+    assert vs.index.reconstruct_n(0, len(ids)).tolist() == expected
+
+    # Incrémental par fenêtres : seuls les nouveaux chunks sont ajoutés
+    make_pdf(pdf_dir / "doc3.pdf", [f"Document 3 page {p}" for p in range(3)])
+    ingest.main()
+    build_index.build_index(batch_size=2)
+    assert indexed_ids(tmp_path) == set(saved_ids(tmp_path))
+
+    # Index approximatif : entraîné sur les vecteurs relus de l'index exact
+    build_index.build_index(full=True, batch_size=2, index_type="hnsw")
+    assert indexed_ids(tmp_path) == set(saved_ids(tmp_path))
+    assert json.loads((tmp_path / "index" / "manifest.json").read_text())["index_type"] == "hnsw"
+
+
+def test_duplicate_chunks_are_not_indexed_but_cited(tmp_path, monkeypatch):
+    pdf_dir = setup_paths(tmp_path, monkeypatch)
+    licence = ("This article is distributed under the terms of the Creative Commons\n"
+               "Attribution License which permits unrestricted use distribution and\n"
+               "reproduction in any medium provided the original work is properly cited")
+    make_pdf(pdf_dir / "a.pdf", [licence])
+    make_pdf(pdf_dir / "b.pdf", ["Article B", licence])
+
+    ingest.main()
+    build_index.build_index()
+    records = ingest.load_saved_chunks(tmp_path / "chunks.json")
+    duplicate = next(r for r in records if r["metadata"].get("duplicate_of"))
+    assert duplicate["metadata"]["file_name"] == "b.pdf"
+    assert duplicate["metadata"]["chunk_id"] not in indexed_ids(tmp_path)
+
+    kept = build_index.load_existing_index(FakeEmbeddings()).docstore.search(duplicate["metadata"]["duplicate_of"])
+    assert kept.metadata["duplicates"] == [
+        {"chunk_id": duplicate["metadata"]["chunk_id"], "file_name": "b.pdf", "page": 1, "author": "", "year": None}
+    ]
+    report = json.loads((tmp_path / "dedup_report.json").read_text())
+    assert report["removed_chunks"] == 1
+
+
+def test_parallel_matches_serial_and_isolates_failures(tmp_path):
+    pdf_dir = tmp_path / "pdf"
+    pdf_dir.mkdir()
+    for i in range(4):
+        make_pdf(pdf_dir / f"doc{i}.pdf", [f"Document {i} page {p}" for p in range(3)])
+    (pdf_dir / "broken.pdf").write_bytes(b"%PDF-1.4 pas vraiment un pdf")
+
+    pdf_paths = sorted(pdf_dir.glob("*.pdf"))
+    hashes = {p.name: ingest.file_sha256(p) for p in pdf_paths}
+
+    serial = list(ingest.process_pdfs(pdf_paths, hashes, workers=1))
+    parallel = list(ingest.process_pdfs(pdf_paths, hashes, workers=2))
+
+    assert [(p.name, r, e is None) for p, r, e in serial] == \
+        [(p.name, r, e is None) for p, r, e in parallel]
+    errors = {p.name for p, _, e in parallel if e is not None}
+    assert errors == {"broken.pdf"}
+
+
+def test_streaming_pipeline_matches_batch(tmp_path, monkeypatch):
+    import stream_pipeline
+
+    pdf_dir = setup_paths(tmp_path, monkeypatch)
+    licence = ("This article is distributed under the terms of the Creative Commons\n"
+               "Attribution License which permits unrestricted use distribution and\n"
+               "reproduction in any medium provided the original work is properly cited")
+    for i in range(3):
+        make_pdf(pdf_dir / f"doc{i}.pdf", [f"Document {i} page {p}" for p in range(2)] + [licence])
+    ingest.main()
+    expected = ingest.load_saved_chunks(tmp_path / "chunks.json")
+    expected_report = json.loads((tmp_path / "dedup_report.json").read_text())
+
+    vs = stream_pipeline.run_streaming(
+        pdf_dir=pdf_dir,
+        out_path=tmp_path / "stream_chunks.json",
+        manifest_path=tmp_path / "stream_manifest.json",
+        index_dir=tmp_path / "stream_index",
+        embeddings=FakeEmbeddings(),
+        batch_size=2,
+    )
+    # Mêmes quasi-doublons que ingest.py : dans chunks.json, pas dans l'index
+    assert ingest.load_saved_chunks(tmp_path / "stream_chunks.json") == expected
+    assert sorted(vs.index_to_docstore_id.values()) == sorted(
+        r["metadata"]["chunk_id"] for r in expected if not r["metadata"].get("duplicate_of")
+    )
+    kept = next(r for r in expected if r["metadata"].get("duplicates"))
+    assert len(kept["metadata"]["duplicates"]) == 2
+    assert vs.docstore.search(kept["metadata"]["chunk_id"]).metadata == kept["metadata"]
+    assert json.loads((tmp_path / "dedup_report.json").read_text()) == expected_report
+    # Le format en streaming reste du JSON standard
+    with open(tmp_path / "stream_chunks.json", encoding="utf-8") as f:
+        assert json.load(f) == expected
+
+
+def test_reads_legacy_indented_chunks(tmp_path):
+    records = [{"text": "a", "metadata": {"chunk_id": 0}}, {"text": "b", "metadata": {}}]
+    path = tmp_path / "chunks.json"
+    path.write_text(json.dumps(records, indent=2), encoding="utf-8")
+    assert list(ingest.iter_saved_chunks(path)) == records
+
+
+def test_extract_author_year():
+    from ingest import extract_author_year
+
+    assert extract_author_year({"author": " Boris  Otto ", "creationdate": "D:20190101"}, "Otto_2011.pdf") == ("Boris Otto", 2011)
+    assert extract_author_year({"creationdate": "D:20190101120000"}, "article.pdf") == ("", 2019)
+    assert extract_author_year({}, "article.pdf") == ("", None)
@@ -0,0 +1,86 @@
+# test/test_metadata_index.py
+import numpy as np
+
+from ann_index import build_faiss_index, set_search_params
+from metadata_index import MetadataIndex, filtered_search
+
+METADATAS = [
+    {"file_name": f"doc{i % 5}.pdf", "page": i % 7, "author": ["Boris Otto", "Vijay Khatri", ""][i % 3],
+     "year": 2010 + i % 5 if i % 5 else None}
+    for i in range(2000)
+]
+
+
+def test_filters_resolve_to_positions(tmp_path):
+    index = MetadataIndex.build(METADATAS)
+    index.save(tmp_path / "metadata.npz")
+    index = MetadataIndex.load(tmp_path / "metadata.npz")
+
+    def expected(pred):
+        return [i for i, m in enumerate(METADATAS) if pred(m)]
+
+    assert index.positions({"file_name": "doc2.pdf"}).tolist() == expected(lambda m: m["file_name"] == "doc2.pdf")
+    assert index.positions({"author": "otto", "page": (2, 3)}).tolist() == expected(
+        lambda m: m["author"] == "Boris Otto" and m["page"] in (2, 3)
+    )
+    assert index.positions({"year": (2012, None)}).tolist() == expected(lambda m: (m["year"] or 0) >= 2012)
+    assert index.values("year") == [2011, 2012, 2013, 2014]
+    assert len(index.positions({"author": "inconnu"})) == 0
+
+
+def test_duplicates_match_filters_on_their_own_file(tmp_path):
+    metadatas = [
+        {"file_name": "a.pdf", "page": 1, "author": "Boris Otto", "year": 2011,
+         "duplicates": [{"chunk_id": "b-0", "file_name": "b.pdf", "page": 4, "author": "Vijay Khatri", "year": 2019}]},
+        {"file_name": "b.pdf", "page": 2, "author": "Vijay Khatri", "year": 2019},
+        {"file_name": "c.pdf", "page": 4, "author": "Boris Otto", "year": 2011},
+    ]
+    index = MetadataIndex.build(metadatas)
+    index.save(tmp_path / "metadata.npz")
+    index = MetadataIndex.load(tmp_path / "metadata.npz")
+
+    assert len(index) == 3
+    assert index.positions({"file_name": "b.pdf"}).tolist() == [0, 1]
+    assert index.positions({"author": "khatri", "year": 2019, "page": 4}).tolist() == [0]
+    # Les attributs d'une même ligne : b.pdf n'a pas de page 1
+    assert index.positions({"file_name": "b.pdf", "page": 1}).tolist() == []
+    assert index.positions({"year": (None, 2012)}).tolist() == [0, 2]
+
+
+def test_filtered_search_returns_full_top_k_on_ivf():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 16)).astype(np.float32)
+    index = build_faiss_index(vectors, "ivf", nlist=32)
+    set_search_params(index, nprobe=1)
+
+    positions = MetadataIndex.build(METADATAS).positions({"file_name": "doc3.pdf", "page": 0})
+    _, ids = filtered_search(index, vectors[:5], 10, positions)
+
+    assert (ids >= 0).all()
+    assert set(ids.ravel()) <= set(positions.tolist())
+
+
+def test_selection_is_reused_per_filter():
+    index = MetadataIndex.build(METADATAS)
+    selection = index.selection({"file_name": "doc2.pdf", "page": (2, 3)})
+
+    assert index.selection({"page": (2, 3), "file_name": "doc2.pdf"}) is selection
+    assert selection.positions.tolist() == index.positions({"file_name": "doc2.pdf", "page": (2, 3)}).tolist()
+    # Liste de valeurs ≠ intervalle
+    assert index.selection({"file_name": "doc2.pdf", "page": [2, 3]}) is not selection
+
+
+def test_filtered_search_falls_back_to_scan_on_hnsw():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 16)).astype(np.float32)
+    index = build_faiss_index(vectors, "hnsw")
+    set_search_params(index, ef_search=1)
+
+    selection = MetadataIndex.build(METADATAS).selection({"file_name": "doc3.pdf", "page": 0, "author": "otto"})
+    k = len(selection.positions) + 5
+    distances, ids = filtered_search(index, vectors[:3], k, selection.positions, selection.selector)
+
+    n = len(selection.positions)
+    assert (ids[:, :n] >= 0).all() and (ids[:, n:] == -1).all()
+    assert all(set(row[:n]) == set(selection.positions.tolist()) for row in ids)
+    assert (np.diff(distances[:, :n], axis=1) >= 0).all()
@@ -0,0 +1,57 @@
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from ann_index import build_faiss_index
+from index_manager import publish_index, resolve_index_dir
+from mmap_store import DOCSTORE_NAME, load_mmap_vectorstore, write_mmap_docstore
+
+
+class HashEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        rng = np.random.default_rng(sum(map(ord, text)))
+        return rng.normal(size=16).tolist()
+
+
+def make_store(n=200):
+    texts = [f"passage {i} sur la gouvernance des données" for i in range(n)]
+    ids = [f"{i:016x}-{i % 7:05d}" for i in range(n)]
+    metas = [{"file_name": f"doc{i % 5}.pdf", "page": i % 11, "chunk_id": ids[i]} for i in range(n)]
+    return FAISS.from_texts(texts, HashEmbeddings(), metadatas=metas, ids=ids)
+
+
+def publish(vs, index_dir):
+    manifest = publish_index(vs, index_dir, sidecars={
+        DOCSTORE_NAME: lambda path: write_mmap_docstore(vs, path),
+    })
+    return resolve_index_dir(index_dir, manifest)
+
+
+def test_mmap_loader_matches_load_local(tmp_path):
+    vs = make_store()
+    index_dir = publish(vs, tmp_path)
+
+    mapped = load_mmap_vectorstore(index_dir, HashEmbeddings())
+    for query in ["passage 3", "gouvernance", "données 42"]:
+        expected = vs.similarity_search_with_score(query, k=5)
+        got = mapped.similarity_search_with_score(query, k=5)
+        assert [(d.id, d.page_content, d.metadata) for d, _ in got] == \
+            [(d.id, d.page_content, d.metadata) for d, _ in expected]
+
+    assert mapped.docstore.search("inconnu").startswith("ID inconnu")
+    assert len(mapped.index_to_docstore_id) == 200
+
+
+def test_mmap_loader_with_ivf_index(tmp_path):
+    vs = make_store(2000)
+    vectors = vs.index.reconstruct_n(0, vs.index.ntotal)
+    vs.index = build_faiss_index(vectors, "ivf", nlist=16)
+    index_dir = publish(vs, tmp_path)
+
+    mapped = load_mmap_vectorstore(index_dir, HashEmbeddings(), index_type="ivf")
+    mapped.index.nprobe = 16
+    docs = mapped.similarity_search("passage 12", k=3)
+    assert len(docs) == 3
@@ -0,0 +1,38 @@
+# test/test_mmr.py
+import faiss
+import numpy as np
+
+from mmr import mmr_select, reconstruct_vectors
+
+
+def test_lambda_one_keeps_relevance_order():
+    rng = np.random.default_rng(0)
+    candidates = rng.normal(size=(30, 16)).astype(np.float32)
+    query = rng.normal(size=16).astype(np.float32)
+
+    cosine = candidates @ query / np.linalg.norm(candidates, axis=1) / np.linalg.norm(query)
+    assert mmr_select(query, candidates, 5, lambda_mult=1.0) == list(np.argsort(-cosine)[:5])
+
+
+def test_near_duplicates_are_skipped():
+    query = [1.0, 0.0, 0.0]
+    candidates = [
+        [0.9, 0.43, 0.0],    # le plus pertinent
+        [0.9, 0.43, 0.01],   # quasi-doublon du premier
+        [0.8, -0.6, 0.0],    # un peu moins pertinent, mais différent
+    ]
+    assert mmr_select(query, candidates, 2, lambda_mult=1.0) == [0, 1]
+    assert mmr_select(query, candidates, 2, lambda_mult=0.5) == [0, 2]
+    assert sorted(mmr_select(query, candidates, 10)) == [0, 1, 2]
+    assert mmr_select(query, np.zeros((0, 3)), 4) == []
+
+
+def test_reconstruct_vectors_from_ivf_index():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(400, 8)).astype(np.float32)
+    index = faiss.index_factory(8, "IVF4,Flat")
+    index.train(vectors)
+    index.add(vectors)
+
+    # Sans table d'accès direct, faiss refuse reconstruct : elle est construite au premier appel
+    np.testing.assert_allclose(reconstruct_vectors(index, [3, 0, 399]), vectors[[3, 0, 399]])
@@ -0,0 +1,233 @@
+# test/test_rag_pipeline.py
+import os
+from types import SimpleNamespace
+
+# Clés factices : le client est remplacé, aucun appel réseau
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import rag_pipeline
+from answer_cache import AnswerCache
+from langchain_core.documents import Document
+
+
+class FakeCompletions:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.calls = []
+
+    def create(self, stream=False, **kwargs):
+        self.calls.append({"stream": stream, **kwargs})
+        chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=p))])
+            for p in self.pieces
+        ]
+        # Dernier chunk sans contenu (fin de génération) puis chunk d'usage sans choices
+        chunks.append(SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None))]))
+        chunks.append(SimpleNamespace(choices=[]))
+        return iter(chunks)
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, float(len(text))]
+
+
+def setup_fakes(monkeypatch, tmp_path, pieces):
+    completions = FakeCompletions(pieces)
+    monkeypatch.setattr(rag_pipeline, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(rag_pipeline, "embeddings", FakeEmbeddings())
+    monkeypatch.setattr(rag_pipeline, "answer_cache", AnswerCache(cache_path=tmp_path / "answers.sqlite"))
+    # Index publié servi : les réponses sont mises en cache sous sa version
+    monkeypatch.setattr(rag_pipeline, "index_manager", SimpleNamespace(version=("manifest", "v1")))
+    return completions
+
+
+def test_stream_yields_tokens_and_caches_full_answer(monkeypatch, tmp_path):
+    completions = setup_fakes(monkeypatch, tmp_path, ["La ", "gouvernance ", "des données."])
+    docs = [Document(id="a", page_content="texte", metadata={"file_name": "x.pdf", "page": 1})]
+
+    assert list(rag_pipeline.stream_answer("question ?", docs)) == ["La ", "gouvernance ", "des données."]
+    assert completions.calls[0]["stream"] is True
+
+    # Deuxième fois : réponse complète depuis le cache, sans appel au LLM
+    assert list(rag_pipeline.stream_answer("question ?", docs)) == ["La gouvernance des données."]
+    assert len(completions.calls) == 1
+
+
+def test_stream_reports_the_context_it_sent(monkeypatch, tmp_path):
+    from context_packing import pack_context
+
+    setup_fakes(monkeypatch, tmp_path, ["Réponse."])
+    docs = [Document(id="a", page_content="texte", metadata={"file_name": "x.pdf", "page": 1})]
+
+    report = {}
+    assert "".join(rag_pipeline.stream_answer("question ?", docs, report)) == "Réponse."
+    assert report == pack_context(docs, rag_pipeline.config.context_token_budget)[1]
+
+    # Réponse en cache : aucun contexte construit, le rapport reste vide
+    report = {}
+    assert "".join(rag_pipeline.stream_answer("question ?", docs, report)) == "Réponse."
+    assert report == {}
+
+
+def test_answer_questions_batches_search_and_bounds_llm_calls(monkeypatch, tmp_path):
+    import asyncio
+
+    from langchain_community.vectorstores import FAISS
+
+    class BatchEmbeddings(FakeEmbeddings):
+        def __init__(self):
+            self.batches = []
+
+        def embed_queries(self, texts):
+            self.batches.append(list(texts))
+            return [self.embed_query(t) for t in texts]
+
+    class FakeAsyncCompletions:
+        def __init__(self):
+            self.in_flight = 0
+            self.max_in_flight = 0
+
+        async def create(self, messages, **kwargs):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            question = messages[1]["content"].splitlines()[1]
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"R: {question}"))])
+
+    fake_embeddings = BatchEmbeddings()
+    vectorstore = FAISS.from_embeddings(
+        [("court", [1.0, 5.0]), ("long", [1.0, 30.0])],
+        fake_embeddings,
+        ids=["court", "long"],
+    )
+    completions = FakeAsyncCompletions()
+    monkeypatch.setattr(rag_pipeline, "embeddings", fake_embeddings)
+    monkeypatch.setattr(rag_pipeline, "get_vectorstore", lambda: vectorstore)
+    monkeypatch.setattr(rag_pipeline, "answer_cache", AnswerCache(cache_path=tmp_path / "answers.sqlite"))
+    monkeypatch.setattr(rag_pipeline, "async_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+    questions = ["q1 ?", "une question bien plus longue ?", "q3 ?", "q4 ?"]
+    results = asyncio.run(rag_pipeline.answer_questions(questions, k=1, concurrency=2, mode="dense"))
+
+    assert [answer for answer, _ in results] == [f"R: {q}" for q in questions]
+    assert [docs[0].id for _, docs in results] == ["court", "long", "court", "court"]
+    assert fake_embeddings.batches == [questions]
+    assert completions.max_in_flight == 2
+
+
+def test_search_docs_with_filters_returns_full_top_k(monkeypatch):
+    from langchain_community.vectorstores import FAISS
+
+    texts = [(f"passage {i}", [float(i), 1.0]) for i in range(50)]
+    metadatas = [{"file_name": f"doc{i % 2}.pdf", "page": i, "author": "Boris Otto" if i % 2 else "", "year": 2011}
+                 for i in range(50)]
+    vectorstore = FAISS.from_embeddings(texts, FakeEmbeddings(), metadatas=metadatas)
+
+    docs = rag_pipeline.search_docs(vectorstore, "x" * 3, k=4, mode="dense", filters={"author": "otto"})
+
+    assert [d.metadata["page"] for d in docs] == [1, 3, 5, 7]
+
+
+def test_search_docs_merges_base_and_session_overlay():
+    from langchain_community.vectorstores import FAISS
+
+    base = FAISS.from_embeddings([(f"base {i}", [1.0, float(2 * i)]) for i in range(10)], FakeEmbeddings(),
+                                 metadatas=[{"file_name": "base.pdf"}] * 10)
+    overlay = FAISS.from_embeddings([(f"upload {i}", [1.0, float(2 * i + 1)]) for i in range(3)], FakeEmbeddings(),
+                                    metadatas=[{"file_name": "upload.pdf"}] * 3)
+    base_size = base.index.ntotal
+
+    # FakeEmbeddings : "xxx" → [1, 3] ; plus proches voisins : upload 1 ([1, 3]), base 1 et 2 ([1, 2], [1, 4])
+    docs = rag_pipeline.search_docs(base, "xxx", k=3, mode="dense", overlay=overlay)
+    assert sorted(d.page_content for d in docs) == ["base 1", "base 2", "upload 1"]
+
+    docs = rag_pipeline.search_docs(base, "xxxxxx", k=2, mode="dense", overlay=overlay,
+                                    filters={"file_name": "upload.pdf"})
+    assert [d.page_content for d in docs] == ["upload 2", "upload 1"]
+    assert base.index.ntotal == base_size
+
+
+def test_search_docs_keeps_one_copy_of_chunks_in_base_and_overlay():
+    from langchain_community.vectorstores import FAISS
+
+    texts = [(f"passage {i}", [1.0, float(i)]) for i in range(6)]
+    ids = [f"chunk-{i}" for i in range(6)]
+    base = FAISS.from_embeddings(texts, FakeEmbeddings(), ids=ids)
+    # Le même PDF, uploadé pendant la session
+    overlay = FAISS.from_embeddings(texts[:3], FakeEmbeddings(), ids=ids[:3])
+
+    for mode in ("dense", "mmr"):
+        docs = rag_pipeline.search_docs(base, "xx", k=4, mode=mode, overlay=overlay)
+        assert len(docs) == 4
+        assert len({d.id for d in docs}) == 4
+
+
+def test_stream_answer_emits_stage_spans(monkeypatch, tmp_path):
+    import json
+
+    import tracing
+
+    setup_fakes(monkeypatch, tmp_path, ["Réponse ", "tracée."])
+    docs = [Document(id="a", page_content="texte", metadata={"file_name": "x.pdf", "page": 1})]
+    tracing.enable(tmp_path / "spans.jsonl")
+    try:
+        assert "".join(rag_pipeline.stream_answer("question ?", docs)) == "Réponse tracée."
+    finally:
+        tracing.disable()
+
+    spans = {s["span"]: s for s in map(json.loads, (tmp_path / "spans.jsonl").read_text().splitlines())}
+    assert set(spans) >= {"rag.embed_query", "rag.answer_cache", "rag.context", "rag.llm", "rag.answer"}
+    assert spans["rag.answer"]["cache_hit"] is False
+    assert spans["rag.context"]["context_tokens"] > 0
+    assert spans["rag.llm"]["completion_tokens"] > 0 and "first_token_seconds" in spans["rag.llm"]
+    assert all(s["trace_id"] == spans["rag.answer"]["trace_id"] for s in spans.values())
+
+
+def test_search_docs_mmr_mode_skips_near_duplicates():
+    from langchain_community.vectorstores import FAISS
+
+    class AxisEmbeddings:
+        def embed_query(self, text):
+            return [1.0, 0.0, 0.0]
+
+    vectorstore = FAISS.from_embeddings(
+        [("page 1", [0.9, 0.43, 0.0]), ("page 2", [0.9, 0.43, 0.01]), ("autre article", [0.8, -0.6, 0.0])],
+        AxisEmbeddings(),
+    )
+
+    dense = rag_pipeline.search_docs(vectorstore, "q", k=2, mode="dense")
+    diverse = rag_pipeline.search_docs(vectorstore, "q", k=2, mode="mmr", mmr_lambda=0.5)
+
+    assert [d.page_content for d in dense] == ["page 1", "page 2"]
+    assert [d.page_content for d in diverse] == ["page 1", "autre article"]
+
+
+def test_sidecars_come_from_the_same_build_as_the_vectorstore(monkeypatch, tmp_path):
+    from langchain_community.vectorstores import FAISS
+
+    from build_index import index_sidecars
+    from index_manager import IndexManager, publish_index
+
+    def publish(file_name):
+        # Même nombre de chunks d'un build à l'autre
+        vs = FAISS.from_embeddings([(f"passage {i}", [1.0, float(i)]) for i in range(4)], FakeEmbeddings(),
+                                   metadatas=[{"file_name": file_name}] * 4)
+        publish_index(vs, tmp_path, sidecars=index_sidecars(vs))
+
+    monkeypatch.setattr(rag_pipeline, "embeddings", FakeEmbeddings())
+    manager = IndexManager(tmp_path, rag_pipeline._load_shared_vectorstore_from)
+    monkeypatch.setattr(rag_pipeline, "index_manager", manager)
+
+    publish("v1.pdf")
+    old = rag_pipeline.get_vectorstore()
+    publish("v2.pdf")
+    new = manager.reload()
+
+    for vectorstore, file_name in [(old, "v1.pdf"), (new, "v2.pdf")]:
+        assert rag_pipeline.get_metadata_index(vectorstore).values("file_name") == [file_name]
+        # BM25 chargé après la publication suivante : toujours celui du build du vectorstore
+        sparse_index = rag_pipeline.get_sparse_index(vectorstore)
+        assert list(sparse_index.chunk_ids) == list(vectorstore.index_to_docstore_id.values())
@@ -11,13 +11,15 @@ load_dotenv(BASE_DIR / ".env")
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
 
+from index_manager import resolve_index_dir
+
 INDEX_DIR = "data/processed/index"
 
 
 def test_query(query: str):
     embeddings = OpenAIEmbeddings()
     vectorstore = FAISS.load_local(
-        INDEX_DIR,
+        str(resolve_index_dir(INDEX_DIR)),
         embeddings,
         allow_dangerous_deserialization=True
     )
@@ -0,0 +1,118 @@
+# test/test_server.py
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest
+from starlette.testclient import TestClient
+
+import rag_pipeline
+import server
+from answer_cache import AnswerCache
+from index_manager import IndexManager, publish_index
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return [1.0, float(len(text))]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(t) for t in texts]
+
+
+class FakeAsyncCompletions:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.calls = 0
+
+    async def create(self, messages, stream=False, **kwargs):
+        self.calls += 1
+
+        async def chunks():
+            for piece in self.pieces:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+        return chunks()
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    from langchain_community.vectorstores import FAISS
+
+    embeddings = FakeEmbeddings()
+    texts = [(f"passage {i}", [1.0, float(i)]) for i in range(20)]
+    metadatas = [{"file_name": f"doc{i % 2}.pdf", "page": i, "author": "Boris Otto" if i % 2 else "Kristin Weber"}
+                 for i in range(20)]
+    publish_index(FAISS.from_embeddings(texts, embeddings, metadatas=metadatas), tmp_path / "index")
+
+    completions = FakeAsyncCompletions(["La ", "réponse."])
+    monkeypatch.setattr(rag_pipeline, "embeddings", embeddings)
+    monkeypatch.setattr(rag_pipeline, "answer_cache", AnswerCache(cache_path=tmp_path / "answers.sqlite"))
+    monkeypatch.setattr(rag_pipeline, "async_client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(
+        rag_pipeline, "index_manager", IndexManager(tmp_path / "index", rag_pipeline._load_shared_vectorstore_from)
+    )
+
+    with TestClient(server.create_app(llm_concurrency=2)) as test_client:
+        test_client.completions = completions
+        yield test_client
+
+
+def test_health_reports_warm_index(client):
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["chunks"] == 20
+    assert response.json()["llm_limit"] == 2
+
+
+def test_search_returns_sources_and_applies_filters(client):
+    response = client.post("/search", json={"question": "xxxx", "k": 3, "mode": "dense"})
+    assert response.status_code == 200
+    assert [s["page"] for s in response.json()["sources"]] == [4, 3, 5]
+
+    response = client.post("/search", json={"question": "xxxx", "k": 3, "mode": "dense",
+                                            "filters": {"author": "otto", "page": {"min": 10, "max": None}}})
+    assert [s["page"] for s in response.json()["sources"]] == [11, 13, 15]
+
+
+def test_search_rejects_bad_requests(client):
+    assert client.post("/search", json={"k": 3}).status_code == 400
+    assert client.post("/search", json={"question": "q", "k": 0}).status_code == 400
+    response = client.post("/search", json={"question": "q", "filters": {"couleur": "bleu"}})
+    assert response.status_code == 400
+    assert "couleur" in response.json()["error"]
+
+
+def test_answer_streams_ndjson_then_serves_from_cache(client):
+    with client.stream("POST", "/answer", json={"question": "xxxx", "k": 2, "stream": True}) as response:
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        messages = [json.loads(line) for line in response.iter_lines() if line]
+
+    assert len(messages[0]["sources"]) == 2
+    assert [m["delta"] for m in messages[1:-1]] == ["La ", "réponse."]
+    assert messages[-1] == {"done": True}
+
+    response = client.post("/answer", json={"question": "xxxx", "k": 2})
+    assert response.json()["answer"] == "La réponse."
+    assert client.completions.calls == 1
+
+
+def test_llm_slots_bound_concurrent_calls():
+    async def scenario():
+        slots = server.LlmSlots(2)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with slots:
+                peak = max(peak, slots.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        return peak, slots.in_flight, slots.waiting
+
+    assert asyncio.run(scenario()) == (2, 0, 0)
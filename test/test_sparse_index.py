@@ -0,0 +1,32 @@
+from sparse_index import BM25Index, linear_fusion, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "Otto et Khatri proposent un cadre de data governance.",
+    "La gouvernance des données dans les entreprises.",
+    "Retrieval-Augmented Generation combine recherche et génération.",
+    "Les modèles de langage hallucinent sans sources.",
+]
+IDS = ["a-0", "a-1", "b-0", "b-1"]
+
+
+def test_tokenize_strips_accents_and_stopwords():
+    assert tokenize("La Génération des Données") == ["generation", "donnees"]
+
+
+def test_exact_terms_rank_first_and_roundtrip(tmp_path):
+    index = BM25Index.build(TEXTS, IDS)
+    assert index.search("Khatri", k=3)[0][0] == "a-0"
+    assert index.search("génération", k=3)[0][0] == "b-0"
+    assert index.search("inconnu", k=3) == []
+
+    index.save(tmp_path / "bm25.npz")
+    loaded = BM25Index.load(tmp_path / "bm25.npz")
+    assert loaded.search("gouvernance données", k=2) == index.search("gouvernance données", k=2)
+    assert loaded.chunk_ids == IDS
+
+
+def test_fusion():
+    dense = ["x", "y", "z"]
+    lexical = ["z", "w"]
+    assert reciprocal_rank_fusion([dense, lexical])[0] == "z"
+    assert linear_fusion([[("x", 1.0), ("y", 0.0)], [("y", 5.0), ("w", 1.0)]], [1.0, 2.0])[0] == "y"
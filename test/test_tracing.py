@@ -0,0 +1,97 @@
+# test/test_tracing.py
+import json
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def trace_log(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracing.reset_metrics()
+    tracing.enable(path)
+    yield path
+    tracing.disable()
+    tracing.reset_metrics()
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_disabled_span_is_shared_noop():
+    assert not tracing.is_enabled()
+    s = tracing.span("rag.search", k=4)
+    assert s is tracing.span("rag.llm")
+    with s as active:
+        active.set(docs=3)
+        active.add("tokens", 10)
+    assert not active.recording
+    assert "rag_search" not in tracing.metrics_text()
+
+
+def test_nested_spans_share_trace_and_export_json(trace_log):
+    with tracing.span("rag.answer", docs=2):
+        with tracing.span("rag.llm") as llm:
+            llm.set(completion_tokens=12)
+            llm.add("bytes", 40)
+            llm.add("bytes", 2)
+
+    llm_record, answer_record = read_spans(trace_log)  # un span est écrit à sa fin
+    assert answer_record["span"] == "rag.answer" and answer_record["docs"] == 2
+    assert answer_record["parent_id"] is None
+    assert llm_record["parent_id"] == answer_record["span_id"]
+    assert llm_record["trace_id"] == answer_record["trace_id"]
+    assert llm_record["completion_tokens"] == 12 and llm_record["bytes"] == 42
+    assert llm_record["status"] == "ok" and llm_record["seconds"] >= 0
+
+
+def test_metrics_text_has_histograms_counters_and_errors(trace_log):
+    for hit in (True, False, True):
+        with tracing.span("rag.answer_cache") as s:
+            s.set(cache_hits=int(hit))
+    with pytest.raises(RuntimeError):
+        with tracing.span("rag.llm"):
+            raise RuntimeError("timeout")
+
+    text = tracing.metrics_text()
+    assert 'littera_span_seconds_count{span="rag.answer_cache"} 3' in text
+    assert 'littera_span_seconds_bucket{span="rag.answer_cache",le="+Inf"} 3' in text
+    assert 'littera_cache_hits_total{span="rag.answer_cache"} 2' in text
+    assert 'littera_span_errors_total{span="rag.llm"} 1' in text
+    assert read_spans(trace_log)[-1]["error"] == "RuntimeError: timeout"
+
+    out = trace_log.parent / "metrics.prom"
+    tracing.write_metrics(out)
+    assert out.read_text(encoding="utf-8") == text
+
+
+def test_only_measurements_become_counters(trace_log):
+    with tracing.span("rag.context", docs=3, token_budget=3000, stream=True) as s:
+        s.set(context_tokens=1200, mmr_lambda=0.5)
+
+    text = tracing.metrics_text()
+    assert 'littera_docs_total{span="rag.context"} 3' in text
+    assert 'littera_context_tokens_total{span="rag.context"} 1200' in text
+    for setting in ("token_budget", "stream", "mmr_lambda"):
+        assert f"littera_{setting}_total" not in text
+    # Les réglages restent dans la trace JSON
+    assert read_spans(trace_log)[-1]["token_budget"] == 3000
+
+
+def test_abandoned_stream_closes_its_span(trace_log):
+    def stream():
+        with tracing.span("rag.answer", stream=True):
+            yield "a"
+            yield "b"
+
+    gen = stream()
+    next(gen)
+    gen.close()
+
+    with tracing.span("app.search"):
+        pass
+    closed, search = read_spans(trace_log)
+    assert closed["status"] == "closed"
+    assert search["parent_id"] is None  # le span du stream n'est plus le parent courant
@@ -0,0 +1,92 @@
+# test/test_upload_jobs.py
+import threading
+
+import upload_jobs
+from test_ingest import FakeEmbeddings, make_pdf
+from upload_jobs import UploadJobQueue, merge_into
+
+
+def pdf_bytes(tmp_path, name, pages):
+    path = tmp_path / f"src-{name}"
+    make_pdf(path, pages)
+    return path.read_bytes()
+
+
+def test_files_are_indexed_in_background(tmp_path):
+    files = [
+        ("a.pdf", pdf_bytes(tmp_path, "a.pdf", ["Gouvernance des données", "Qualité"])),
+        ("b.pdf", pdf_bytes(tmp_path, "b.pdf", ["Data mesh"])),
+        ("bad.pdf", b"pas un pdf"),
+    ]
+    queue = UploadJobQueue(workers=2)
+    job = queue.submit(files, FakeEmbeddings(), tmp_path / "uploads")
+
+    assert job.wait(timeout=30)
+    assert queue.get(job.id) is job
+    assert job.progress() == 1.0
+    assert {name: f.state for name, f in job.files.items()} == {"a.pdf": "done", "b.pdf": "done", "bad.pdf": "failed"}
+    assert job.files["a.pdf"].chunks_done == 2
+    docs = job.vectorstore.similarity_search("Data mesh", k=3)
+    assert {d.metadata["file_name"] for d in docs} == {"a.pdf", "b.pdf"}
+    assert all(d.metadata["chunk_id"] == d.id for d in docs)
+    queue.shutdown()
+
+
+def test_cancel_stops_running_and_queued_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_jobs, "EMBED_BATCH_SIZE", 1)
+    started, release = threading.Event(), threading.Event()
+
+    class SlowEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            started.set()
+            release.wait(timeout=10)
+            return super().embed_documents(texts)
+
+    files = [(f"{i}.pdf", pdf_bytes(tmp_path, f"{i}.pdf", ["page 1", "page 2"])) for i in range(3)]
+    queue = UploadJobQueue(workers=1)
+    job = queue.submit(files, SlowEmbeddings(), tmp_path / "uploads")
+
+    assert started.wait(timeout=10)
+    job.cancel()
+    release.set()
+
+    assert job.wait(timeout=30)
+    assert job.vectorstore is None
+    assert {f.state for f in job.files.values()} == {"cancelled"}
+    queue.shutdown()
+
+
+def test_identical_files_are_indexed_once(tmp_path):
+    data = pdf_bytes(tmp_path, "a.pdf", ["Gouvernance des données", "Qualité"])
+    queue = UploadJobQueue(workers=2)
+    job = queue.submit([("a.pdf", data), ("a (copie).pdf", data)], FakeEmbeddings(), tmp_path / "uploads")
+
+    assert job.wait(timeout=30)
+    assert job.error is None
+    overlay = job.vectorstore
+    assert len(overlay.index_to_docstore_id) == 2
+    doc = overlay.similarity_search("Qualité", k=1)[0]
+    assert doc.metadata["duplicates"][0]["file_name"] == "a (copie).pdf"
+
+    # Même contenu dans un job suivant : rien à ajouter, pas d'erreur d'ids en double
+    again = queue.submit([("b.pdf", data), ("c.pdf", pdf_bytes(tmp_path, "c.pdf", ["Data mesh"]))],
+                         FakeEmbeddings(), tmp_path / "uploads")
+    assert again.wait(timeout=30)
+    overlay = merge_into(overlay, again.vectorstore)
+    assert len(overlay.index_to_docstore_id) == 3
+    queue.shutdown()
+
+
+def test_same_file_name_in_two_jobs_keeps_each_content(tmp_path):
+    queue = UploadJobQueue(workers=2)
+    first = queue.submit([("cours.pdf", pdf_bytes(tmp_path, "1.pdf", ["Gouvernance des données"]))],
+                         FakeEmbeddings(), tmp_path / "uploads")
+    second = queue.submit([("cours.pdf", pdf_bytes(tmp_path, "2.pdf", ["Data mesh"]))],
+                          FakeEmbeddings(), tmp_path / "uploads")
+
+    assert first.wait(timeout=30) and second.wait(timeout=30)
+    texts = [[d.page_content for d in job.vectorstore.docstore._dict.values()] for job in (first, second)]
+    assert texts == [["Gouvernance des données"], ["Data mesh"]]
+    # Fichiers temporaires supprimés une fois le job terminé
+    assert list((tmp_path / "uploads").iterdir()) == []
+    queue.shutdown()